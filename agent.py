@@ -3,19 +3,72 @@ Agente OpenAI para generación de contratos legales mexicanos.
 Toma la plantilla base + datos del usuario y genera el contrato personalizado.
 """
 
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
 import os
-from openai import OpenAI
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
+import clause_cache
+import generation_cache
+from clients import get_async_client, get_client
+from clause_index import ClauseIndex
+from clauses import (
+    EditError,
+    apply_edits,
+    expand_clause_refs,
+    expand_clause_refs_stream,
+    join_clauses,
+    label_segments,
+    needs_model,
+    split_clauses,
+)
+from contract_fields import changed_fields
+from template_binding import MISSING_VALUE, fill_markers, fill_markers_stream
+from routing import GENERATION_ROUTES, classify_chat, route
+from scheduler import BACKGROUND, SCHEDULER, priority
+from telemetry import RECENT, span
+from template_registry import TEMPLATES, estimate_tokens
+from validation import MODEL_REPAIRS, fix_numbering, validate_contract
 
 load_dotenv()
 
+# Modos de generación:
+# - "clauses": solo las cláusulas adaptables pasan por el modelo, en paralelo
+# - "passthrough": una sola petición; las cláusulas genéricas viajan como
+#   marcadores [[CLÁUSULA id]] y se reconstruyen localmente
+# - "full": una sola petición con el contrato completo
+GENERATION_MODES = ("clauses", "passthrough", "full")
+
+# Peticiones simultáneas al adaptar cláusulas en modo "clauses"
+CLAUSE_WORKERS = int(os.getenv("CLAUSE_WORKERS", "6"))
+
+# Peticiones simultáneas de la pre-generación especulativa, compartidas por todas las sesiones
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", "4"))
+_speculation_pool = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="speculation")
+# Señal de cancelación de las peticiones síncronas lanzadas en el contexto (ver ClauseSpeculation.cancel)
+_cancelled: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar("agent_cancelled", default=None)
+
+# Plazo por defecto (segundos) de agenerate_contract / areview_contract; 0 = sin plazo
+AGENT_DEADLINE = float(os.getenv("AGENT_DEADLINE", "0")) or None
+
+MARKERS_NOTE = """NOTA: Los marcadores con la forma {{clave}} se rellenan automáticamente con los datos del usuario.
+Cópialos exactamente como aparecen, sin sustituirlos ni modificarlos."""
+
+REFS_NOTE = """NOTA: Las líneas con la forma [[CLÁUSULA id]] representan cláusulas genéricas que se conservan sin cambios.
+En tu respuesta escribe cada una exactamente igual, sola en su propia línea y en la misma posición;
+no escribas su contenido."""
+
 
 def _get_client(api_key: str | None = None) -> OpenAI:
-    """Crea un cliente OpenAI con la key proporcionada o la del entorno."""
-    key = api_key or os.getenv("OPENAI_API_KEY")
-    if not key:
-        raise ValueError("No se proporcionó una API key de OpenAI.")
-    return OpenAI(api_key=key)
+    """Cliente OpenAI compartido para la key proporcionada o la del entorno."""
+    return get_client(api_key)
 
 SYSTEM_PROMPT = """Eres un asistente legal especializado en derecho mexicano para PyMEs.
 Tu trabajo es tomar una PLANTILLA BASE de contrato y los datos proporcionados por el usuario
@@ -55,19 +108,48 @@ FORMATO DE SALIDA:
 - Numeración y formato consistente con el estilo del original.
 """
 
+# Cláusulas que se envían al modelo para responder una pregunta (además del encabezado)
+QA_TOP_K = 4
+QA_CONTEXT_CHARS = 12000
 
-def load_template(contract_type: str) -> str:
-    """Carga la plantilla de contrato desde archivo."""
-    templates_dir = os.path.join(os.path.dirname(__file__), "templates")
-    if contract_type == "servicios":
-        path = os.path.join(templates_dir, "servicios_raw.txt")
-    elif contract_type == "arrendamiento":
-        path = os.path.join(templates_dir, "arrendamiento_raw.txt")
-    else:
-        raise ValueError(f"Tipo de contrato no soportado: {contract_type}")
+# Separa la respuesta para el usuario de las operaciones de edición en el modo "edits"
+EDITS_SEPARATOR = "===CAMBIOS==="
+
+EDITS_INSTRUCTIONS = f"""Responde en dos partes:
+1. Primero, tu respuesta para el usuario en texto: la respuesta a su pregunta o una
+   descripción breve de los cambios que realizaste.
+2. Solo si la solicitud requiere modificar el contrato, agrega al final una línea con
+   {EDITS_SEPARATOR} seguida de una lista JSON de operaciones, usando los ids de los marcadores [[CLÁUSULA id]]:
+   {{"op": "replace", "clause": "<id>", "find": "<texto exacto a reemplazar>", "text": "<texto nuevo>"}}
+   {{"op": "replace", "clause": "<id>", "text": "<cláusula completa reescrita>"}}
+   {{"op": "insert", "after": "<id>", "text": "<texto completo de la cláusula nueva>"}}
+   {{"op": "delete", "clause": "<id>"}}
+   "find" debe copiarse literalmente del contrato y ser lo más corto posible sin dejar de ser único.
+   NO devuelvas el contrato completo ni repitas texto que no cambia."""
+
+# Petición que sigue a una respuesta cortada por el límite de tokens (finish_reason "length")
+CONTINUE_PROMPT = """Tu respuesta anterior se cortó por el límite de longitud.
+Continúa exactamente donde termina, sin repetir nada de lo ya escrito y sin comentarios,
+con el mismo formato."""
+
+# Continuaciones por respuesta; si aun así queda truncada se lanza un error en vez
+# de entregar un contrato incompleto
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", "3"))
 
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+# Caracteres del inicio de una continuación que se retienen para descartar lo que
+# repita del final de la respuesta anterior, y traslape mínimo que se considera repetición
+OVERLAP_WINDOW = 4000
+MIN_OVERLAP = 12
+
+# Cambia automáticamente al editar cualquiera de los prompts; invalida el caché de generación
+PROMPT_VERSION = hashlib.sha256(
+    "\n".join([SYSTEM_PROMPT, MARKERS_NOTE, REFS_NOTE, EDITS_INSTRUCTIONS, CONTINUE_PROMPT]).encode("utf-8")
+).hexdigest()[:12]
+
+
+def load_template(contract_type: str) -> str:
+    """Texto normalizado de la plantilla de contrato (ver template_registry)."""
+    return TEMPLATES.get(contract_type).text
 
 
 def format_user_data(data: dict) -> str:
@@ -80,7 +162,635 @@ def format_user_data(data: dict) -> str:
     return "\n".join(lines)
 
 
-def generate_contract(contract_type: str, user_data: dict, special_instructions: str = "", api_key: str | None = None) -> str:
+def _build_generation_messages(contract_type: str, user_data: dict, special_instructions: str = "", passthrough: bool = False) -> list[dict]:
+    """
+    Arma los mensajes del chat para generar un contrato.
+
+    El orden importa para el caché de prefijos del proveedor: SYSTEM_PROMPT y la
+    plantilla son idénticos para todos los contratos del mismo tipo, así que van
+    primero; los datos del usuario y las instrucciones van al final. Los huecos
+    vinculados a campos del formulario se envían como marcadores {{clave}} y se
+    rellenan localmente al recibir la respuesta.
+
+    Con passthrough=True, los fragmentos que no requieren adaptación se
+    sustituyen por marcadores [[CLÁUSULA id]] que el modelo solo repite.
+    """
+    template = TEMPLATES.get(contract_type)
+    text = template.keyed
+    notes = MARKERS_NOTE
+    if passthrough:
+        text = template.collapsed
+        notes = f"{MARKERS_NOTE}\n\n{REFS_NOTE}"
+    formatted_data = format_user_data(user_data)
+
+    template_message = f"""PLANTILLA BASE DEL CONTRATO DE {template.name.upper()}:
+{text}
+
+{notes}"""
+
+    user_message = f"""Genera el contrato de {template.name} a partir de la plantilla base anterior, usando la siguiente información:
+
+DATOS DEL USUARIO:
+{formatted_data}
+
+{f"INSTRUCCIONES ADICIONALES: {special_instructions}" if special_instructions else ""}
+
+Por favor genera el contrato completo con todos los datos reemplazados correctamente."""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": template_message},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def adaptive_data(contract_type: str, user_data: dict) -> dict:
+    """Subconjunto de los datos con los campos que describen el negocio (marcados "adaptive")."""
+    return {key: user_data[key] for key in TEMPLATES.get(contract_type).adaptive_keys if user_data.get(key)}
+
+
+def clause_data(contract_type: str, segment_id: str, user_data: dict) -> dict:
+    """Datos que el modelo necesita para adaptar un fragmento, según el "clauses" de cada campo."""
+    keys = TEMPLATES.get(contract_type).clause_fields.get(segment_id, [])
+    return {key: user_data[key] for key in keys if user_data.get(key)}
+
+
+def _build_clause_messages(contract_type: str, segment: dict, user_data: dict) -> list[dict]:
+    """
+    Arma los mensajes para adaptar un solo fragmento (cláusula o declaración).
+
+    El fragmento va antes que los datos del usuario para que el prefijo sea el
+    mismo para todos los clientes. Cada fragmento recibe solo los campos que lo
+    afectan, así el prompt (y su resultado) no cambia cuando se corrige un dato
+    ajeno al fragmento.
+    """
+    user_data = clause_data(contract_type, segment["id"], user_data)
+    user_message = f"""Estás adaptando UN FRAGMENTO del contrato de {TEMPLATES.get(contract_type).name}, no el contrato completo.
+
+FRAGMENTO ({segment["title"]}):
+{segment["text"].strip()}
+
+{MARKERS_NOTE}
+
+DATOS DEL USUARIO:
+{format_user_data(user_data)}
+
+Devuelve únicamente el texto del fragmento adaptado, conservando su encabezado y numeración.
+No agregues comentarios, explicaciones ni otras cláusulas."""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def _build_repair_messages(contract_type: str, segment: dict, issues: list[dict], user_data: dict) -> list[dict]:
+    """
+    Arma los mensajes para corregir un fragmento que no pasó la validación local.
+
+    El fragmento recibe los datos que lo afectan (los que adapta el modelo, los
+    de sus marcadores y los que faltan) y la lista de problemas; se pide no
+    tocar nada más.
+    """
+    template = TEMPLATES.get(contract_type)
+    keys = set(template.clause_fields.get(segment["id"], [])) | template.markers.get(segment["id"], set())
+    keys |= {issue["field"] for issue in issues if "field" in issue}
+    data = {key: user_data[key] for key in sorted(keys) if user_data.get(key)}
+    problems = "\n".join(f"- {issue['detail']}" for issue in issues)
+    user_message = f"""Estás corrigiendo UN FRAGMENTO del contrato de {template.name}, no el contrato completo.
+
+FRAGMENTO ({segment["title"]}):
+{segment["text"].strip()}
+
+PROBLEMAS DETECTADOS:
+{problems}
+
+DATOS DEL USUARIO:
+{format_user_data(data)}
+
+Corrige solo los problemas señalados: escribe los datos exactamente como aparecen arriba y rellena
+los huecos con los datos del usuario, o con {MISSING_VALUE} si el dato no está. No cambies nada más.
+Devuelve únicamente el texto del fragmento corregido, conservando su encabezado y numeración."""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def _build_edits_messages(contract_text: str, question: str, segments: list[dict] | None = None) -> list[dict]:
+    """
+    Arma los mensajes para el modo "edits": respuesta en texto más operaciones de edición.
+
+    Si se pasan `segments`, solo esos fragmentos se envían como contexto.
+    """
+    if segments is None:
+        intro = "Aquí está el contrato generado, dividido en fragmentos con su marcador [[CLÁUSULA id]]:"
+        segments = split_clauses(contract_text)
+    else:
+        intro = ("Aquí están los fragmentos del contrato más relevantes para la consulta, con su "
+                 "marcador [[CLÁUSULA id]] (el resto del contrato se omite):")
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"""{intro}
+
+{label_segments(segments)}
+
+El usuario tiene la siguiente pregunta o solicitud de modificación:
+{question}
+
+{EDITS_INSTRUCTIONS}""",
+        },
+    ]
+
+
+def _build_review_messages(contract_text: str, question: str, passthrough: bool = False) -> list[dict]:
+    """
+    Arma los mensajes del chat para revisar o modificar un contrato.
+
+    Con passthrough=True el contrato se envía dividido en fragmentos con su
+    marcador [[CLÁUSULA id]], y se pide al modelo que en una modificación solo
+    reescriba los fragmentos que cambian.
+    """
+    if passthrough:
+        contract_text = label_segments(split_clauses(contract_text))
+        edit_instructions = """Si es una solicitud de modificación, devuelve el contrato completo con los cambios aplicados,
+pero en lugar de cada fragmento que NO cambia escribe solo su marcador [[CLÁUSULA id]], solo en su propia línea.
+Los fragmentos que sí cambian escríbelos completos, sin marcador.
+Indica claramente qué cambios realizaste."""
+    else:
+        edit_instructions = """Si es una solicitud de modificación, devuelve el contrato completo con los cambios aplicados.
+Indica claramente qué cambios realizaste."""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": f"""Aquí está el contrato generado:
+
+{contract_text}
+
+El usuario tiene la siguiente pregunta o solicitud de modificación:
+{question}
+
+Si es una pregunta, responde de forma clara y concisa.
+{edit_instructions}""",
+        },
+    ]
+
+
+def _record_usage(record: dict, usage) -> None:
+    """Agrega al tramo los tokens reportados por la API, incluyendo los servidos desde caché."""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    record["prompt_tokens"] = usage.prompt_tokens
+    record["cached_tokens"] = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    record["completion_tokens"] = usage.completion_tokens
+
+
+def usage_summary() -> dict:
+    """Totales de tokens de las últimas llamadas y proporción servida desde caché."""
+    records = [r for r in list(RECENT) if r["span"] == "llm_call" and "prompt_tokens" in r]
+    prompt = sum(r["prompt_tokens"] for r in records)
+    cached = sum(r["cached_tokens"] for r in records)
+    return {
+        "calls": len(records),
+        "prompt_tokens": prompt,
+        "cached_tokens": cached,
+        "completion_tokens": sum(r["completion_tokens"] for r in records),
+        "cache_hit_ratio": cached / prompt if prompt else 0.0,
+    }
+
+
+def _request_cost(messages: list[dict], config: dict) -> int:
+    """Tokens que la petición consume de la cuota: prompt estimado + max_tokens."""
+    return estimate_tokens("".join(m["content"] for m in messages)) + config["max_tokens"]
+
+
+def _resume_point(text: str) -> int:
+    """
+    Hasta dónde conservar una respuesta truncada: el final de la última cláusula
+    completa (la última quedó a medias). Si el texto es una sola cláusula, el
+    final de su última línea completa.
+    """
+    segments = split_clauses(text)
+    if len(segments) > 1:
+        return len(text) - len(segments[-1]["text"])
+    return text.rfind("\n") + 1 or len(text)
+
+
+def _strip_overlap(text: str, continuation: str) -> str:
+    """Quita del inicio de `continuation` lo que repite el final de `text` (si el modelo retoma desde antes)."""
+    # Línea que quedó a medias (o su sangría): si el modelo la vuelve a empezar, se descarta aunque sea corta
+    partial = text[text.rfind("\n") + 1:]
+    for candidate in (continuation, continuation.lstrip()):
+        for size in range(min(len(text), len(candidate), OVERLAP_WINDOW), MIN_OVERLAP - 1, -1):
+            if text.endswith(candidate[:size]):
+                return candidate[size:]
+        if partial and candidate.startswith(partial):
+            return candidate[len(partial):]
+    return continuation
+
+
+class _Continuation:
+    """
+    Une una respuesta y sus continuaciones cuando se corta por el límite de tokens.
+
+    Con rewind=True (respuestas completas) la respuesta truncada se recorta a su
+    última cláusula completa y el modelo la retoma desde ahí; si esa cláusula
+    no cabe en una sola respuesta, se recorta a la última línea completa (o no
+    se recorta) para que cada continuación avance. En streaming lo
+    entregado no puede retirarse, así que se retoma desde el último carácter.
+    El inicio de cada continuación se retiene hasta OVERLAP_WINDOW caracteres
+    para descartar lo que repita.
+    """
+
+    def __init__(self, messages: list[dict], rewind: bool):
+        self.messages = messages
+        self.rewind = rewind
+        self.text = ""
+        self.count = 0
+        self.done = False
+        self._held: str | None = None
+        # Largo del texto conservado al retomar la última vez
+        self._resumed = 0
+
+    def request(self) -> list[dict]:
+        """Mensajes de la siguiente petición: los originales o los de la continuación."""
+        if not self.count:
+            return self.messages
+        return [
+            *self.messages,
+            {"role": "assistant", "content": self.text},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+
+    def feed(self, delta: str) -> str:
+        """Agrega un fragmento de la respuesta en curso; devuelve el texto listo para entregar."""
+        if self._held is None:
+            self.text += delta
+            return delta
+        self._held += delta
+        return self._release() if len(self._held) >= OVERLAP_WINDOW else ""
+
+    def finish(self, finish_reason: str | None) -> str:
+        """
+        Cierra la respuesta en curso y devuelve el texto retenido que falta entregar.
+        Si se cortó por longitud, prepara la continuación (`done` sigue en False).
+
+        Raises:
+            ValueError: si sigue truncada después de MAX_CONTINUATIONS continuaciones
+        """
+        tail = self._release() if self._held is not None else ""
+        if finish_reason != "length":
+            self.done = True
+            return tail
+        if self.count >= MAX_CONTINUATIONS:
+            raise ValueError(
+                f"La respuesta del modelo sigue truncada después de {self.count} continuaciones; "
+                "el texto estaría incompleto."
+            )
+        if self.rewind:
+            point = _resume_point(self.text)
+            if point <= self._resumed:
+                # Volver al inicio de la cláusula no avanzaría
+                point = self.text.rfind("\n") + 1
+            if point > self._resumed:
+                self.text = self.text[:point]
+            self._resumed = len(self.text)
+        self.count += 1
+        self._held = ""
+        return tail
+
+    def _release(self) -> str:
+        text = _strip_overlap(self.text, self._held)
+        self._held = None
+        self.text += text
+        return text
+
+
+def _check_cancelled() -> None:
+    """Lanza CancelledError si quien lanzó la petición ya la descartó."""
+    event = _cancelled.get()
+    if event is not None and event.is_set():
+        raise CancelledError
+
+
+def _complete_request(client: OpenAI, messages: list[dict], config: dict, contract_type: str | None, continuation: int) -> tuple[str, str | None]:
+    """Una petición sin streaming; devuelve el texto y el finish_reason."""
+    attrs = {"continuation": continuation} if continuation else {}
+    with span("llm_call", contract_type=contract_type, **config, **attrs) as record:
+        response = SCHEDULER.call(
+            lambda: client.chat.completions.create(
+                model=config["model"],
+                messages=messages,
+                temperature=0.1,
+                max_tokens=config["max_tokens"],
+            ),
+            _request_cost(messages, config), config["priority"], record,
+        )
+        _record_usage(record, response.usage)
+        record["finish_reason"] = response.choices[0].finish_reason
+        return response.choices[0].message.content or "", record["finish_reason"]
+
+
+def _complete(client: OpenAI, messages: list[dict], route_name: str, contract_type: str | None = None, expected_tokens: int | None = None) -> str:
+    """
+    Hace la petición con el modelo de la ruta y registra latencia, tokens y finish_reason.
+
+    La petición pasa por el planificador de cuota (espera turno y reintenta los 429).
+    `expected_tokens` (largo estimado de la respuesta) amplía el límite de salida
+    si hace falta; si la respuesta se corta de todos modos, se continúa desde su
+    última cláusula completa. Dentro de una tarea cancelable (ver
+    ClauseSpeculation) la petición se hace en streaming para poder cortarla.
+    """
+    if _cancelled.get() is not None:
+        # Cancelable: en streaming se puede cortar la respuesta a medio camino
+        with contextlib.closing(_stream_completion(client, messages, route_name, contract_type, expected_tokens)) as deltas:
+            return "".join(deltas)
+    config = route(route_name, expected_tokens)
+    stitched = _Continuation(messages, rewind=True)
+    while not stitched.done:
+        reply, finish_reason = _complete_request(client, stitched.request(), config, contract_type, stitched.count)
+        stitched.feed(reply)
+        stitched.finish(finish_reason)
+    return stitched.text
+
+
+def _stream_request(client: OpenAI, messages: list[dict], config: dict, contract_type: str | None, continuation: int, outcome: dict) -> Iterator[str]:
+    """Una petición en streaming; al terminar deja el finish_reason en `outcome`."""
+    attrs = {"continuation": continuation} if continuation else {}
+    with span("llm_call", contract_type=contract_type, stream=True, **config, **attrs) as record:
+        started = time.perf_counter()
+        _check_cancelled()
+        stream = SCHEDULER.call(
+            lambda: client.chat.completions.create(
+                model=config["model"],
+                messages=messages,
+                temperature=0.1,
+                max_tokens=config["max_tokens"],
+                stream=True,
+                stream_options={"include_usage": True},
+            ),
+            _request_cost(messages, config), config["priority"], record,
+        )
+        try:
+            for chunk in stream:
+                # Cerrar la conexión (en finally) detiene la generación descartada
+                _check_cancelled()
+                # El último chunk no trae choices, solo el uso de tokens
+                if chunk.usage is not None:
+                    _record_usage(record, chunk.usage)
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason:
+                    record["finish_reason"] = chunk.choices[0].finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    record.setdefault("ttft_ms", round((time.perf_counter() - started) * 1000, 2))
+                    yield delta
+        finally:
+            # Si el consumidor abandona, cerrar la conexión detiene la generación
+            stream.close()
+        outcome["finish_reason"] = record.get("finish_reason")
+
+
+def _stream_completion(client: OpenAI, messages: list[dict], route_name: str, contract_type: str | None = None, expected_tokens: int | None = None) -> Iterator[str]:
+    """
+    Hace la petición en modo streaming y va entregando los fragmentos de texto.
+
+    Si la respuesta se corta por el límite de tokens, pide continuaciones y las
+    entrega a continuación, sin el texto que repitan.
+    """
+    config = route(route_name, expected_tokens)
+    stitched = _Continuation(messages, rewind=False)
+    while not stitched.done:
+        outcome = {}
+        with contextlib.closing(_stream_request(client, stitched.request(), config, contract_type, stitched.count, outcome)) as deltas:
+            for delta in deltas:
+                text = stitched.feed(delta)
+                if text:
+                    yield text
+        text = stitched.finish(outcome.get("finish_reason"))
+        if text:
+            yield text
+
+
+def _shared_clause(contract_type: str, segment: dict, user_data: dict, reuse: bool = True) -> tuple[str | None, str | None]:
+    """
+    Busca el fragmento en el caché compartido entre clientes (clause_cache).
+
+    Solo aplica a los fragmentos que dependen únicamente del negocio; los demás
+    reciben datos personales y no se comparten. Con reuse=False no se busca
+    (el resultado nuevo sí se guarda después).
+
+    Returns:
+        (ámbito en el caché o None si el fragmento no se comparte, texto guardado o None)
+    """
+    if not _depends_on_business_only(contract_type, segment):
+        return None, None
+    scope = clause_cache.make_scope(contract_type, segment["id"], segment["text"], route("adapt_clause")["model"], PROMPT_VERSION)
+    if not reuse:
+        return scope, None
+    with span("clause_cache", contract_type=contract_type, clause=segment["id"]) as record:
+        text = clause_cache.lookup(scope, clause_data(contract_type, segment["id"], user_data))
+        record["hit"] = text is not None
+    return scope, text
+
+
+def _adapt_clause(client: OpenAI, contract_type: str, segment: dict, user_data: dict, reuse: bool = True) -> str:
+    """
+    Adapta un fragmento con el modelo y le devuelve el espaciado final original.
+
+    Si el fragmento solo depende del negocio y otro cliente con el mismo perfil
+    ya lo adaptó, se reutiliza sin llamar al modelo (salvo con reuse=False).
+    """
+    scope, shared = _shared_clause(contract_type, segment, user_data, reuse)
+    if shared is not None:
+        return shared
+    with span("prompt_build", contract_type=contract_type, clause=segment["id"]):
+        messages = _build_clause_messages(contract_type, segment, user_data)
+    reply = _complete(client, messages, "adapt_clause", contract_type, TEMPLATES.get(contract_type).clause_tokens[segment["id"]])
+
+    text = segment["text"]
+    trailing = text[len(text.rstrip()):]
+    adapted = reply.strip() + trailing
+    if scope is not None:
+        clause_cache.store(scope, clause_data(contract_type, segment["id"], user_data), adapted)
+    return adapted
+
+
+def warm_clause_cache(contract_type: str, profiles: list[dict], api_key: str | None = None) -> dict:
+    """
+    Precalienta el caché compartido con perfiles de negocio comunes (giro, actividades...).
+
+    Cada perfil adapta los fragmentos que solo dependen del negocio; los que ya
+    están guardados para un perfil igual o parecido no se vuelven a pedir. Corre
+    con la prioridad de fondo ante la cuota.
+
+    Returns:
+        Fragmentos adaptados y cuántos ya estaban en el caché
+    """
+    client = _get_client(api_key)
+    segments = [s for s in TEMPLATES.get(contract_type).segments if _depends_on_business_only(contract_type, s)]
+    pending = {}
+    cached = 0
+    for data in profiles:
+        for segment in segments:
+            if _shared_clause(contract_type, segment, data)[1] is not None:
+                cached += 1
+                continue
+            # Dos perfiles iguales para este fragmento (p. ej. uno sin campos) son una sola petición
+            signature = clause_cache.signature(clause_cache.profile(clause_data(contract_type, segment["id"], data)))
+            pending.setdefault((segment["id"], signature), (segment, data))
+    with span("warm_clauses", contract_type=contract_type, profiles=len(profiles)), priority(BACKGROUND):
+        with ThreadPoolExecutor(max_workers=CLAUSE_WORKERS) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, _adapt_clause, client, contract_type, segment, data)
+                for segment, data in pending.values()
+            ]
+            for future in futures:
+                future.result()
+    return {"adapted": len(pending), "cached": cached}
+
+
+def speculation_ready(contract_type: str, user_data: dict) -> bool:
+    """True si ya están todos los campos adaptativos obligatorios, requisito para especular."""
+    return all(
+        user_data.get(field["key"])
+        for field in TEMPLATES.get(contract_type).fields
+        if field.get("adaptive") and field.get("required")
+    )
+
+
+def _depends_on_business_only(contract_type: str, segment: dict) -> bool:
+    """True si el fragmento pasa por el modelo y todos los campos que recibe son adaptativos."""
+    template = TEMPLATES.get(contract_type)
+    return needs_model(segment) and set(template.clause_fields.get(segment["id"], [])) <= set(template.adaptive_keys)
+
+
+class ClauseSpeculation:
+    """
+    Adaptación en segundo plano de los fragmentos que solo dependen del negocio.
+
+    Se lanza mientras el usuario termina el formulario. Si los campos
+    adaptativos cambian, se cancela y se crea otra; al generar, los fragmentos
+    ya adaptados se reutilizan y solo queda rellenar los demás datos.
+    """
+
+    def __init__(self, contract_type: str, user_data: dict, api_key: str | None = None):
+        client = _get_client(api_key)
+        self.contract_type = contract_type
+        self.data = adaptive_data(contract_type, user_data)
+        segments = [s for s in TEMPLATES.get(contract_type).segments if _depends_on_business_only(contract_type, s)]
+        self._cancelled = threading.Event()
+        # Trabajo de fondo: cede la cuota al chat y a las generaciones en curso
+        with span("speculation", contract_type=contract_type, clauses=len(segments)), priority(BACKGROUND):
+            token = _cancelled.set(self._cancelled)
+            try:
+                self.futures: dict[str, Future] = {
+                    segment["id"]: _speculation_pool.submit(
+                        contextvars.copy_context().run, _adapt_clause, client, contract_type, segment, self.data
+                    )
+                    for segment in segments
+                }
+            finally:
+                _cancelled.reset(token)
+
+    def matches(self, contract_type: str, user_data: dict) -> bool:
+        """True si los fragmentos especulados siguen siendo válidos para estos datos."""
+        return contract_type == self.contract_type and adaptive_data(contract_type, user_data) == self.data
+
+    def cancel(self) -> None:
+        """
+        Descarta la especulación: las peticiones en cola no empiezan y las que
+        están en curso cierran su respuesta en el siguiente fragmento.
+        """
+        self._cancelled.set()
+        for future in self.futures.values():
+            future.cancel()
+
+
+def _generate_by_clauses(client: OpenAI, contract_type: str, user_data: dict, speculation: ClauseSpeculation | None = None, reuse: bool = True) -> Iterator[str]:
+    """
+    Genera el contrato adaptando en paralelo solo los fragmentos que lo requieren.
+
+    Los fragmentos genéricos se copian de la plantilla sin pasar por el modelo.
+    Entrega cada fragmento en el orden del contrato en cuanto está listo, así que
+    el tiempo total se aproxima al del fragmento más lento. Los fragmentos que
+    una `speculation` válida ya adaptó (o está adaptando) no se vuelven a pedir.
+    """
+    segments = TEMPLATES.get(contract_type).segments
+    prepared = speculation.futures if speculation is not None and speculation.matches(contract_type, user_data) else {}
+    with ThreadPoolExecutor(max_workers=CLAUSE_WORKERS) as pool:
+        futures = {}
+        for segment in segments:
+            if not needs_model(segment):
+                continue
+            future = prepared.get(segment["id"])
+            if future is None or future.cancelled():
+                # copy_context conserva el trace de telemetría en los hilos del pool
+                future = pool.submit(contextvars.copy_context().run, _adapt_clause, client, contract_type, segment, user_data, reuse)
+            futures[segment["id"]] = future
+        try:
+            for segment in segments:
+                future = futures.get(segment["id"])
+                if future is None:
+                    text = segment["text"]
+                elif future is prepared.get(segment["id"]):
+                    try:
+                        text = future.result()
+                    except Exception:
+                        # Una especulación fallida no debe tumbar la generación: se reintenta
+                        text = _adapt_clause(client, contract_type, segment, user_data, reuse)
+                else:
+                    text = future.result()
+                yield fill_markers(text, user_data)
+        finally:
+            # Si el consumidor abandona o una petición falla, no lanzar las pendientes
+            # (las de la especulación son de la sesión y se conservan)
+            for segment_id, future in futures.items():
+                if future is not prepared.get(segment_id):
+                    future.cancel()
+
+
+def _cache_key(contract_type: str, user_data: dict, special_instructions: str, mode: str) -> str:
+    return generation_cache.make_key(
+        contract_type, user_data, special_instructions, route(GENERATION_ROUTES[mode])["model"],
+        PROMPT_VERSION, TEMPLATES.get(contract_type).hash, mode
+    )
+
+
+def generation_key(contract_type: str, user_data: dict, special_instructions: str = "", mode: str = "clauses") -> str:
+    """Identificador de una generación: mismos datos, instrucciones, modelo, prompts y plantilla."""
+    return _cache_key(contract_type, user_data, special_instructions, _resolve_mode(mode, special_instructions))
+
+
+def _draft_key(key: str) -> str:
+    """Entrada del caché para un contrato que no pasó la validación local y aún no se corrige."""
+    return f"{key}:borrador"
+
+
+def _cached_stream(key: str) -> str | None:
+    """Contrato guardado para los streams: el corregido o, si no hay, el borrador (quien lo recibe lo valida)."""
+    return generation_cache.get(key) or generation_cache.get(_draft_key(key))
+
+
+def _store_stream(key: str, contract: str, contract_type: str, user_data: dict) -> None:
+    """
+    Guarda el resultado de un stream. Los streams no corrigen (su texto ya se
+    entregó): si la validación local encuentra problemas se guarda como
+    borrador, y generate_contract no lo reutiliza hasta que repair_contract
+    guarde la versión corregida bajo `key`.
+    """
+    valid = not validate_contract(contract, contract_type, user_data)
+    generation_cache.put(key if valid else _draft_key(key), contract)
+
+
+def generate_contract(contract_type: str, user_data: dict, special_instructions: str = "", api_key: str | None = None, mode: str = "clauses", use_cache: bool = True, speculation: ClauseSpeculation | None = None) -> str:
     """
     Genera un contrato personalizado usando OpenAI.
 
@@ -89,45 +799,265 @@ def generate_contract(contract_type: str, user_data: dict, special_instructions:
         user_data: Diccionario con los datos del formulario
         special_instructions: Instrucciones adicionales del usuario
         api_key: API key de OpenAI (si no se pasa, usa la del entorno)
+        mode: "clauses" (adapta en paralelo solo las cláusulas necesarias),
+            "passthrough" (una petición que omite las cláusulas genéricas) o "full".
+            Con instrucciones adicionales "clauses" pasa a "passthrough", porque
+            pueden agregar o eliminar cláusulas.
+        use_cache: Si es False, ignora el caché (también el de cláusulas
+            compartidas entre clientes) y genera de nuevo; el resultado
+            reemplaza la entrada guardada
+        speculation: Pre-generación lanzada mientras se llenaba el formulario;
+            en modo "clauses" se reutilizan sus fragmentos si los datos coinciden
 
     Returns:
         Texto del contrato generado
     """
     client = _get_client(api_key)
-    template = load_template(contract_type)
-    formatted_data = format_user_data(user_data)
+    mode = _resolve_mode(mode, special_instructions)
+    with span("generate", contract_type=contract_type, mode=mode) as record:
+        key = _cache_key(contract_type, user_data, special_instructions, mode)
+        cached = generation_cache.get(key) if use_cache else None
+        record["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
+        record["speculation_hit"] = mode == "clauses" and speculation is not None and speculation.matches(contract_type, user_data)
 
-    tipo_nombre = {
-        "servicios": "Prestación de Servicios Independientes",
-        "arrendamiento": "Arrendamiento",
-    }
+        contract = _generate(client, contract_type, user_data, special_instructions, mode, speculation, use_cache)
+        contract = repair_contract(contract, contract_type, user_data, api_key)
+        generation_cache.put(key, contract)
+        return contract
 
-    user_message = f"""Genera el contrato de {tipo_nombre[contract_type]} usando la siguiente información:
 
-DATOS DEL USUARIO:
-{formatted_data}
+def _expected_tokens(contract_type: str, passthrough: bool) -> int:
+    """Largo estimado del contrato que devuelve el modelo en los modos de una sola petición."""
+    template = TEMPLATES.get(contract_type)
+    return template.collapsed_tokens if passthrough else template.tokens
 
-PLANTILLA BASE DEL CONTRATO:
-{template}
 
-{f"INSTRUCCIONES ADICIONALES: {special_instructions}" if special_instructions else ""}
+def _generate(client: OpenAI, contract_type: str, user_data: dict, special_instructions: str, mode: str, speculation: ClauseSpeculation | None = None, reuse: bool = True) -> str:
+    if mode == "clauses":
+        return "".join(_generate_by_clauses(client, contract_type, user_data, speculation, reuse))
 
-Por favor genera el contrato completo con todos los datos reemplazados correctamente."""
+    passthrough = mode == "passthrough"
+    with span("prompt_build", contract_type=contract_type, mode=mode):
+        messages = _build_generation_messages(contract_type, user_data, special_instructions, passthrough)
+    text = _complete(client, messages, GENERATION_ROUTES[mode], contract_type, _expected_tokens(contract_type, passthrough))
+    if passthrough:
+        text = expand_clause_refs(text, TEMPLATES.get(contract_type).segments)
+    return fill_markers(text, user_data)
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_message},
-        ],
-        temperature=0.1,
-        max_tokens=16000,
-    )
 
-    return response.choices[0].message.content
+def generate_contract_stream(contract_type: str, user_data: dict, special_instructions: str = "", api_key: str | None = None, mode: str = "clauses", use_cache: bool = True, speculation: ClauseSpeculation | None = None) -> Iterator[str]:
+    """
+    Igual que generate_contract, pero entrega el texto conforme el modelo lo va generando.
+
+    Los errores de configuración (API key, tipo de contrato) se lanzan al
+    empezar a iterar, antes del primer fragmento. En modo "clauses" cada
+    fragmento es una cláusula completa. Si el contrato está en caché se
+    entrega completo en un solo fragmento.
+
+    El texto no se corrige: quien lo consume lo valida y, si hace falta, llama
+    a repair_contract con cache_key=generation_key(...) (como app.py y
+    agenerate_contract).
+
+    Yields:
+        Fragmentos (deltas) del contrato en orden; concatenados forman el contrato completo
+    """
+    client = _get_client(api_key)
+    mode = _resolve_mode(mode, special_instructions)
+    with span("generate", contract_type=contract_type, mode=mode, stream=True) as record:
+        started = time.perf_counter()
+        key = _cache_key(contract_type, user_data, special_instructions, mode)
+        cached = _cached_stream(key) if use_cache else None
+        record["cache_hit"] = cached is not None
+        if cached is not None:
+            yield cached
+            return
+        record["speculation_hit"] = mode == "clauses" and speculation is not None and speculation.matches(contract_type, user_data)
+
+        chunks = []
+        for delta in _generate_stream(client, contract_type, user_data, special_instructions, mode, speculation, use_cache):
+            if not chunks:
+                record["ttft_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            chunks.append(delta)
+            yield delta
+        # Solo se guarda si el consumidor leyó la respuesta completa
+        _store_stream(key, "".join(chunks), contract_type, user_data)
+
+
+def _generate_stream(client: OpenAI, contract_type: str, user_data: dict, special_instructions: str, mode: str, speculation: ClauseSpeculation | None = None, reuse: bool = True) -> Iterator[str]:
+    if mode == "clauses":
+        yield from _generate_by_clauses(client, contract_type, user_data, speculation, reuse)
+        return
+
+    passthrough = mode == "passthrough"
+    with span("prompt_build", contract_type=contract_type, mode=mode):
+        messages = _build_generation_messages(contract_type, user_data, special_instructions, passthrough)
+    deltas = _stream_completion(client, messages, GENERATION_ROUTES[mode], contract_type, _expected_tokens(contract_type, passthrough))
+    if passthrough:
+        deltas = expand_clause_refs_stream(deltas, TEMPLATES.get(contract_type).segments)
+    yield from fill_markers_stream(deltas, user_data)
+
+
+def _resolve_mode(mode: str, special_instructions: str) -> str:
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Modo de generación no soportado: {mode}")
+    if mode == "clauses" and special_instructions:
+        return "passthrough"
+    return mode
+
+
+def _refill(text: str, key: str, expected: int, previous: dict, user_data: dict) -> str | None:
+    """
+    Sustituye en `text` el valor anterior de un campo por el nuevo.
+
+    Solo es seguro si el valor anterior aparece exactamente tantas veces como
+    marcadores tiene el fragmento en la plantilla; si no, devuelve None.
+    """
+    old = str(previous.get(key) or MISSING_VALUE)
+    if text.count(old) != expected:
+        return None
+    return text.replace(old, str(user_data.get(key) or MISSING_VALUE))
+
 
+def update_contract(contract_text: str, contract_type: str, previous_data: dict, user_data: dict, api_key: str | None = None) -> str:
+    """
+    Actualiza un contrato ya generado tras corregir datos del formulario.
+
+    Solo se tocan los fragmentos afectados por los campos que cambiaron: los
+    que el modelo adapta con ese campo (su "clauses") se vuelven a adaptar, en
+    paralelo; en los que el campo solo es un marcador se sustituye el valor
+    localmente. El resto del contrato, incluidas las modificaciones hechas
+    desde el chat, se conserva tal cual. Los fragmentos eliminados en el chat
+    no se vuelven a agregar.
+
+    Returns:
+        Texto del contrato actualizado
+    """
+    template = TEMPLATES.get(contract_type)
+    changed = changed_fields(previous_data, user_data)
+    by_id = {segment["id"]: segment for segment in template.segments}
+    segments = split_clauses(contract_text)
+
+    with span("update", contract_type=contract_type, changed=len(changed)) as record:
+        to_adapt, texts = [], {}
+        for segment in segments:
+            base = by_id.get(segment["id"])
+            if base is None:
+                continue
+            adapted = changed & set(template.clause_fields.get(segment["id"], []))
+            filled = changed & template.markers[segment["id"]]
+            if not adapted and not filled:
+                continue
+            text = None if adapted else segment["text"]
+            for key in sorted(filled):
+                if text is None:
+                    break
+                text = _refill(text, key, base["text"].count(f"{{{{{key}}}}}"), previous_data, user_data)
+            if text is not None:
+                texts[segment["id"]] = text
+            elif needs_model(base):
+                to_adapt.append(base)
+            else:
+                texts[segment["id"]] = fill_markers(base["text"], user_data)
+
+        if to_adapt:
+            client = _get_client(api_key)
+            with ThreadPoolExecutor(max_workers=CLAUSE_WORKERS) as pool:
+                futures = {
+                    segment["id"]: pool.submit(contextvars.copy_context().run, _adapt_clause, client, contract_type, segment, user_data)
+                    for segment in to_adapt
+                }
+                for segment_id, future in futures.items():
+                    texts[segment_id] = fill_markers(future.result(), user_data)
+        record["refilled"] = len(texts) - len(to_adapt)
+        record["adapted"] = len(to_adapt)
+
+    return join_clauses([{**s, "text": texts[s["id"]]} if s["id"] in texts else s for s in segments])
+
+
+def _repairs_by_clause(issues: list[dict]) -> dict[str, list[dict]]:
+    """Problemas que requieren al modelo, agrupados por cláusula."""
+    by_clause = {}
+    for issue in issues:
+        if issue["kind"] in MODEL_REPAIRS:
+            by_clause.setdefault(issue["clause"], []).append(issue)
+    return by_clause
+
+
+def _repair_clause(client: OpenAI, contract_type: str, segment: dict, issues: list[dict], user_data: dict) -> str:
+    """Corrige un fragmento con el modelo y le devuelve el espaciado final original."""
+    with span("prompt_build", contract_type=contract_type, clause=segment["id"]):
+        messages = _build_repair_messages(contract_type, segment, issues, user_data)
+    reply = _complete(client, messages, "repair_clause", contract_type, estimate_tokens(segment["text"]))
+    text = segment["text"]
+    return reply.strip() + text[len(text.rstrip()):]
+
+
+def repair_contract(contract_text: str, contract_type: str, user_data: dict, api_key: str | None = None, issues: list[dict] | None = None, cache_key: str | None = None) -> str:
+    """
+    Corrige los problemas que encontró validation.validate_contract.
+
+    Solo se le piden al modelo las cláusulas con datos faltantes o huecos sin
+    rellenar, una petición por cláusula y en paralelo; la numeración se
+    corrige localmente. Es una sola pasada: lo que siga mal después se reporta
+    con validate_contract.
+
+    Args:
+        issues: problemas ya detectados (si no se pasan, se valida el contrato)
+        cache_key: entrada del caché de generación que se reemplaza con el
+            contrato corregido (ver generation_key)
+
+    Returns:
+        Texto del contrato corregido (el mismo si no había nada que corregir)
+    """
+    if issues is None:
+        issues = validate_contract(contract_text, contract_type, user_data)
+    if not issues:
+        return contract_text
+    by_clause = _repairs_by_clause(issues)
+    with span("repair", contract_type=contract_type, clauses=len(by_clause)) as record:
+        segments = split_clauses(contract_text)
+        if by_clause:
+            client = _get_client(api_key)
+            with ThreadPoolExecutor(max_workers=CLAUSE_WORKERS) as pool:
+                futures = {
+                    segment["id"]: pool.submit(
+                        contextvars.copy_context().run, _repair_clause, client, contract_type, segment, by_clause[segment["id"]], user_data
+                    )
+                    for segment in segments
+                    if segment["id"] in by_clause
+                }
+                segments = [{**s, "text": futures[s["id"]].result()} if s["id"] in futures else s for s in segments]
+        text = join_clauses(segments)
+        # Después de las cláusulas: renumerar cambia los ids de split_clauses
+        if any(issue["kind"] == "numbering" for issue in issues):
+            text = fix_numbering(text, contract_type)
+        record["remaining"] = len(validate_contract(text, contract_type, user_data))
+    if cache_key is not None:
+        generation_cache.put(cache_key, text)
+    return text
+
+
+def passthrough_savings(contract_type: str) -> dict:
+    """
+    Estima los tokens de salida que el modo "passthrough" evita para una plantilla.
+
+    Returns:
+        Tokens estimados de la plantilla completa, de la versión con marcadores
+        y la reducción relativa
+    """
+    template = TEMPLATES.get(contract_type)
+    full_tokens = template.tokens
+    passthrough_tokens = template.collapsed_tokens
+    return {
+        "full_tokens": full_tokens,
+        "passthrough_tokens": passthrough_tokens,
+        "reduction": 1 - passthrough_tokens / full_tokens,
+    }
 
-def review_contract(contract_text: str, question: str, api_key: str | None = None) -> str:
+
+def review_contract(contract_text: str, question: str, api_key: str | None = None, passthrough: bool = True) -> str:
     """
     Permite al usuario hacer preguntas o pedir modificaciones sobre el contrato generado.
 
@@ -135,31 +1065,398 @@ def review_contract(contract_text: str, question: str, api_key: str | None = Non
         contract_text: El contrato generado
         question: Pregunta o instrucción del usuario
         api_key: API key de OpenAI (si no se pasa, usa la del entorno)
+        passthrough: Si es True, en una modificación el modelo solo reescribe
+            las cláusulas que cambian y el resto se reconstruye localmente
 
     Returns:
         Respuesta del agente o contrato modificado
     """
     client = _get_client(api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": f"""Aquí está el contrato generado:
+    with span("prompt_build", route="review_passthrough" if passthrough else "review"):
+        messages = _build_review_messages(contract_text, question, passthrough)
+    # Sin passthrough una modificación devuelve el contrato completo
+    expected = None if passthrough else estimate_tokens(contract_text)
+    text = _complete(client, messages, "review_passthrough" if passthrough else "review", expected_tokens=expected)
+    if passthrough:
+        text = expand_clause_refs(text, split_clauses(contract_text))
+    return text
 
-{contract_text}
 
-El usuario tiene la siguiente pregunta o solicitud de modificación:
-{question}
+def review_contract_stream(contract_text: str, question: str, api_key: str | None = None, passthrough: bool = True) -> Iterator[str]:
+    """
+    Igual que review_contract, pero entrega la respuesta conforme se va generando.
 
-Si es una pregunta, responde de forma clara y concisa.
-Si es una solicitud de modificación, devuelve el contrato completo con los cambios aplicados.
-Indica claramente qué cambios realizaste.""",
-            },
-        ],
-        temperature=0.1,
-        max_tokens=16000,
-    )
+    Yields:
+        Fragmentos (deltas) de la respuesta del agente
+    """
+    client = _get_client(api_key)
+    with span("prompt_build", route="review_passthrough" if passthrough else "review"):
+        messages = _build_review_messages(contract_text, question, passthrough)
+    expected = None if passthrough else estimate_tokens(contract_text)
+    deltas = _stream_completion(client, messages, "review_passthrough" if passthrough else "review", expected_tokens=expected)
+    if passthrough:
+        deltas = expand_clause_refs_stream(deltas, split_clauses(contract_text))
+    yield from deltas
+
+
+def parse_review_reply(text: str) -> dict:
+    """
+    Separa una respuesta del modo "edits" en texto para el usuario y operaciones.
 
-    return response.choices[0].message.content
+    Returns:
+        {"answer": str, "edits": list[dict]}
+
+    Raises:
+        EditError: si la sección de cambios no es una lista JSON válida
+    """
+    answer, separator, edits_block = text.partition(EDITS_SEPARATOR)
+    if not separator:
+        return {"answer": text.strip(), "edits": []}
+
+    block = edits_block.strip()
+    # El modelo a veces envuelve el JSON en un bloque ```json ... ```
+    if block.startswith("```"):
+        block = block.split("\n", 1)[1] if "\n" in block else ""
+        block = block.rsplit("```", 1)[0]
+    try:
+        edits = json.loads(block) if block.strip() else []
+    except json.JSONDecodeError as e:
+        raise EditError(f"No se pudieron interpretar los cambios propuestos: {e}") from e
+    if isinstance(edits, dict):
+        edits = [edits]
+    if not isinstance(edits, list) or not all(isinstance(edit, dict) for edit in edits):
+        raise EditError("Los cambios propuestos no tienen el formato esperado.")
+    return {"answer": answer.strip(), "edits": edits}
+
+
+def hide_edits_block(deltas: Iterator[str]) -> Iterator[str]:
+    """Filtra un stream del modo "edits" para mostrar solo la respuesta al usuario."""
+    pending = ""
+    keep = len(EDITS_SEPARATOR) - 1
+    for delta in deltas:
+        pending += delta
+        if EDITS_SEPARATOR in pending:
+            yield pending.split(EDITS_SEPARATOR, 1)[0]
+            # Consumir el resto sin mostrarlo
+            for _ in deltas:
+                pass
+            return
+        if len(pending) > keep:
+            yield pending[:-keep]
+            pending = pending[-keep:]
+    if pending:
+        yield pending
+
+
+def _review_context(contract_text: str, question: str, index: ClauseIndex | None) -> tuple[list[dict], str]:
+    """
+    Mensajes y ruta para el modo "edits": las preguntas van al modelo rápido con
+    solo el encabezado y las cláusulas más relevantes según el índice local; las
+    modificaciones, al modelo principal con el contrato completo.
+    """
+    route_name = classify_chat(question)
+    with span("prompt_build", route=route_name) as record:
+        segments = None
+        if route_name == "review_qa":
+            index = (index or ClauseIndex()).update(contract_text)
+            # Sin coincidencias léxicas no hay forma segura de recortar el contexto
+            segments = index.context_for(question, QA_TOP_K, QA_CONTEXT_CHARS) or None
+        record["clauses"] = len(segments) if segments else "todas"
+        return _build_edits_messages(contract_text, question, segments), route_name
+
+
+def review_contract_edits(contract_text: str, question: str, api_key: str | None = None, index: ClauseIndex | None = None) -> dict:
+    """
+    Responde una pregunta o aplica una modificación mediante operaciones de edición.
+
+    El modelo no reescribe el contrato: devuelve operaciones replace/insert/delete
+    acotadas a cláusulas, que se aplican localmente. El costo depende del tamaño
+    del cambio, no del contrato. Las preguntas se responden con solo las
+    cláusulas relevantes; pasar un `index` permite reutilizarlo entre turnos.
+
+    Returns:
+        {"answer": str, "edits": list[dict], "contract": str | None}; "contract"
+        es el contrato modificado, o None si la respuesta no trae cambios
+
+    Raises:
+        EditError: si alguna operación no puede aplicarse
+    """
+    client = _get_client(api_key)
+    messages, route_name = _review_context(contract_text, question, index)
+    reply = parse_review_reply(_complete(client, messages, route_name))
+    reply["contract"] = apply_edits(contract_text, reply["edits"]) if reply["edits"] else None
+    return reply
+
+
+def review_contract_edits_stream(contract_text: str, question: str, api_key: str | None = None, index: ClauseIndex | None = None) -> Iterator[str]:
+    """
+    Versión streaming del modo "edits": entrega la respuesta cruda del modelo.
+
+    Para mostrarla usa hide_edits_block; al terminar, parse_review_reply y
+    apply_edits sobre el texto completo obtienen el contrato modificado.
+    """
+    client = _get_client(api_key)
+    messages, route_name = _review_context(contract_text, question, index)
+    yield from _stream_completion(client, messages, route_name)
+
+
+# --- API asíncrona ---
+# Las peticiones se hacen siempre en streaming: cancelar la tarea cierra la
+# conexión y el proveedor deja de generar (y de cobrar) los tokens restantes.
+
+
+def _get_async_client(api_key: str | None = None) -> AsyncOpenAI:
+    """Cliente AsyncOpenAI compartido para el event loop en curso."""
+    return get_async_client(api_key)
+
+
+async def _astream_request(client: AsyncOpenAI, messages: list[dict], config: dict, contract_type: str | None, continuation: int, outcome: dict) -> AsyncIterator[str]:
+    """Versión asíncrona de _stream_request."""
+    attrs = {"continuation": continuation} if continuation else {}
+    with span("llm_call", contract_type=contract_type, stream=True, api="async", **config, **attrs) as record:
+        started = time.perf_counter()
+        stream = await SCHEDULER.acall(
+            lambda: client.chat.completions.create(
+                model=config["model"],
+                messages=messages,
+                temperature=0.1,
+                max_tokens=config["max_tokens"],
+                stream=True,
+                stream_options={"include_usage": True},
+            ),
+            _request_cost(messages, config), config["priority"], record,
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    _record_usage(record, chunk.usage)
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason:
+                    record["finish_reason"] = chunk.choices[0].finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    record.setdefault("ttft_ms", round((time.perf_counter() - started) * 1000, 2))
+                    yield delta
+        finally:
+            await stream.close()
+        outcome["finish_reason"] = record.get("finish_reason")
+
+
+async def _astream_completion(client: AsyncOpenAI, messages: list[dict], route_name: str, contract_type: str | None = None, expected_tokens: int | None = None) -> AsyncIterator[str]:
+    """Versión asíncrona de _stream_completion."""
+    config = route(route_name, expected_tokens)
+    stitched = _Continuation(messages, rewind=False)
+    while not stitched.done:
+        outcome = {}
+        async with contextlib.aclosing(_astream_request(client, stitched.request(), config, contract_type, stitched.count, outcome)) as deltas:
+            async for delta in deltas:
+                text = stitched.feed(delta)
+                if text:
+                    yield text
+        text = stitched.finish(outcome.get("finish_reason"))
+        if text:
+            yield text
+
+
+async def _acomplete(client: AsyncOpenAI, messages: list[dict], route_name: str, contract_type: str | None = None, expected_tokens: int | None = None) -> str:
+    async with contextlib.aclosing(_astream_completion(client, messages, route_name, contract_type, expected_tokens)) as deltas:
+        return "".join([delta async for delta in deltas])
+
+
+async def _aadapt_clause(client: AsyncOpenAI, contract_type: str, segment: dict, user_data: dict, reuse: bool = True) -> str:
+    scope, shared = _shared_clause(contract_type, segment, user_data, reuse)
+    if shared is not None:
+        return shared
+    with span("prompt_build", contract_type=contract_type, clause=segment["id"]):
+        messages = _build_clause_messages(contract_type, segment, user_data)
+    reply = await _acomplete(client, messages, "adapt_clause", contract_type, TEMPLATES.get(contract_type).clause_tokens[segment["id"]])
+    text = segment["text"]
+    adapted = reply.strip() + text[len(text.rstrip()):]
+    if scope is not None:
+        clause_cache.store(scope, clause_data(contract_type, segment["id"], user_data), adapted)
+    return adapted
+
+
+async def _arepair_clause(client: AsyncOpenAI, contract_type: str, segment: dict, issues: list[dict], user_data: dict) -> str:
+    with span("prompt_build", contract_type=contract_type, clause=segment["id"]):
+        messages = _build_repair_messages(contract_type, segment, issues, user_data)
+    reply = await _acomplete(client, messages, "repair_clause", contract_type, estimate_tokens(segment["text"]))
+    text = segment["text"]
+    return reply.strip() + text[len(text.rstrip()):]
+
+
+async def _agenerate_by_clauses(client: AsyncOpenAI, contract_type: str, user_data: dict, speculation: ClauseSpeculation | None = None, reuse: bool = True) -> AsyncIterator[str]:
+    """Versión asíncrona de _generate_by_clauses: una tarea por fragmento, a lo más CLAUSE_WORKERS a la vez."""
+    segments = TEMPLATES.get(contract_type).segments
+    prepared = speculation.futures if speculation is not None and speculation.matches(contract_type, user_data) else {}
+    semaphore = asyncio.Semaphore(CLAUSE_WORKERS)
+
+    async def adapt(segment: dict) -> str:
+        async with semaphore:
+            return await _aadapt_clause(client, contract_type, segment, user_data, reuse)
+
+    async def from_speculation(segment: dict, future: Future) -> str:
+        try:
+            # shield: cancelar la generación no cancela la especulación de la sesión
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return await adapt(segment)
+
+    tasks = {}
+    for segment in segments:
+        if not needs_model(segment):
+            continue
+        future = prepared.get(segment["id"])
+        coroutine = from_speculation(segment, future) if future is not None and not future.cancelled() else adapt(segment)
+        tasks[segment["id"]] = asyncio.create_task(coroutine)
+    try:
+        for segment in segments:
+            task = tasks.get(segment["id"])
+            text = await task if task else segment["text"]
+            yield fill_markers(text, user_data)
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+
+async def _alines(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Agrupa los fragmentos en líneas completas (marcadores y referencias nunca cruzan líneas)."""
+    pending = ""
+    async for delta in deltas:
+        pending += delta
+        cut = pending.rfind("\n") + 1
+        if cut:
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+
+async def _agenerate_stream(client: AsyncOpenAI, contract_type: str, user_data: dict, special_instructions: str, mode: str, speculation: ClauseSpeculation | None = None, reuse: bool = True) -> AsyncIterator[str]:
+    if mode == "clauses":
+        async with contextlib.aclosing(_agenerate_by_clauses(client, contract_type, user_data, speculation, reuse)) as texts:
+            async for text in texts:
+                yield text
+        return
+
+    passthrough = mode == "passthrough"
+    with span("prompt_build", contract_type=contract_type, mode=mode):
+        messages = _build_generation_messages(contract_type, user_data, special_instructions, passthrough)
+    segments = TEMPLATES.get(contract_type).segments
+    async with contextlib.aclosing(_astream_completion(client, messages, GENERATION_ROUTES[mode], contract_type, _expected_tokens(contract_type, passthrough))) as deltas:
+        async for line in _alines(deltas):
+            yield fill_markers(expand_clause_refs(line, segments) if passthrough else line, user_data)
+
+
+async def agenerate_contract_stream(contract_type: str, user_data: dict, special_instructions: str = "", api_key: str | None = None, mode: str = "clauses", use_cache: bool = True, speculation: ClauseSpeculation | None = None) -> AsyncIterator[str]:
+    """
+    Versión asíncrona de generate_contract_stream (en los modos de una sola
+    petición entrega líneas completas).
+
+    Cerrar el generador o cancelar la tarea que lo consume cancela las
+    peticiones en curso. El plazo lo impone quien consume, p. ej. con
+    asyncio.timeout alrededor del ciclo.
+    """
+    client = _get_async_client(api_key)
+    mode = _resolve_mode(mode, special_instructions)
+    with span("generate", contract_type=contract_type, mode=mode, stream=True, api="async") as record:
+        started = time.perf_counter()
+        key = _cache_key(contract_type, user_data, special_instructions, mode)
+        cached = _cached_stream(key) if use_cache else None
+        record["cache_hit"] = cached is not None
+        if cached is not None:
+            yield cached
+            return
+        record["speculation_hit"] = mode == "clauses" and speculation is not None and speculation.matches(contract_type, user_data)
+
+        chunks = []
+        async with contextlib.aclosing(_agenerate_stream(client, contract_type, user_data, special_instructions, mode, speculation, use_cache)) as deltas:
+            async for delta in deltas:
+                if not chunks:
+                    record["ttft_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                chunks.append(delta)
+                yield delta
+        _store_stream(key, "".join(chunks), contract_type, user_data)
+
+
+async def arepair_contract(contract_text: str, contract_type: str, user_data: dict, api_key: str | None = None, issues: list[dict] | None = None, cache_key: str | None = None) -> str:
+    """Versión asíncrona de repair_contract: una tarea por cláusula, a lo más CLAUSE_WORKERS a la vez."""
+    if issues is None:
+        issues = validate_contract(contract_text, contract_type, user_data)
+    if not issues:
+        return contract_text
+    by_clause = _repairs_by_clause(issues)
+    with span("repair", contract_type=contract_type, clauses=len(by_clause), api="async") as record:
+        segments = split_clauses(contract_text)
+        if by_clause:
+            client = _get_async_client(api_key)
+            semaphore = asyncio.Semaphore(CLAUSE_WORKERS)
+
+            async def repair(segment: dict) -> str:
+                async with semaphore:
+                    return await _arepair_clause(client, contract_type, segment, by_clause[segment["id"]], user_data)
+
+            targets = [segment for segment in segments if segment["id"] in by_clause]
+            texts = await asyncio.gather(*(repair(segment) for segment in targets))
+            repaired = {segment["id"]: text for segment, text in zip(targets, texts)}
+            segments = [{**s, "text": repaired[s["id"]]} if s["id"] in repaired else s for s in segments]
+        text = join_clauses(segments)
+        if any(issue["kind"] == "numbering" for issue in issues):
+            text = fix_numbering(text, contract_type)
+        record["remaining"] = len(validate_contract(text, contract_type, user_data))
+    if cache_key is not None:
+        generation_cache.put(cache_key, text)
+    return text
+
+
+async def agenerate_contract(contract_type: str, user_data: dict, special_instructions: str = "", api_key: str | None = None, mode: str = "clauses", use_cache: bool = True, speculation: ClauseSpeculation | None = None, deadline: float | None = AGENT_DEADLINE) -> str:
+    """
+    Versión asíncrona de generate_contract, cancelable y con plazo.
+
+    Args:
+        deadline: segundos máximos; al vencer se cancelan las peticiones en
+            curso y se lanza TimeoutError (None = sin plazo)
+
+    Returns:
+        Texto del contrato generado
+    """
+    async with asyncio.timeout(deadline):
+        async with contextlib.aclosing(agenerate_contract_stream(contract_type, user_data, special_instructions, api_key, mode, use_cache, speculation)) as deltas:
+            contract = "".join([delta async for delta in deltas])
+        key = _cache_key(contract_type, user_data, special_instructions, _resolve_mode(mode, special_instructions))
+        return await arepair_contract(contract, contract_type, user_data, api_key, cache_key=key)
+
+
+async def areview_contract_edits_stream(contract_text: str, question: str, api_key: str | None = None, index: ClauseIndex | None = None) -> AsyncIterator[str]:
+    """
+    Versión asíncrona de review_contract_edits_stream.
+
+    Cerrar el generador o cancelar la tarea que lo consume cancela la petición
+    en curso (p. ej. al salir del chat mientras el agente responde).
+    """
+    client = _get_async_client(api_key)
+    messages, route_name = _review_context(contract_text, question, index)
+    async with contextlib.aclosing(_astream_completion(client, messages, route_name)) as deltas:
+        async for delta in deltas:
+            yield delta
+
+
+async def areview_contract(contract_text: str, question: str, api_key: str | None = None, index: ClauseIndex | None = None, deadline: float | None = AGENT_DEADLINE) -> dict:
+    """
+    Versión asíncrona de review_contract_edits, cancelable y con plazo.
+
+    Returns:
+        {"answer": str, "edits": list[dict], "contract": str | None}
+
+    Raises:
+        EditError: si alguna operación no puede aplicarse
+        TimeoutError: si la respuesta no termina antes de `deadline` segundos
+    """
+    async with asyncio.timeout(deadline):
+        async with contextlib.aclosing(areview_contract_edits_stream(contract_text, question, api_key, index)) as deltas:
+            reply = parse_review_reply("".join([delta async for delta in deltas]))
+    reply["contract"] = apply_edits(contract_text, reply["edits"]) if reply["edits"] else None
+    return reply
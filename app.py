@@ -3,12 +3,48 @@ Tu Abogado de Bolsillo - Generador de Contratos para PyMEs en México
 Aplicación Streamlit + OpenAI
 """
 
+import hashlib
+import json
 import os
 import streamlit as st
+import time
 from datetime import datetime
-from contract_fields import SERVICIOS_FIELDS, ARRENDAMIENTO_FIELDS
-from agent import generate_contract, review_contract
-from export import contract_to_docx, contract_to_pdf
+from functools import partial
+import clause_cache
+from agent import (
+    ClauseSpeculation,
+    agenerate_contract_stream,
+    areview_contract_edits_stream,
+    generation_key,
+    hide_edits_block,
+    parse_review_reply,
+    repair_contract,
+    speculation_ready,
+    update_contract,
+    usage_summary,
+)
+from clause_index import ClauseIndex
+from clients import account_key, connection_stats
+from clauses import EditError, apply_edits
+from export import cached_export, export_cache_stats, is_export_cached
+from jobs import CANCELLED, ERROR, JOBS
+from scheduler import SCHEDULER
+from telemetry import load_records, summarize
+from template_registry import TEMPLATES
+from validation import MODEL_REPAIRS, undefined_values, validate_contract
+
+# Panel de rendimiento en la barra lateral (solo para operadores)
+SHOW_ADMIN_PANEL = os.getenv("ADMIN_PANEL", "").lower() in ("1", "true", "yes")
+
+# Valor inicial de la pre-generación mientras se llena el formulario (cada usuario puede cambiarlo)
+SPECULATE_DEFAULT = os.getenv("SPECULATIVE_GENERATION", "").lower() in ("1", "true", "yes")
+
+# Cada cuánto se consulta el avance de un trabajo de generación en segundo plano
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+# Plazo máximo de una generación (segundos); al vencer se cancela y se muestra el error
+GENERATION_DEADLINE = float(os.getenv("GENERATION_DEADLINE", "300")) or None
+# Plazo máximo de una respuesta del chat (segundos)
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "120")) or None
 
 # --- Configuración de página ---
 st.set_page_config(
@@ -65,7 +101,13 @@ def init_session_state():
         "contract_type": None,
         "form_data": {},
         "generated_contract": None,
+        "generated_from": None,  # datos del formulario con los que se generó el contrato
+        "generation_job": None,  # {"id", "kind", "form_data", "label", "cache_key"} del trabajo en curso (ver jobs.py)
+        "contract_issues": [],  # problemas que la validación local no pudo corregir (ver validation.py)
         "chat_history": [],
+        "clause_index": ClauseIndex(),
+        "speculate": SPECULATE_DEFAULT,
+        "speculation": None,
     }
     for key, val in defaults.items():
         if key not in st.session_state:
@@ -85,31 +127,15 @@ def render_contract_selection():
     st.header("Paso 1: Selecciona el tipo de contrato")
     st.write("Elige el contrato que necesitas generar:")
 
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.subheader("Prestación de Servicios Independientes")
-        st.write(
-            "Para contratar freelancers, consultores o prestadores de servicios "
-            "independientes. Incluye cláusulas de confidencialidad, no competencia, "
-            "propiedad intelectual y cumplimiento legal."
-        )
-        if st.button("Seleccionar Servicios", key="btn_servicios", use_container_width=True):
-            st.session_state.contract_type = "servicios"
-            st.session_state.step = "fill"
-            st.rerun()
-
-    with col2:
-        st.subheader("Contrato de Arrendamiento")
-        st.write(
-            "Para arrendar inmuebles, locales o terrenos. Incluye cláusulas de "
-            "vigencia, uso permitido, obligaciones de las partes, depósito en "
-            "garantía y condiciones de terminación."
-        )
-        if st.button("Seleccionar Arrendamiento", key="btn_arrendamiento", use_container_width=True):
-            st.session_state.contract_type = "arrendamiento"
-            st.session_state.step = "fill"
-            st.rerun()
+    templates = list(TEMPLATES)
+    for column, template in zip(st.columns(len(templates)), templates):
+        with column:
+            st.subheader(f"Contrato de {template.name}")
+            st.write(template.description)
+            if st.button(f"Seleccionar {template.short_name}", key=f"btn_{template.contract_type}", use_container_width=True):
+                st.session_state.contract_type = template.contract_type
+                st.session_state.step = "fill"
+                st.rerun()
 
 
 def render_form_field(field: dict) -> str | None:
@@ -142,23 +168,55 @@ def render_form_field(field: dict) -> str | None:
     return None
 
 
+def update_speculation(contract_type: str, form_data: dict):
+    """
+    Mantiene la pre-generación de las cláusulas que dependen del giro del negocio.
+
+    Se lanza cuando ya están los campos adaptativos obligatorios y se cancela y
+    relanza si alguno cambia; el resto del formulario no la afecta.
+    """
+    current = st.session_state.speculation
+    if current is not None and current.matches(contract_type, form_data):
+        return
+    cancel_speculation()
+    api_key = get_api_key()
+    if api_key and speculation_ready(contract_type, form_data):
+        st.session_state.speculation = ClauseSpeculation(contract_type, form_data, api_key=api_key)
+
+
+def cancel_speculation():
+    """Descarta la pre-generación en curso, si existe."""
+    if st.session_state.speculation is not None:
+        st.session_state.speculation.cancel()
+        st.session_state.speculation = None
+
+
 def render_form():
     """Paso 2: Formulario para llenar datos del contrato."""
     contract_type = st.session_state.contract_type
-    type_names = {
-        "servicios": "Prestación de Servicios Independientes",
-        "arrendamiento": "Arrendamiento",
-    }
+    template = TEMPLATES.get(contract_type)
 
-    st.header(f"Paso 2: Datos del contrato de {type_names[contract_type]}")
+    st.header(f"Paso 2: Datos del contrato de {template.name}")
 
     if st.button("← Cambiar tipo de contrato"):
         st.session_state.step = "select"
         st.session_state.contract_type = None
         st.session_state.form_data = {}
+        st.session_state.generated_contract = None
+        st.session_state.generated_from = None
+        release_generation_job()
+        cancel_speculation()
         st.rerun()
 
-    fields = SERVICIOS_FIELDS if contract_type == "servicios" else ARRENDAMIENTO_FIELDS
+    st.session_state.speculate = st.toggle(
+        "Preparar el contrato mientras lleno el formulario",
+        value=st.session_state.speculate,
+        key="speculate_toggle",
+        help="Adapta en segundo plano las cláusulas de objeto, uso y no competencia en cuanto "
+             "describes el negocio, para que el contrato esté listo casi al instante.",
+    )
+
+    fields = template.fields
 
     # Renderizar campos por sección
     form_data = {}
@@ -174,13 +232,18 @@ def render_form():
         if value:
             form_data[field["key"]] = value
 
+    if st.session_state.speculate:
+        update_speculation(contract_type, form_data)
+    else:
+        cancel_speculation()
+
     st.divider()
 
     # Instrucciones especiales
     special = st.text_area(
         "Instrucciones especiales (opcional)",
         placeholder="Ejemplo: Agregar una cláusula de penalización por retraso en pagos...",
-        key="special_instructions",
+        key="special_instructions_input",
     )
 
     # Validación
@@ -198,45 +261,223 @@ def render_form():
             if missing:
                 st.error(f"Faltan campos obligatorios: {', '.join(missing[:5])}")
             else:
+                # Otras instrucciones pueden agregar o quitar cláusulas: el contrato se genera de nuevo
+                if special != st.session_state.get("special_instructions", ""):
+                    st.session_state.generated_contract = None
+                    release_generation_job()
                 st.session_state.form_data = form_data
                 st.session_state.special_instructions = special
                 st.session_state.step = "review"
                 st.rerun()
 
 
+def _as_stream(fn, *args, **kwargs):
+    """Adapta una función que devuelve el texto completo a la interfaz de JOBS (un iterador)."""
+    yield fn(*args, **kwargs)
+
+
+def start_generation_job(api_key: str, bypass_cache: bool = False):
+    """Encola la generación del contrato; una petición idéntica en curso se reutiliza."""
+    form_data = dict(st.session_state.form_data)
+    special = st.session_state.get("special_instructions", "")
+    key = generation_key(st.session_state.contract_type, form_data, special)
+    produce = partial(
+        agenerate_contract_stream,
+        st.session_state.contract_type,
+        form_data,
+        special,
+        api_key=api_key,
+        use_cache=not bypass_cache,
+        # Una versión nueva tampoco reutiliza las cláusulas ya preparadas
+        speculation=None if bypass_cache else st.session_state.speculation,
+    )
+    # La misma petición con otra API key es otro trabajo: se cobra y se limita en otra cuenta
+    job_key = f"{account_key(api_key)}:{key}"
+    job = JOBS.submit(f"{job_key}:nuevo" if bypass_cache else job_key, produce, deadline=GENERATION_DEADLINE)
+    st.session_state.generation_job = {
+        "id": job.id, "kind": job.kind, "form_data": form_data, "label": "Generando tu contrato...", "cache_key": key,
+    }
+
+
+def start_update_job(api_key: str | None):
+    """Encola la actualización de las cláusulas afectadas por los datos corregidos."""
+    form_data = dict(st.session_state.form_data)
+    contract = st.session_state.generated_contract
+    produce = partial(
+        _as_stream,
+        update_contract,
+        contract,
+        st.session_state.contract_type,
+        st.session_state.generated_from or {},
+        form_data,
+        api_key=api_key,
+    )
+    key = hashlib.sha256((contract + json.dumps(form_data, sort_keys=True, ensure_ascii=False)).encode("utf-8")).hexdigest()
+    job = JOBS.submit(f"update:{account_key(api_key)}:{key}", produce, kind="update")
+    st.session_state.generation_job = {
+        "id": job.id, "kind": job.kind, "form_data": form_data, "label": "Actualizando las cláusulas afectadas por los cambios...",
+    }
+
+
+def start_repair_job(contract: str, issues: list[dict], form_data: dict, cache_key: str | None):
+    """Encola la corrección de las cláusulas que no pasaron la validación local."""
+    api_key = get_api_key()
+    produce = partial(
+        _as_stream,
+        repair_contract,
+        contract,
+        st.session_state.contract_type,
+        form_data,
+        api_key=api_key,
+        issues=issues,
+        cache_key=cache_key,
+    )
+    key = hashlib.sha256(contract.encode("utf-8")).hexdigest()
+    job = JOBS.submit(f"repair:{account_key(api_key)}:{key}", produce, kind="repair")
+    st.session_state.generation_job = {
+        "id": job.id, "kind": job.kind, "form_data": form_data, "label": "Corrigiendo las cláusulas con datos incompletos...",
+    }
+
+
+def release_generation_job():
+    """Abandona el trabajo en curso de la sesión; se cancela si ninguna otra sesión lo espera."""
+    current = st.session_state.generation_job
+    if current is not None:
+        JOBS.release(current["id"])
+        st.session_state.generation_job = None
+
+
+def follow_job(job):
+    """
+    Entrega el texto de un trabajo conforme avanza (para st.write_stream).
+
+    Si la ejecución del script se interrumpe (un rerun o salir del chat), el
+    generador se cierra y el trabajo se abandona; así se cancela la petición.
+
+    Raises:
+        ValueError: si el trabajo termina con error
+    """
+    sent = 0
+    try:
+        while True:
+            text = job.text
+            if len(text) > sent:
+                yield text[sent:]
+                sent = len(text)
+            if not job.in_flight:
+                break
+            time.sleep(0.05)
+    finally:
+        JOBS.release(job.id)
+    if job.status == ERROR:
+        raise ValueError(job.error)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_generation_job():
+    """
+    Muestra el avance del trabajo en curso y, al terminar, entrega el resultado.
+
+    Solo este fragmento se vuelve a ejecutar mientras se espera; al terminar el
+    trabajo se relanza la página completa para mostrar el contrato.
+    """
+    current = st.session_state.generation_job
+    job = JOBS.get(current["id"])
+    if job is not None and job.in_flight:
+        st.info(f"{current['label']} Puedes salir de esta página: el trabajo sigue en segundo plano.")
+        text = job.text
+        if text:
+            st.code(text, language=None, wrap_lines=True, height=600)
+        return
+
+    st.session_state.generation_job = None
+    if job is None or job.status == CANCELLED:
+        # El trabajo expiró o se canceló antes de recogerlo: se vuelve a lanzar en el siguiente rerun
+        pass
+    elif job.status == ERROR:
+        st.session_state.generation_error = job.error
+    else:
+        contract = job.text
+        st.session_state.generated_contract = contract
+        st.session_state.generated_from = current["form_data"]
+        # Validación local (milisegundos); una corrección no se vuelve a corregir
+        issues = validate_contract(contract, st.session_state.contract_type, current["form_data"])
+        st.session_state.contract_issues = issues
+        if issues and current["kind"] != "repair":
+            if any(issue["kind"] in MODEL_REPAIRS for issue in issues):
+                start_repair_job(contract, issues, current["form_data"], current.get("cache_key"))
+            else:
+                # Solo numeración: se corrige localmente, sin esperar al modelo
+                st.session_state.generated_contract = repair_contract(
+                    contract, st.session_state.contract_type, current["form_data"], issues=issues, cache_key=current.get("cache_key")
+                )
+                st.session_state.contract_issues = []
+    st.rerun()
+
+
+def render_export_button(fmt: str, label: str, contract_text: str, file_name: str, mime: str):
+    """
+    Botón de descarga que solo genera el documento cuando se pide por primera vez.
+
+    Mientras el documento no esté en caché se muestra un botón "Preparar"; una
+    vez generado, el botón de descarga aparece directamente en cada rerun.
+    """
+    if is_export_cached(fmt, contract_text) or st.button(
+        f"Preparar {label}", key=f"prepare_{fmt}", use_container_width=True
+    ):
+        st.download_button(
+            f"Descargar {label}",
+            data=cached_export(fmt, contract_text),
+            file_name=file_name,
+            mime=mime,
+            use_container_width=True,
+        )
+
+
 def render_review():
     """Paso 3: Generación y revisión del contrato."""
     st.header("Paso 3: Tu contrato generado")
 
     if st.button("← Volver al formulario"):
+        # El contrato se conserva: al volver a enviar solo se actualizan las cláusulas afectadas
         st.session_state.step = "fill"
-        st.session_state.generated_contract = None
         st.rerun()
 
-    # Generar contrato si no existe
-    if not st.session_state.generated_contract:
+    error = st.session_state.pop("generation_error", None)
+    if error:
+        st.error(f"Error al generar el contrato: {error}")
+        return
+
+    # La generación y las actualizaciones corren como trabajos en segundo plano;
+    # un rerun se vuelve a enganchar al trabajo en curso en lugar de lanzar otro.
+    # Si los datos cambiaron mientras corría, su resultado ya no sirve: se cancela
+    current = st.session_state.generation_job
+    if current is not None and current["form_data"] != st.session_state.form_data:
+        release_generation_job()
+    if st.session_state.generation_job is None:
         api_key = get_api_key()
-        if not api_key:
-            st.error(
-                "Ingresa tu API key de OpenAI en la barra lateral para generar el contrato."
-            )
-            return
-
-        with st.spinner("Generando tu contrato... Esto puede tomar un momento."):
-            try:
-                contract = generate_contract(
-                    st.session_state.contract_type,
-                    st.session_state.form_data,
-                    st.session_state.get("special_instructions", ""),
-                    api_key=api_key,
+        if not st.session_state.generated_contract:
+            if not api_key:
+                st.error(
+                    "Ingresa tu API key de OpenAI en la barra lateral para generar el contrato."
                 )
-                st.session_state.generated_contract = contract
-            except Exception as e:
-                st.error(f"Error al generar el contrato: {e}")
                 return
+            # "Regenerar contrato" pide una versión nueva aunque exista en caché
+            start_generation_job(api_key, bypass_cache=st.session_state.pop("bypass_cache", False))
+        elif st.session_state.generated_from != st.session_state.form_data:
+            start_update_job(api_key)
+
+    if st.session_state.generation_job is not None:
+        render_generation_job()
+        return
 
     # Mostrar contrato
     contract_text = st.session_state.generated_contract
+    for issue in st.session_state.contract_issues:
+        st.warning(f"Revisa el contrato: {issue['detail']}.")
+    pending = undefined_values(contract_text)
+    if pending:
+        st.warning(f"Hay {pending} datos marcados como [POR DEFINIR]: complétalos en el formulario o en el documento final.")
     st.text_area("Contrato generado", value=contract_text, height=600, key="contract_display")
 
     # Botones de descarga
@@ -247,24 +488,16 @@ def render_review():
     col_d1, col_d2, col_d3 = st.columns(3)
 
     with col_d1:
-        docx_bytes = contract_to_docx(contract_text)
-        st.download_button(
-            "Descargar Word (.docx)",
-            data=docx_bytes,
-            file_name=f"{base_name}.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            use_container_width=True,
+        render_export_button(
+            "docx",
+            "Word (.docx)",
+            contract_text,
+            f"{base_name}.docx",
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         )
 
     with col_d2:
-        pdf_bytes = contract_to_pdf(contract_text)
-        st.download_button(
-            "Descargar PDF",
-            data=pdf_bytes,
-            file_name=f"{base_name}.pdf",
-            mime="application/pdf",
-            use_container_width=True,
-        )
+        render_export_button("pdf", "PDF", contract_text, f"{base_name}.pdf", "application/pdf")
 
     with col_d3:
         st.download_button(
@@ -282,6 +515,7 @@ def render_review():
     with col1:
         if st.button("Regenerar contrato", use_container_width=True):
             st.session_state.generated_contract = None
+            st.session_state.bypass_cache = True
             st.rerun()
 
     with col2:
@@ -309,8 +543,13 @@ def render_chat():
         with st.chat_message(msg["role"]):
             st.write(msg["content"])
 
+    # Corrección de los cambios en segundo plano; mientras corre no se aceptan otros
+    busy = st.session_state.generation_job is not None
+    if busy:
+        render_generation_job()
+
     # Input del usuario
-    user_input = st.chat_input("Escribe tu pregunta o solicitud de cambio...")
+    user_input = st.chat_input("Escribe tu pregunta o solicitud de cambio...", disabled=busy)
 
     if user_input:
         st.session_state.chat_history.append({"role": "user", "content": user_input})
@@ -319,25 +558,70 @@ def render_chat():
             st.write(user_input)
 
         with st.chat_message("assistant"):
-            with st.spinner("Analizando..."):
-                try:
-                    api_key = get_api_key()
-                    response = review_contract(
-                        st.session_state.generated_contract,
-                        user_input,
-                        api_key=api_key,
-                    )
-                    st.write(response)
-                    st.session_state.chat_history.append(
-                        {"role": "assistant", "content": response}
-                    )
-
-                    # Si la respuesta parece ser un contrato modificado, actualizarlo
-                    if len(response) > 2000 and "CONTRATO" in response.upper():
-                        st.session_state.generated_contract = response
-                        st.success("El contrato ha sido actualizado con los cambios.")
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            try:
+                api_key = get_api_key()
+                contract = st.session_state.generated_contract
+                # La respuesta corre en el event loop de JOBS, fuera del hilo del script
+                produce = partial(
+                    areview_contract_edits_stream,
+                    contract,
+                    user_input,
+                    api_key=api_key,
+                    index=st.session_state.clause_index,
+                )
+                key = hashlib.sha256(f"{contract}\0{user_input}".encode("utf-8")).hexdigest()
+                job = JOBS.submit(f"chat:{account_key(api_key)}:{key}", produce, kind="review", deadline=CHAT_DEADLINE)
+                # Se muestra solo la respuesta; las operaciones de edición se aplican localmente
+                st.write_stream(hide_edits_block(follow_job(job)))
+                reply = parse_review_reply(job.text)
+                st.session_state.chat_history.append(
+                    {"role": "assistant", "content": reply["answer"]}
+                )
+
+                if reply["edits"]:
+                    contract = apply_edits(st.session_state.generated_contract, reply["edits"])
+                    # Un dato que ya no aparece puede ser justo el cambio pedido: solo se
+                    # corrigen los huecos sin rellenar y la numeración
+                    form_data = st.session_state.generated_from or st.session_state.form_data
+                    issues = validate_contract(contract, st.session_state.contract_type, form_data)
+                    fixable = [issue for issue in issues if issue["kind"] != "missing_value"]
+                    if any(issue["kind"] in MODEL_REPAIRS for issue in fixable):
+                        # Las cláusulas con huecos se corrigen como trabajo; el fragmento entrega el resultado
+                        start_repair_job(contract, fixable, form_data, None)
+                    elif fixable:
+                        # Solo numeración: se corrige localmente, sin esperar al modelo
+                        contract = repair_contract(contract, st.session_state.contract_type, form_data, issues=fixable)
+                    st.session_state.generated_contract = contract
+                    st.session_state.contract_issues = [issue for issue in issues if issue["kind"] == "missing_value"]
+                    st.success("El contrato ha sido actualizado con los cambios.")
+                    if st.session_state.generation_job is not None:
+                        render_generation_job()
+            except EditError as e:
+                st.error(f"No se pudieron aplicar los cambios al contrato: {e}")
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+
+def render_admin_panel():
+    """Latencias p50/p95 y tokens por operación y tipo de contrato (telemetría local)."""
+    with st.expander("Rendimiento (admin)"):
+        rows = summarize(load_records())
+        if not rows:
+            st.caption("Aún no hay registros de telemetría.")
+            return
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        spend = {}
+        for row in rows:
+            if row["span"] == "llm_call":
+                spend[row["contract_type"]] = spend.get(row["contract_type"], 0) + row["prompt_tokens"] + row["completion_tokens"]
+        for contract_type, tokens in spend.items():
+            st.caption(f"Tokens totales ({contract_type}): {tokens:,}")
+        usage = usage_summary()
+        if usage["calls"]:
+            st.caption(
+                f"Caché de prompts: {usage['cache_hit_ratio']:.0%} de {usage['prompt_tokens']:,} tokens de entrada "
+                f"servidos desde caché ({usage['calls']} llamadas recientes)"
+            )
 
 
 def render_sidebar():
@@ -394,8 +678,32 @@ def render_sidebar():
         st.divider()
 
         if st.session_state.contract_type:
-            tipo = "Servicios Independientes" if st.session_state.contract_type == "servicios" else "Arrendamiento"
-            st.write(f"**Contrato:** {tipo}")
+            st.write(f"**Contrato:** {TEMPLATES.get(st.session_state.contract_type).short_name}")
+
+        with st.expander("Diagnóstico"):
+            stats = export_cache_stats()
+            st.caption(
+                f"Caché de exportación: {stats['hits']} aciertos, "
+                f"{stats['misses']} fallos, {stats['entries']} documentos"
+            )
+            shared = clause_cache.stats()
+            st.caption(f"Cláusulas compartidas entre clientes: {shared['entries']} guardadas, {shared['hits']} reutilizadas")
+            jobs = JOBS.stats()
+            st.caption(f"Trabajos de generación: {jobs['running']} en curso, {jobs['queued']} en cola")
+            quota = SCHEDULER.stats()
+            st.caption(
+                f"Cuota OpenAI: {sum(quota['waiting'].values())} peticiones en espera, "
+                f"{quota['rate_limited']} respuestas 429, {quota['retries']} reintentos"
+            )
+            conn = connection_stats()
+            st.caption(
+                f"Conexiones OpenAI: {conn['requests']} peticiones, "
+                f"{conn['new_connections']} conexiones nuevas, "
+                f"~{conn['saved_seconds']:.2f} s ahorrados por reutilización"
+            )
+
+        if SHOW_ADMIN_PANEL:
+            render_admin_panel()
 
         st.divider()
         st.caption(
@@ -0,0 +1,214 @@
+"""
+Generación de contratos por lotes, sin interfaz.
+
+Lee un archivo JSONL con un contrato por línea, valida cada registro contra
+contract_fields y genera los contratos en paralelo. Escribe los archivos
+(.txt/.docx/.pdf) y un manifiesto manifest.jsonl en el directorio de salida.
+Si el proceso se interrumpe, al volver a ejecutarlo se omiten los registros que
+ya terminaron bien; las peticiones en curso se cancelan (no se paga por
+respuestas que nadie va a leer). --deadline limita los segundos por contrato.
+Las peticiones del lote tienen la prioridad más baja ante la cuota de OpenAI.
+
+Formato de cada línea:
+    {"id": "freelancer-001", "contract_type": "servicios",
+     "form_data": {...}, "special_instructions": "..."}
+
+Uso:
+    python batch.py contratos.jsonl --out salida/ --workers 4 [--deadline 300]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+from agent import GENERATION_MODES, agenerate_contract
+from contract_fields import validate_form_data
+from export import contract_to_docx, contract_to_pdf
+from scheduler import BACKGROUND, priority
+
+MANIFEST_NAME = "manifest.jsonl"
+FORMATS = ("txt", "docx", "pdf")
+
+
+def load_records(path: str) -> list[dict]:
+    """Lee el JSONL; las líneas vacías se ignoran y los ids faltantes se derivan del número de línea."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = {"_error": f"JSON inválido: {e}"}
+            if not isinstance(record, dict):
+                record = {"_error": "Cada línea debe ser un objeto JSON"}
+            record.setdefault("id", f"linea-{line_number}")
+            records.append(record)
+    return records
+
+
+def safe_name(record_id: str) -> str:
+    """Nombre de archivo seguro a partir del id del registro."""
+    return re.sub(r"[^\w.-]+", "_", str(record_id)).strip("._") or "contrato"
+
+
+def validate_record(record: dict) -> list[str]:
+    if "_error" in record:
+        return [record["_error"]]
+    form_data = record.get("form_data")
+    if not isinstance(form_data, dict):
+        return ["El registro debe incluir form_data como objeto"]
+    return validate_form_data(record.get("contract_type"), form_data)
+
+
+def load_finished(out_dir: str) -> set[str]:
+    """Ids que el manifiesto registra como terminados correctamente (la última entrada manda)."""
+    status = {}
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Línea truncada por una interrupción a mitad de escritura
+                continue
+            status[entry["id"]] = entry
+    return {
+        record_id
+        for record_id, entry in status.items()
+        if entry["status"] == "ok" and all(os.path.exists(os.path.join(out_dir, name)) for name in entry["files"])
+    }
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Escribe a un archivo temporal y lo renombra, para no dejar archivos a medias."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def process_record(record: dict, out_dir: str, formats: list[str], mode: str, deadline: float | None = None) -> dict:
+    """Genera y guarda un contrato; devuelve la entrada del manifiesto."""
+    started = time.perf_counter()
+    entry = {"id": record["id"], "contract_type": record.get("contract_type"), "files": []}
+
+    errors = validate_record(record)
+    if errors:
+        return {**entry, "status": "invalid", "error": "; ".join(errors), "seconds": 0.0}
+
+    try:
+        contract = await agenerate_contract(
+            record["contract_type"],
+            record["form_data"],
+            record.get("special_instructions", ""),
+            mode=mode,
+            deadline=deadline,
+        )
+        base = safe_name(record["id"])
+        exporters = {
+            "txt": lambda text: text.encode("utf-8"),
+            "docx": contract_to_docx,
+            "pdf": contract_to_pdf,
+        }
+        for fmt in formats:
+            name = f"{base}.{fmt}"
+            # La exportación es trabajo de CPU: fuera del event loop
+            data = await asyncio.to_thread(exporters[fmt], contract)
+            _write_atomic(os.path.join(out_dir, name), data)
+            entry["files"].append(name)
+    except TimeoutError:
+        return {**entry, "status": "error", "error": f"Se agotó el plazo de {deadline:g} s",
+                "seconds": round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        return {**entry, "status": "error", "error": f"{type(e).__name__}: {e}",
+                "seconds": round(time.perf_counter() - started, 3)}
+
+    return {**entry, "status": "ok", "seconds": round(time.perf_counter() - started, 3)}
+
+
+def run_batch(input_path: str, out_dir: str, workers: int = 4, formats: list[str] | None = None, mode: str = "clauses", deadline: float | None = None) -> dict:
+    """
+    Procesa el archivo de entrada y devuelve un resumen con los conteos por estado.
+
+    Cada resultado se agrega al manifiesto en cuanto termina, de modo que una
+    interrupción solo pierde los registros que estaban en curso (y cancela sus
+    peticiones).
+    """
+    return asyncio.run(_run_batch(input_path, out_dir, workers, formats, mode, deadline))
+
+
+async def _run_batch(input_path: str, out_dir: str, workers: int, formats: list[str] | None, mode: str, deadline: float | None) -> dict:
+    formats = formats or list(FORMATS)
+    os.makedirs(out_dir, exist_ok=True)
+    records = load_records(input_path)
+    seen = set()
+    duplicates = {r["id"] for r in records if r["id"] in seen or seen.add(r["id"])}
+    if duplicates:
+        raise ValueError(f"Ids duplicados en la entrada: {', '.join(sorted(map(str, duplicates)))}")
+
+    finished = load_finished(out_dir)
+    pending = [r for r in records if r["id"] not in finished]
+
+    summary = {"total": len(records), "skipped": len(records) - len(pending), "ok": 0, "error": 0, "invalid": 0}
+    semaphore = asyncio.Semaphore(workers)
+    started = time.perf_counter()
+
+    async def _limited(record: dict) -> dict:
+        async with semaphore:
+            return await process_record(record, out_dir, formats, mode, deadline)
+
+    with open(os.path.join(out_dir, MANIFEST_NAME), "a", encoding="utf-8") as manifest:
+        # Las tareas heredan la prioridad de fondo: ceden la cuota a las sesiones interactivas
+        with priority(BACKGROUND):
+            tasks = [asyncio.create_task(_limited(record)) for record in pending]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                entry = await next_done
+                manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                manifest.flush()
+                os.fsync(manifest.fileno())
+                summary[entry["status"]] += 1
+                print(f"[{entry['status']}] {entry['id']} ({entry['seconds']} s)"
+                      + (f": {entry['error']}" if entry.get("error") else ""), flush=True)
+        finally:
+            # Ctrl+C cancela esta corrutina: cancelar también las peticiones en curso y las
+            # que no han empezado; las terminadas ya están en el manifiesto
+            for task in tasks:
+                task.cancel()
+
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 2)
+    summary["per_minute"] = round(summary["ok"] / elapsed * 60, 2) if elapsed else 0.0
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Genera contratos por lotes a partir de un archivo JSONL.")
+    parser.add_argument("input", help="Archivo JSONL con un contrato por línea")
+    parser.add_argument("--out", default="salida", help="Directorio de salida (default: salida)")
+    parser.add_argument("--workers", type=int, default=4, help="Contratos generados en paralelo (default: 4)")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Formatos a escribir, separados por coma")
+    parser.add_argument("--mode", choices=GENERATION_MODES, default="clauses", help="Modo de generación")
+    parser.add_argument("--deadline", type=float, help="Segundos máximos por contrato (default: sin límite)")
+    args = parser.parse_args(argv)
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"Formatos no soportados: {', '.join(sorted(unknown))}")
+
+    summary = run_batch(args.input, args.out, args.workers, formats, args.mode, args.deadline)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary["error"] == 0 and summary["invalid"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
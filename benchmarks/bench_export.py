@@ -0,0 +1,62 @@
+"""
+Benchmark del camino de exportación: _parse_lines, contract_to_docx y contract_to_pdf.
+
+Mide tiempo (mejor y mediana) y memoria pico sobre contratos sintéticos de
+distintos tamaños. Las funciones se llaman sin caché de análisis, para medir el
+trabajo completo de cada exportación.
+
+Uso:
+    python benchmarks/bench_export.py [--sizes 10,100,1000] [--repeat 3] [--out resultados.json]
+"""
+
+import argparse
+
+from common import measure, synthetic_contract, write_results
+
+import export
+
+DEFAULT_SIZES = (10, 100, 1000)
+
+
+def _uncached(fn):
+    """Limpia la memoización del análisis antes de cada llamada."""
+    def run(text):
+        export._parse_lines.cache_clear()
+        return fn(text)
+    return run
+
+
+CASES = {
+    "parse_lines": export._parse_lines.__wrapped__,
+    "docx": _uncached(export.contract_to_docx),
+    "pdf": _uncached(export.contract_to_pdf),
+}
+
+
+def run(sizes=DEFAULT_SIZES, repeat: int = 3) -> dict:
+    """Resultados por caso y tamaño: {"docx@100kb": {"best_ms": ..., "peak_kb": ...}, ...}."""
+    results = {}
+    for size_kb in sizes:
+        text = synthetic_contract(size_kb)
+        for name, fn in CASES.items():
+            key = f"{name}@{size_kb}kb"
+            results[key] = measure(lambda: fn(text), repeat=repeat)
+            results[key]["input_kb"] = round(len(text.encode("utf-8")) / 1024, 1)
+            print(f"{key:>20}: {results[key]['best_ms']:10.1f} ms  pico {results[key]['peak_kb']:10,.0f} KB", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Tamaños en KB, separados por coma")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="Archivo JSON de salida (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    path = write_results({"export": run(sizes, args.repeat)}, args.out)
+    print(f"Resultados en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark de extremo a extremo de generate_contract con un cliente OpenAI simulado.
+
+Recorre cada tipo de contrato y modo de generación, con y sin streaming, sin
+red ni API key: el cliente simulado (stub_openai.py) responde con texto
+derivado del prompt y una latencia configurable. Los cachés de generación y
+de cláusulas compartidas se omiten (use_cache=False) y la telemetría se
+escribe en un directorio temporal.
+
+Uso:
+    python benchmarks/bench_generation.py [--ttft 0.3] [--token-ms 0.2] [--repeat 3] [--out resultados.json]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+_TMP = tempfile.mkdtemp(prefix="bench_generation_")
+os.environ.setdefault("GENERATION_CACHE_PATH", os.path.join(_TMP, "generations.sqlite3"))
+os.environ.setdefault("CLAUSE_CACHE_PATH", os.path.join(_TMP, "clauses.sqlite3"))
+os.environ.setdefault("TELEMETRY_PATH", os.path.join(_TMP, "telemetry.jsonl"))
+
+from common import measure, sample_form_data, write_results  # noqa: E402
+
+import agent  # noqa: E402
+from stub_openai import StubOpenAI  # noqa: E402
+from template_registry import TEMPLATES  # noqa: E402
+
+
+def run(ttft: float = 0.3, token_latency: float = 0.0002, repeat: int = 3) -> dict:
+    """Resultados por caso: {"servicios/clauses/stream": {"best_ms", "median_ms", "ttft_ms", "calls", ...}}."""
+    stub = StubOpenAI(ttft=ttft, token_latency=token_latency)
+    agent._get_client = lambda api_key=None: stub
+
+    results = {}
+    for contract_type in TEMPLATES.types():
+        data = sample_form_data(contract_type)
+        for mode in agent.GENERATION_MODES:
+            for stream in (False, True):
+                key = f"{contract_type}/{mode}/{'stream' if stream else 'sync'}"
+                first_token = []
+
+                def once():
+                    started = time.perf_counter()
+                    if stream:
+                        chunks = []
+                        for delta in agent.generate_contract_stream(contract_type, data, mode=mode, use_cache=False):
+                            if not chunks:
+                                first_token.append((time.perf_counter() - started) * 1000)
+                            chunks.append(delta)
+                        return "".join(chunks)
+                    return agent.generate_contract(contract_type, data, mode=mode, use_cache=False)
+
+                calls_before = stub.calls
+                result = measure(once, repeat=repeat, memory=False)
+                result["calls"] = (stub.calls - calls_before) // repeat
+                result["output_chars"] = len(once())
+                if first_token:
+                    result["ttft_ms"] = round(min(first_token), 3)
+                results[key] = result
+                print(f"{key:>32}: {result['best_ms']:9.1f} ms  {result['calls']:3d} llamadas"
+                      + (f"  primer fragmento {result['ttft_ms']:.1f} ms" if "ttft_ms" in result else ""), flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ttft", type=float, default=0.3, help="Segundos al primer token por petición")
+    parser.add_argument("--token-ms", type=float, default=0.2, help="Milisegundos por token generado")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="Archivo JSON de salida (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    results = run(args.ttft, args.token_ms / 1000, args.repeat)
+    path = write_results({"generation": results}, args.out)
+    print(f"Resultados en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark del clasificador de líneas de export.py.
+
+Compara el análisis anterior (hasta cinco re.match sin compilar por línea y una
+lista de dicts) con el clasificador compilado actual, sobre un contrato
+sintético grande construido a partir de la plantilla de servicios.
+
+Uso:
+    python benchmarks/bench_parse.py [--size-kb 1000] [--repeat 5]
+"""
+
+import argparse
+import re
+import timeit
+
+from common import synthetic_contract
+
+from export import _parse_lines
+
+
+def legacy_parse_lines(contract_text: str) -> list[dict]:
+    """Copia del análisis anterior, como línea base."""
+    lines = contract_text.split("\n")
+    parsed = []
+
+    heading_patterns = [
+        r"^D\s*E\s*C\s*L\s*A\s*R\s*A\s*C\s*I\s*O\s*N\s*E\s*S",
+        r"^C\s*L\s*[ÁA]\s*U\s*S\s*U\s*L\s*A\s*S",
+        r"^(PRIMERA|SEGUNDA|TERCERA|CUARTA|QUINTA|SEXTA|SÉPTIMA|OCTAVA|NOVENA|"
+        r"DÉCIM[AO]|UNDÉCIM[AO]|DUODÉCIM[AO]|VIGÉSIM[AO])\b",
+        r"^[IVX]+\.\s+Declara",
+        r"^III\.\s+Declaran",
+    ]
+
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            parsed.append({"type": "blank", "text": ""})
+            continue
+        if stripped.upper().startswith("CONTRATO DE") and len(stripped) < 300:
+            parsed.append({"type": "title", "text": stripped})
+            continue
+        is_heading = False
+        for pattern in heading_patterns:
+            if re.match(pattern, stripped, re.IGNORECASE):
+                is_heading = True
+                break
+        if is_heading:
+            parsed.append({"type": "heading", "text": stripped})
+        else:
+            parsed.append({"type": "body", "text": stripped})
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-kb", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = synthetic_contract(args.size_kb)
+    n_lines = text.count("\n") + 1
+    parse_uncached = _parse_lines.__wrapped__
+
+    # Verificar que ambos clasificadores coinciden antes de medir
+    legacy = [(item["type"], item["text"]) for item in legacy_parse_lines(text)]
+    current = [(line.kind, line.text) for line in parse_uncached(text)]
+    assert legacy == current, "El clasificador compilado no coincide con el anterior"
+
+    results = {}
+    for name, fn in [("legacy", legacy_parse_lines), ("compiled", parse_uncached)]:
+        best = min(timeit.repeat(lambda: fn(text), number=1, repeat=args.repeat))
+        results[name] = best
+        print(f"{name:>10}: {best * 1000:8.1f} ms  ({n_lines / best:,.0f} líneas/s)")
+
+    _parse_lines.cache_clear()
+    _parse_lines(text)
+    cached = min(timeit.repeat(lambda: _parse_lines(text), number=1, repeat=args.repeat))
+    print(f"{'cached':>10}: {cached * 1000:8.3f} ms  (segundo renderizador, misma versión)")
+    print(f"Aceleración compilado vs anterior: {results['legacy'] / results['compiled']:.1f}x "
+          f"sobre {len(text.encode('utf-8')) / 1024:,.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Utilidades compartidas por los benchmarks y las pruebas: contratos sintéticos,
+datos de formulario de ejemplo, medición de tiempo y memoria pico, y escritura
+de resultados en JSON.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def synthetic_contract(size_kb: int, contract_type: str = "servicios") -> str:
+    """Repite la plantilla (normalizada) hasta alcanzar el tamaño pedido."""
+    from template_registry import TEMPLATES
+
+    template = TEMPLATES.get(contract_type).text
+    copies = max(1, size_kb * 1024 // len(template.encode("utf-8")) + 1)
+    return "\n".join(template for _ in range(copies))
+
+
+def sample_form_data(contract_type: str) -> dict:
+    """Datos de ejemplo a partir de los placeholders (o la primera opción) de cada campo."""
+    from template_registry import TEMPLATES
+
+    data = {}
+    for field in TEMPLATES.get(contract_type).fields:
+        if "key" in field:
+            data[field["key"]] = field.get("placeholder") or (field.get("options") or ["1"])[0]
+    return data
+
+
+def measure(fn, repeat: int = 5, memory: bool = True) -> dict:
+    """
+    Ejecuta `fn` `repeat` veces y devuelve tiempos en ms (mejor y mediana).
+
+    La memoria pico se mide en una ejecución aparte con tracemalloc, porque el
+    rastreo hace más lenta la ejecución y alteraría los tiempos.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    result = {"best_ms": round(min(times), 3), "median_ms": round(statistics.median(times), 3), "repeat": repeat}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            result["peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def write_results(results: dict, out_path: str | None = None) -> str:
+    """Guarda los resultados con metadatos del entorno; devuelve la ruta escrita."""
+    commit = git_commit()
+    payload = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if out_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out_path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return out_path
@@ -0,0 +1,228 @@
+"""
+Prueba de carga: N usuarios simultáneos recorren app.py de principio a fin.
+
+Cada usuario es una sesión de Streamlit (streamlit.testing.v1.AppTest) que
+pasa por selección -> formulario -> revisión (espera el trabajo que genera el
+contrato) -> chat, con
+datos distintos para no compartir entradas del caché de generación. AppTest no
+admite varias sesiones simultáneas en un mismo proceso, así que cada sesión
+corre en un proceso de un pool (con la app ya importada). Las peticiones a
+OpenAI van al servidor simulado (mock_server.py), que se levanta en el proceso
+principal salvo que se indique --base-url.
+
+Reporta sesiones por minuto, latencia p50/p95/p99 de cada paso, errores, las
+estadísticas del servidor simulado (429 inyectados incluidos) y el crecimiento
+de memoria residente por sesión (mediana entre sesiones).
+
+Uso:
+    python benchmarks/load_test.py --users 20 [--token-ms 2] [--rate-limit 0.05] [--out resultados.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+# Caché y telemetría de la prueba en un directorio aparte (antes de importar la app)
+_TMP = tempfile.mkdtemp(prefix="load_test_")
+os.environ.setdefault("GENERATION_CACHE_PATH", os.path.join(_TMP, "generations.sqlite3"))
+os.environ.setdefault("CLAUSE_CACHE_PATH", os.path.join(_TMP, "clauses.sqlite3"))
+os.environ.setdefault("TELEMETRY_PATH", os.path.join(_TMP, "telemetry.jsonl"))
+
+from common import ROOT, write_results  # noqa: E402
+
+import mock_server  # noqa: E402
+from telemetry import percentile  # noqa: E402
+from template_registry import TEMPLATES  # noqa: E402
+
+STEPS = ("select", "fill", "review", "chat")
+CHAT_QUESTION = "¿Cuál es la vigencia del contrato?"
+POLL_SECONDS = 0.1
+
+
+def rss_kb() -> int:
+    """Memoria residente actual del proceso en KB (Linux); 0 si no está disponible."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _button(at, label: str):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"No se encontró el botón '{label}'")
+
+
+def _check(at, step: str) -> None:
+    if at.exception:
+        raise RuntimeError(f"{step}: {at.exception[0].value}")
+    if at.error:
+        raise RuntimeError(f"{step}: {at.error[0].value}")
+
+
+def _warm_up() -> None:
+    """Inicializador de cada proceso: importa la app para no medir la carga de módulos."""
+    import agent  # noqa: F401
+    import export  # noqa: F401
+    from streamlit.testing.v1 import AppTest  # noqa: F401
+
+
+def _warm_up_task(_: int) -> None:
+    time.sleep(0.2)
+
+
+def run_session(user: int, contract_type: str, timeout: float) -> dict:
+    """
+    Recorre los cuatro pasos de la app en una sesión nueva.
+
+    Returns:
+        Duración de cada paso en ms, tamaño del contrato y crecimiento de memoria del proceso
+    """
+    from streamlit.testing.v1 import AppTest
+
+    rss_start = rss_kb()
+    timings = {}
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=timeout)
+
+    started = time.perf_counter()
+    at.run()
+    _button(at, f"Seleccionar {TEMPLATES.get(contract_type).short_name}").click().run()
+    _check(at, "select")
+    timings["select"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for field in TEMPLATES.get(contract_type).fields:
+        if "key" not in field:
+            continue
+        widget_key = f"field_{field['key']}"
+        value = f"{field.get('placeholder') or 'Dato'} {user}"
+        if field["type"] == "text":
+            at.text_input(key=widget_key).input(value)
+        elif field["type"] == "textarea":
+            at.text_area(key=widget_key).input(value)
+        elif field["type"] == "number":
+            at.number_input(key=widget_key).set_value(30 + user % 40)
+    at.run()
+    timings["fill"] = (time.perf_counter() - started) * 1000
+
+    # Generar: el rerun lleva a la revisión, que encola la generación; se
+    # consulta como lo haría el fragmento de avance hasta tener el contrato
+    started = time.perf_counter()
+    _button(at, "Generar Contrato").click().run()
+    while at.session_state["generation_job"] is not None:
+        _check(at, "review")
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("review: la generación no terminó a tiempo")
+        time.sleep(POLL_SECONDS)
+        at.run()
+    _check(at, "review")
+    if not at.session_state["generated_contract"]:
+        raise RuntimeError("review: no se generó el contrato")
+    timings["review"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    _button(at, "Modificar / Preguntar al agente").click().run()
+    at.chat_input[0].set_value(CHAT_QUESTION).run()
+    _check(at, "chat")
+    timings["chat"] = (time.perf_counter() - started) * 1000
+
+    timings["contract_chars"] = len(at.session_state["generated_contract"])
+    timings["rss_kb"] = rss_kb() - rss_start
+    return timings
+
+
+def run(users: int = 10, concurrency: int | None = None, ttft: float = 0.3, token_latency: float = 0.002, rate_limit: float = 0.0, base_url: str | None = None, timeout: float = 600) -> dict:
+    """Ejecuta la carga y devuelve el resumen."""
+    server = None
+    if base_url is None:
+        config = mock_server.MockConfig(ttft=ttft, token_latency=token_latency, rate_limit=rate_limit, seed=0)
+        server = mock_server.serve(config, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "local")
+
+    types = TEMPLATES.types()
+    results, errors = [], []
+    workers = concurrency or users
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_warm_up) as pool:
+        # Arrancar y calentar todos los procesos antes de medir
+        list(pool.map(_warm_up_task, range(workers)))
+        started = time.perf_counter()
+        futures = {pool.submit(run_session, user, types[user % len(types)], timeout): user for user in range(users)}
+        for future, user in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(f"usuario {user}: {type(e).__name__}: {e}")
+        elapsed = time.perf_counter() - started
+
+    server_stats = {}
+    try:
+        with urllib.request.urlopen(base_url.rstrip("/") + "/stats", timeout=5) as response:
+            server_stats = json.load(response)
+    except (OSError, ValueError):
+        pass
+    if server is not None:
+        server.shutdown()
+
+    summary = {
+        "users": users,
+        "completed": len(results),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "sessions_per_minute": round(len(results) / elapsed * 60, 2) if elapsed else 0.0,
+        "rss_per_session_kb": percentile([r["rss_kb"] for r in results], 50),
+        "server": server_stats,
+        "steps": {},
+    }
+    for step in STEPS:
+        values = [r[step] for r in results]
+        summary["steps"][step] = {
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+            "p99_ms": round(percentile(values, 99), 1),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10, help="Sesiones simuladas")
+    parser.add_argument("--concurrency", type=int, help="Sesiones simultáneas (default: todas)")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Segundos al primer token (servidor simulado)")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="Milisegundos por token (servidor simulado)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Proporción de respuestas 429")
+    parser.add_argument("--base-url", help="Usar un servidor ya levantado en lugar del simulado interno")
+    parser.add_argument("--timeout", type=float, default=600, help="Segundos máximos por paso")
+    parser.add_argument("--out", help="Archivo JSON de salida (default: benchmarks/results/)")
+    args = parser.parse_args()
+
+    summary = run(args.users, args.concurrency, args.ttft, args.token_ms / 1000, args.rate_limit, args.base_url, args.timeout)
+    for step, stats in summary["steps"].items():
+        print(f"{step:>8}: p50 {stats['p50_ms']:9.1f} ms  p95 {stats['p95_ms']:9.1f} ms  p99 {stats['p99_ms']:9.1f} ms")
+    print(f"{summary['completed']}/{summary['users']} sesiones en {summary['seconds']} s "
+          f"({summary['sessions_per_minute']} por minuto), {summary['rss_per_session_kb']:,.0f} KB por sesión")
+    for error in summary["errors"]:
+        print(f"  error: {error}")
+    path = write_results({"load": summary}, args.out)
+    print(f"Resultados en {path}")
+
+
+if __name__ == "__main__":
+    # Las tareas del pool deben referirse al módulo importable y no a __main__,
+    # que AppTest reemplaza por app.py dentro de cada proceso
+    import load_test
+
+    load_test.main()
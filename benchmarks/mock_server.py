@@ -0,0 +1,244 @@
+"""
+Servidor local compatible con el endpoint de chat completions de OpenAI.
+
+Sustituye a la API real en pruebas de carga: responde con el mismo texto que
+stub_openai.echo_responder (la cláusula o plantilla del prompt), con latencia
+configurable por token, streaming SSE, respuestas 429 inyectadas y truncamiento
+por max_tokens (finish_reason "length"). Puede además reproducir respuestas
+grabadas o reenviar las peticiones a una API real y grabar lo que responde.
+
+Para usarlo con la app o el agente:
+    python benchmarks/mock_server.py --port 8787 --token-ms 5
+    OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=local streamlit run app.py
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import ROOT  # noqa: F401  (agrega la raíz del repo a sys.path)
+
+from stub_openai import CHARS_PER_TOKEN, echo_responder
+
+
+def request_key(messages: list[dict]) -> str:
+    """Llave de grabación: hash de los mensajes de la petición."""
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class MockConfig:
+    """Parámetros del servidor y estado compartido entre hilos (grabaciones y contadores)."""
+
+    def __init__(self, ttft: float = 0.3, token_latency: float = 0.005, tokens_per_chunk: int = 4, rate_limit: float = 0.0, replay: str | None = None, record: str | None = None, upstream: str | None = None, upstream_key: str | None = None, seed: int | None = None):
+        self.ttft = ttft
+        self.token_latency = token_latency
+        self.tokens_per_chunk = tokens_per_chunk
+        self.rate_limit = rate_limit
+        self.record = record
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.upstream_key = upstream_key
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "replayed": 0, "upstream": 0, "streamed": 0}
+        self.recorded: dict[str, str] = {}
+        if replay:
+            with open(replay, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recorded[entry["key"]] = entry["content"]
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+
+    def should_rate_limit(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.rate_limit
+
+    def save(self, key: str, content: str) -> None:
+        with self.lock:
+            self.recorded[key] = content
+            if self.record:
+                with open(self.record, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "content": content}, ensure_ascii=False) + "\n")
+
+
+def _fetch_upstream(config: MockConfig, body: dict) -> str:
+    payload = {**body, "stream": False}
+    payload.pop("stream_options", None)
+    request = urllib.request.Request(
+        f"{config.upstream}/chat/completions",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {config.upstream_key}"},
+    )
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return json.load(response)["choices"][0]["message"]["content"]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: MockConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/stats", "/v1/stats"):
+            with self.config.lock:
+                self._send_json(200, dict(self.config.stats))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = self.config
+        config.count("requests")
+
+        if config.should_rate_limit():
+            config.count("rate_limited")
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (simulado)", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"Retry-After": "1", "retry-after-ms": "500"},
+            )
+            return
+
+        messages = body.get("messages", [])
+        key = request_key(messages)
+        if key in config.recorded:
+            config.count("replayed")
+            content = config.recorded[key]
+        elif config.upstream:
+            config.count("upstream")
+            content = _fetch_upstream(config, body)
+            config.save(key, content)
+        else:
+            content = echo_responder(messages)
+            if config.record:
+                config.save(key, content)
+
+        tokens = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)]
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            finish_reason = "length"
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model", "mock")}
+
+        if body.get("stream"):
+            config.count("streamed")
+            self._stream(base, tokens, finish_reason, usage, bool((body.get("stream_options") or {}).get("include_usage")))
+            return
+
+        time.sleep(config.ttft + config.token_latency * len(tokens))
+        self._send_json(200, {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+    def _stream(self, base: dict, tokens: list[str], finish_reason: str, usage: dict, include_usage: bool) -> None:
+        config = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(payload) -> None:
+            event = f"data: {payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(event):X}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta: dict, finish: str | None) -> dict:
+            return {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+        try:
+            time.sleep(config.ttft)
+            send(chunk({"role": "assistant", "content": ""}, None))
+            step = config.tokens_per_chunk
+            for i in range(0, len(tokens), step):
+                if config.token_latency:
+                    time.sleep(config.token_latency * step)
+                send(chunk({"content": "".join(tokens[i:i + step])}, None))
+            send(chunk({}, finish_reason))
+            if include_usage:
+                send({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente canceló la respuesta
+            pass
+
+
+def serve(config: MockConfig, host: str = "127.0.0.1", port: int = 8787) -> ThreadingHTTPServer:
+    """Crea el servidor (sin arrancarlo); usar serve_forever() o un hilo."""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Segundos al primer token")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="Milisegundos por token")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Proporción de peticiones que reciben 429")
+    parser.add_argument("--replay", help="JSONL de respuestas grabadas a reproducir")
+    parser.add_argument("--record", help="JSONL donde grabar las respuestas servidas")
+    parser.add_argument("--upstream", help="URL base de una API real a la que reenviar (p. ej. https://api.openai.com/v1)")
+    parser.add_argument("--upstream-key", help="API key para --upstream")
+    parser.add_argument("--seed", type=int, help="Semilla para la inyección de 429")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        ttft=args.ttft,
+        token_latency=args.token_ms / 1000,
+        rate_limit=args.rate_limit,
+        replay=args.replay,
+        record=args.record,
+        upstream=args.upstream,
+        upstream_key=args.upstream_key,
+        seed=args.seed,
+    )
+    server = serve(config, args.host, args.port)
+    print(f"Servidor simulado en http://{args.host}:{server.server_port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
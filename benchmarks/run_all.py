@@ -0,0 +1,66 @@
+"""
+Ejecuta todos los benchmarks y guarda un solo JSON; opcionalmente lo compara con otro.
+
+La comparación usa el mejor tiempo de cada caso y marca como regresión todo
+caso más lento que el umbral; el código de salida es 1 si hay regresiones, para
+poder usarlo en CI.
+
+Uso:
+    python benchmarks/run_all.py [--quick] [--out actual.json] [--compare base.json] [--threshold 0.10]
+"""
+
+import argparse
+import json
+
+from common import write_results
+
+import bench_export
+import bench_generation
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Casos cuyo mejor tiempo empeoró más que `threshold` (proporción)."""
+    regressions = []
+    for suite, cases in current.items():
+        for case, result in cases.items():
+            before = baseline.get(suite, {}).get(case)
+            if not before or not before.get("best_ms"):
+                continue
+            change = result["best_ms"] / before["best_ms"] - 1
+            marker = "REGRESIÓN" if change > threshold else ""
+            print(f"{suite}/{case:>32}: {before['best_ms']:10.1f} -> {result['best_ms']:10.1f} ms  ({change:+.1%}) {marker}")
+            if change > threshold:
+                regressions.append(f"{suite}/{case}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quick", action="store_true", help="Tamaños y repeticiones reducidos")
+    parser.add_argument("--out", help="Archivo JSON de salida (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Empeoramiento tolerado (default: 0.10)")
+    args = parser.parse_args()
+
+    sizes = (10, 100) if args.quick else bench_export.DEFAULT_SIZES
+    repeat = 1 if args.quick else 3
+    results = {
+        "export": bench_export.run(sizes, repeat),
+        "generation": bench_generation.run(ttft=0.05 if args.quick else 0.3, repeat=repeat),
+    }
+    path = write_results(results, args.out)
+    print(f"Resultados en {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nComparación con {baseline.get('commit', '?')} ({args.compare}):")
+        regressions = compare(baseline["results"], results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regresiones: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+"""
+Cliente OpenAI simulado para medir el pipeline sin red.
+
+Imita la parte de la interfaz que usa agent.py (chat.completions.create, con y
+sin stream) y responde con texto plausible derivado del propio prompt: al
+adaptar una cláusula devuelve el fragmento recibido y al generar un contrato
+devuelve la plantilla, de modo que el volumen de tokens es realista. Una
+petición de continuación recibe el resto del texto, repitiendo la línea que
+quedó a medias como lo haría un modelo real. Como la API, corta la respuesta en
+max_tokens (finish_reason "length"). La
+latencia se simula con un tiempo al primer token más un costo por token.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from agent import CONTINUE_PROMPT, MARKERS_NOTE
+
+CHARS_PER_TOKEN = 4
+
+
+def echo_responder(messages: list[dict]) -> str:
+    """Respuesta canned: el fragmento o la plantilla del prompt, sin notas ni datos."""
+    if len(messages) > 2 and messages[-1]["content"] == CONTINUE_PROMPT and messages[-2]["role"] == "assistant":
+        full = echo_responder(messages[:-2])
+        written = messages[-2]["content"]
+        if full.startswith(written):
+            return full[written.rfind("\n") + 1:]
+    for message in messages[1:]:
+        content = message["content"]
+        if content.startswith("PLANTILLA BASE"):
+            return content.split("\n", 1)[1].split(MARKERS_NOTE)[0].strip()
+        if "FRAGMENTO (" in content:
+            # Adaptación (seguida de la nota de marcadores) o corrección (seguida de los problemas)
+            return content.split("):\n", 1)[1].split(MARKERS_NOTE)[0].split("\n\nPROBLEMAS DETECTADOS:")[0].strip()
+    return "Respuesta simulada."
+
+
+def _usage(messages: list[dict], reply: str) -> SimpleNamespace:
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    return SimpleNamespace(
+        prompt_tokens=prompt_chars // CHARS_PER_TOKEN,
+        completion_tokens=len(reply) // CHARS_PER_TOKEN,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+    )
+
+
+class _Completions:
+    def __init__(self, owner: "StubOpenAI"):
+        self._owner = owner
+
+    def create(self, *, model: str, messages: list[dict], stream: bool = False, **kwargs):
+        owner = self._owner
+        with owner._lock:
+            owner.calls += 1
+        reply = owner.responder(messages)
+        tokens = [reply[i:i + CHARS_PER_TOKEN] for i in range(0, len(reply), CHARS_PER_TOKEN)]
+        # Como la API: la respuesta se corta en max_tokens
+        finish_reason = "stop"
+        max_tokens = kwargs.get("max_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            reply = "".join(tokens)
+            finish_reason = "length"
+        usage = _usage(messages, reply)
+        if stream:
+            return self._stream(tokens, usage, kwargs.get("stream_options"), finish_reason)
+
+        time.sleep(owner.ttft + owner.token_latency * len(tokens))
+        choice = SimpleNamespace(message=SimpleNamespace(content=reply), finish_reason=finish_reason)
+        return SimpleNamespace(choices=[choice], usage=usage)
+
+    def _stream(self, tokens: list[str], usage, stream_options: dict | None, finish_reason: str):
+        owner = self._owner
+        time.sleep(owner.ttft)
+        step = owner.tokens_per_chunk
+        for i in range(0, len(tokens), step):
+            if owner.token_latency:
+                time.sleep(owner.token_latency * step)
+            delta = SimpleNamespace(content="".join(tokens[i:i + step]))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+        done = SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason=finish_reason)
+        yield SimpleNamespace(choices=[done], usage=None)
+        if stream_options and stream_options.get("include_usage"):
+            yield SimpleNamespace(choices=[], usage=usage)
+
+
+class StubOpenAI:
+    """
+    Sustituto en proceso del cliente OpenAI.
+
+    Args:
+        ttft: segundos hasta el primer token de cada petición
+        token_latency: segundos por token generado
+        tokens_per_chunk: tokens por fragmento en modo stream
+        responder: función messages -> texto de respuesta
+    """
+
+    def __init__(self, ttft: float = 0.3, token_latency: float = 0.0, tokens_per_chunk: int = 4, responder=echo_responder):
+        self.ttft = ttft
+        self.token_latency = token_latency
+        self.tokens_per_chunk = tokens_per_chunk
+        self.responder = responder
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_Completions(self))
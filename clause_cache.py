@@ -0,0 +1,183 @@
+"""
+Caché de cláusulas adaptadas, compartido entre clientes.
+
+Las cláusulas que solo dependen del negocio del cliente (campos "adaptive" de
+contract_fields, p. ej. OBJETO o NO COMPETENCIA) quedan iguales para dos
+clientes del mismo giro. Aquí se guarda el texto adaptado de cada una junto con
+el perfil de actividad que lo produjo. Los datos personales no entran: se
+rellenan después con los marcadores {{clave}}.
+
+La búsqueda prueba primero la firma exacta del perfil (términos normalizados,
+sin acentos, mayúsculas, orden ni palabras de relleno) y después los perfiles
+parecidos del mismo fragmento: cada campo debe tener una similitud coseno de al
+menos SIMILARITY_THRESHOLD con el guardado, y además la cláusula guardada debe
+nombrar todas las actividades del formulario y ninguna otra. La cláusula repite
+las actividades del cliente, así que solo se reutiliza entre descripciones que
+dicen lo mismo.
+
+Las entradas caducan por antigüedad (TTL) y, al superar el límite, se descartan
+las usadas hace más tiempo (LRU). Se puede precalentar con una lista de giros
+comunes (ver warm_clauses.py).
+"""
+
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import Counter
+from contextlib import closing
+
+from clause_index import tokenize
+from generation_cache import text_hash
+
+CACHE_PATH = os.getenv(
+    "CLAUSE_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "clauses.sqlite3"),
+)
+MAX_ENTRIES = int(os.getenv("CLAUSE_CACHE_MAX_ENTRIES", "2000"))
+TTL_SECONDS = int(os.getenv("CLAUSE_CACHE_TTL", str(90 * 24 * 3600)))
+SIMILARITY_THRESHOLD = float(os.getenv("CLAUSE_CACHE_SIMILARITY", "0.9"))
+
+# Solo artículos y preposiciones: "no", "sin" o "excepto" cambian el sentido y cuentan
+PROFILE_STOPWORDS = {
+    "a", "al", "con", "de", "del", "e", "el", "en", "la", "las", "lo", "los", "o", "para",
+    "por", "u", "un", "una", "unos", "unas", "y", "etc",
+}
+
+
+def _connect() -> sqlite3.Connection:
+    """Abre una conexión nueva; SQLite serializa las escrituras entre hilos y procesos."""
+    os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS clauses (
+            scope TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            clause TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, signature)
+        )"""
+    )
+    return conn
+
+
+def make_scope(contract_type: str, segment_id: str, segment_text: str, model: str, prompt_version: str) -> str:
+    """Lo que debe coincidir, además del perfil, para reutilizar una cláusula: fragmento, modelo y prompts."""
+    payload = {
+        "contract_type": contract_type,
+        "segment_id": segment_id,
+        "segment_hash": text_hash(segment_text),
+        "model": model,
+        "prompt_version": prompt_version,
+    }
+    return text_hash(json.dumps(payload, sort_keys=True, ensure_ascii=False))
+
+
+def profile(data: dict) -> dict[str, dict[str, int]]:
+    """Términos normalizados de cada campo del negocio (campo -> término -> frecuencia)."""
+    return {
+        key: dict(sorted(Counter(tokenize(str(value), PROFILE_STOPWORDS, min_length=1)).items()))
+        for key, value in sorted(data.items())
+        if value
+    }
+
+
+def signature(terms: dict[str, dict[str, int]]) -> str:
+    return text_hash(json.dumps(terms, sort_keys=True, ensure_ascii=False))
+
+
+def _cosine(a: dict[str, int], b: dict[str, int]) -> float:
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def similarity(a: dict[str, dict[str, int]], b: dict[str, dict[str, int]]) -> float:
+    """Similitud entre dos perfiles: la del campo menos parecido (0 si no tienen los mismos campos)."""
+    if a.keys() != b.keys():
+        return 0.0
+    return min((_cosine(a[key], b[key]) for key in a), default=1.0)
+
+
+def _covers(clause: str, terms: dict[str, dict[str, int]], stored: dict[str, dict[str, int]]) -> bool:
+    """
+    Si una cláusula escrita para el perfil `stored` sirve para `terms`: no
+    menciona actividades que el cliente no declaró y nombra todas las que sí.
+    """
+    written = set(tokenize(clause, PROFILE_STOPWORDS, min_length=1))
+    return all(
+        stored[key].keys() <= field.keys() and field.keys() <= written
+        for key, field in terms.items()
+    )
+
+
+def lookup(scope: str, data: dict) -> str | None:
+    """
+    Cláusula guardada para un perfil igual o suficientemente parecido, o None.
+
+    Un perfil parecido solo se acepta si la cláusula guardada cubre exactamente
+    las actividades del formulario (ver _covers): OBJETO o NO COMPETENCIA las
+    citan, y una actividad de más o de menos cambia el alcance del contrato.
+    """
+    terms = profile(data)
+    key = signature(terms)
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        row = conn.execute(
+            "SELECT signature, clause FROM clauses WHERE scope = ? AND signature = ? AND created >= ?",
+            (scope, key, now - TTL_SECONDS),
+        ).fetchone()
+        if row is None:
+            best = (SIMILARITY_THRESHOLD, None)
+            for candidate, stored, clause in conn.execute(
+                "SELECT signature, profile, clause FROM clauses WHERE scope = ? AND created >= ?",
+                (scope, now - TTL_SECONDS),
+            ):
+                stored = json.loads(stored)
+                score = similarity(terms, stored)
+                if score >= best[0] and _covers(clause, terms, stored):
+                    best = (score, (candidate, clause))
+            row = best[1]
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE clauses SET accessed = ?, hits = hits + 1 WHERE scope = ? AND signature = ?",
+            (now, scope, row[0]),
+        )
+    return row[1]
+
+
+def store(scope: str, data: dict, clause: str) -> None:
+    """Guarda la cláusula adaptada para el perfil de `data` y aplica los límites de antigüedad y entradas."""
+    terms = profile(data)
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO clauses (scope, signature, profile, clause, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (scope, signature(terms), json.dumps(terms, ensure_ascii=False), clause, now, now),
+        )
+        conn.execute("DELETE FROM clauses WHERE created < ?", (now - TTL_SECONDS,))
+        conn.execute(
+            """DELETE FROM clauses WHERE rowid IN (
+                SELECT rowid FROM clauses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+            )""",
+            (MAX_ENTRIES,),
+        )
+
+
+def stats() -> dict:
+    """Entradas guardadas y veces que se reutilizaron."""
+    with closing(_connect()) as conn:
+        entries, hits = conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM clauses").fetchone()
+    return {"entries": entries, "hits": hits}
+
+
+def clear() -> None:
+    """Elimina todas las entradas."""
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM clauses")
@@ -0,0 +1,142 @@
+"""
+Índice léxico local (BM25) sobre las cláusulas de un contrato.
+
+Permite responder preguntas en el chat enviando al modelo solo las cláusulas
+relevantes en lugar del contrato completo. El índice se construye una vez por
+versión del contrato y, cuando se aplica una edición, solo se vuelven a
+tokenizar las cláusulas cuyo texto cambió.
+"""
+
+import hashlib
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from clauses import split_clauses
+
+# Palabras demasiado frecuentes en los contratos para distinguir cláusulas
+STOPWORDS = {
+    "que", "los", "las", "del", "por", "con", "para", "una", "uno", "como", "sus", "este",
+    "esta", "ese", "esa", "sin", "sobre", "entre", "cual", "cuales", "dicho", "dicha",
+    "sera", "seran", "podra", "parte", "partes", "contrato", "presente", "clausula",
+    "cualquier", "caso", "ser", "mas", "asi", "son", "han", "hay", "tiene", "significa",
+    "donde", "cuando", "quien",
+}
+
+# Terminaciones que se recortan para agrupar variantes ("pago", "pagar", "pagará")
+_SUFFIXES = re.compile(
+    r"(aciones|acion|amientos|amiento|imientos|imiento|mente|idades|idad|encias|encia|ancias|ancia|"
+    r"ables|able|ando|iendo|aron|ados|adas|ado|ada|idos|idas|ido|ida|ara|era|ira|ar|er|ir|es|as|os|a|e|o|s)$"
+)
+STEM_LENGTH = 6
+# Peso extra de las palabras del título de la cláusula ("NO COMPETENCIA")
+TITLE_WEIGHT = 3
+K1 = 1.5
+B = 0.75
+
+
+def _stem(word: str) -> str:
+    stem = _SUFFIXES.sub("", word)
+    return (stem if len(stem) >= 3 else word)[:STEM_LENGTH]
+
+
+def tokenize(text: str, stopwords: set[str] = STOPWORDS, min_length: int = 3) -> list[str]:
+    """Minúsculas sin acentos, sin palabras vacías y reducidas a una raíz simple."""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    plain = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    return [
+        _stem(word)
+        for word in re.findall(r"[a-z0-9]+", plain)
+        if len(word) >= min_length and word not in stopwords
+    ]
+
+
+class ClauseIndex:
+    """Índice BM25 de las cláusulas de un contrato, actualizable por cláusula."""
+
+    def __init__(self):
+        self.version = None
+        self.segments: list[dict] = []
+        self._docs: dict[str, dict] = {}
+        self._df: Counter = Counter()
+        self._total_length = 0
+
+    def update(self, contract_text: str) -> "ClauseIndex":
+        """Sincroniza el índice con el texto del contrato; solo reindexa cláusulas nuevas o cambiadas."""
+        version = hashlib.sha256(contract_text.encode("utf-8")).hexdigest()
+        if version == self.version:
+            return self
+
+        self.segments = split_clauses(contract_text)
+        current = {}
+        for segment in self.segments:
+            digest = hashlib.sha256(segment["text"].encode("utf-8")).hexdigest()
+            doc = self._docs.get(segment["id"])
+            if doc is None or doc["hash"] != digest:
+                if doc is not None:
+                    self._remove(doc)
+                terms = Counter(tokenize(segment["text"]))
+                for term in tokenize(segment["title"]):
+                    terms[term] += TITLE_WEIGHT
+                doc = {"hash": digest, "terms": terms, "length": sum(terms.values())}
+                self._add(doc)
+            current[segment["id"]] = doc
+
+        for clause_id, doc in self._docs.items():
+            if clause_id not in current:
+                self._remove(doc)
+        self._docs = current
+        self.version = version
+        return self
+
+    def _add(self, doc: dict) -> None:
+        self._df.update(doc["terms"].keys())
+        self._total_length += doc["length"]
+
+    def _remove(self, doc: dict) -> None:
+        self._df.subtract(doc["terms"].keys())
+        self._total_length -= doc["length"]
+
+    def search(self, query: str, k: int = 4) -> list[dict]:
+        """Las `k` cláusulas con mayor puntaje BM25 para la consulta, de mayor a menor."""
+        terms = tokenize(query)
+        n = len(self._docs)
+        if not terms or not n:
+            return []
+        avg_length = self._total_length / n or 1
+        scores = []
+        for segment in self.segments:
+            doc = self._docs[segment["id"]]
+            score = 0.0
+            for term in terms:
+                tf = doc["terms"].get(term, 0)
+                if not tf:
+                    continue
+                df = self._df[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * doc["length"] / avg_length))
+            if score > 0:
+                scores.append((score, segment))
+        scores.sort(key=lambda item: item[0], reverse=True)
+        return [segment for _, segment in scores[:k]]
+
+    def context_for(self, query: str, k: int = 4, max_chars: int = 12000) -> list[dict]:
+        """
+        Encabezado del contrato más las cláusulas relevantes, en el orden del contrato.
+
+        Toma hasta `k` cláusulas por puntaje mientras quepan en `max_chars` (la
+        primera siempre se incluye). Devuelve una lista vacía si ninguna cláusula
+        coincide con la consulta.
+        """
+        selected = set()
+        budget = max_chars
+        for segment in self.search(query, k):
+            if selected and len(segment["text"]) > budget:
+                continue
+            selected.add(segment["id"])
+            budget -= len(segment["text"])
+        if not selected:
+            return []
+        selected.add("encabezado")
+        return [s for s in self.segments if s["id"] in selected]
@@ -0,0 +1,305 @@
+"""
+Segmentación de contratos en cláusulas.
+
+Divide una plantilla (o un contrato generado) en segmentos ordenados:
+encabezado, declaraciones (I, II, III...), cláusulas (PRIMERA...VIGÉSIMA...) y
+cierre de firmas. Cada segmento conserva su texto exacto, incluyendo saltos de
+línea finales, de modo que unir los segmentos reproduce el documento original.
+"""
+
+import re
+import unicodedata
+
+_ORDINAL = (
+    r"PRIMER[AO]|SEGUND[AO]|TERCER[AO]|CUART[AO]|QUINT[AO]|SEXT[AO]|S[ÉE]PTIM[AO]|"
+    r"OCTAV[AO]|NOVEN[AO]|D[ÉE]CIM[AO]|UND[ÉE]CIM[AO]|DUOD[ÉE]CIM[AO]|VIG[ÉE]SIM[AO]|TRIG[ÉE]SIM[AO]"
+)
+
+CLAUSE_HEADING_RE = re.compile(
+    rf"^\[?\s*(?:CL[ÁA]USULA\s+)?((?:{_ORDINAL})(?:\s+(?:{_ORDINAL}))?)\s*(?:\.-?|:|-|–)\s*(.*)$"
+)
+DECLARATIONS_RE = re.compile(r"^D\s*E\s*C\s*L\s*A\s*R\s*A\s*C\s*I\s*O\s*N\s*E\s*S\s*:?$", re.IGNORECASE)
+DECLARATION_RE = re.compile(r"^([IVX]+)\.\s+Declara", re.IGNORECASE)
+CLAUSES_RE = re.compile(r"^C\s*L\s*[ÁA]\s*U\s*S\s*U\s*L\s*A\s*S\s*:?$", re.IGNORECASE)
+CLOSING_RE = re.compile(r"^(EN VIRTUD DE LO ANTERIOR|\[sigue hoja de firmas\])", re.IGNORECASE)
+
+# Huecos que la vinculación local no cubre y que debe resolver el modelo
+PENDING_SLOT_RE = re.compile(r"\[\*\]|\[_+\]|_{3,}|\[[^\]\n]{0,200}\]")
+
+# Temas que la regla 3 de SYSTEM_PROMPT pide adaptar al giro del usuario, más la
+# vigencia, cuyo plazo viene del formulario en arrendamiento
+ADAPTABLE_TOPICS = re.compile(
+    r"\b(OBJETO|CONTRAPRESTACION|NO COMPETENCIA|USO|ACTIVIDADES EN EL INMUEBLE|"
+    r"INFRAESTRUCTURA|PROPIEDAD Y NO ACCESION|VIGENCIA)\b"
+)
+
+# Caracteres de control que trae la plantilla exportada de Word (salto de página, celdas)
+_CONTROL_CHARS = " \t\r\n\x07\x0b\x0c"
+
+
+def _normalize(text: str) -> str:
+    """Mayúsculas sin acentos, para comparar encabezados."""
+    decomposed = unicodedata.normalize("NFD", text.upper())
+    return "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", _normalize(text).lower()).strip("_")
+
+
+def _classify(line: str) -> tuple[str, str, str, str] | None:
+    """
+    Detecta si una línea abre un segmento nuevo.
+
+    Returns:
+        (id base, padre, encabezado, título) o None si la línea es cuerpo de texto
+    """
+    stripped = line.strip(_CONTROL_CHARS)
+    if not stripped:
+        return None
+    if DECLARATIONS_RE.match(stripped):
+        return "declaraciones", "", stripped, "DECLARACIONES"
+    match = DECLARATION_RE.match(stripped)
+    if match:
+        return f"declaracion_{match.group(1).lower()}", "declaraciones", stripped, f"DECLARACIÓN {match.group(1).upper()}"
+    if CLAUSES_RE.match(stripped):
+        return "clausulas", "", stripped, "CLÁUSULAS"
+    if CLOSING_RE.match(stripped):
+        return "cierre", "", stripped, "FIRMAS"
+    match = CLAUSE_HEADING_RE.match(stripped)
+    if match:
+        title = match.group(2).split(".")[0].strip(" []")
+        return _slug(match.group(1)), "clausulas", stripped, title
+    return None
+
+
+def split_clauses(text: str) -> list[dict]:
+    """
+    Divide el texto en segmentos ordenados.
+
+    Cada segmento es un dict con:
+        id: identificador estable ("encabezado", "declaracion_ii", "septima", "cierre"...)
+        parent: "declaraciones", "clausulas" o "" para segmentos de primer nivel
+        heading: primera línea del segmento
+        title: nombre de la cláusula ("NO COMPETENCIA") o de la sección
+        text: texto exacto del segmento; "".join(s["text"]) reproduce el original
+    """
+    segments = []
+    current = {"id": "encabezado", "parent": "", "heading": "", "title": "ENCABEZADO", "lines": []}
+    seen = {}
+    in_closing = False
+
+    for line in text.splitlines(keepends=True):
+        info = None if in_closing else _classify(line)
+        if info:
+            base_id, parent, heading, title = info
+            seen[base_id] = seen.get(base_id, 0) + 1
+            clause_id = base_id if seen[base_id] == 1 else f"{base_id}_{seen[base_id]}"
+            if current["lines"]:
+                segments.append(current)
+            current = {"id": clause_id, "parent": parent, "heading": heading, "title": title, "lines": []}
+            in_closing = base_id == "cierre"
+        elif not current["heading"] and line.strip(_CONTROL_CHARS):
+            current["heading"] = line.strip(_CONTROL_CHARS)
+        current["lines"].append(line)
+
+    if current["lines"]:
+        segments.append(current)
+
+    for segment in segments:
+        segment["text"] = "".join(segment.pop("lines"))
+    return segments
+
+
+_ORDINAL_VALUES = {
+    "PRIMER": 1, "SEGUND": 2, "TERCER": 3, "CUART": 4, "QUINT": 5, "SEXT": 6, "SEPTIM": 7, "OCTAV": 8,
+    "NOVEN": 9, "DECIM": 10, "UNDECIM": 11, "DUODECIM": 12, "VIGESIM": 20, "TRIGESIM": 30,
+}
+_UNITS = ("", "PRIMERA", "SEGUNDA", "TERCERA", "CUARTA", "QUINTA", "SEXTA", "SÉPTIMA", "OCTAVA", "NOVENA")
+_TENS = ("", "DÉCIMA", "VIGÉSIMA", "TRIGÉSIMA")
+
+
+def clause_number(heading: str) -> int | None:
+    """Número de una cláusula a partir de su encabezado ("DÉCIMA PRIMERA. ..." -> 11), o None."""
+    match = CLAUSE_HEADING_RE.match(heading.strip(_CONTROL_CHARS))
+    if not match:
+        return None
+    return sum(_ORDINAL_VALUES[_normalize(word).rstrip("AO")] for word in match.group(1).split())
+
+
+def ordinal(number: int) -> str:
+    """Ordinal femenino en mayúsculas, con el estilo de las plantillas (11 -> "DÉCIMA PRIMERA")."""
+    if not 0 < number < 40:
+        raise ValueError(f"Número de cláusula fuera de rango: {number}")
+    return " ".join(word for word in (_TENS[number // 10], _UNITS[number % 10]) if word)
+
+
+def join_clauses(segments: list[dict]) -> str:
+    """Reconstruye el documento a partir de sus segmentos."""
+    return "".join(s["text"] for s in segments)
+
+
+def is_adaptable(segment: dict) -> bool:
+    """True si el segmento trata un tema que debe adaptarse al giro del usuario."""
+    return bool(ADAPTABLE_TOPICS.search(_normalize(segment["title"])))
+
+
+def has_pending_slots(text: str) -> bool:
+    """True si el texto conserva huecos sin vincular ([*], [_], ____, [texto opcional])."""
+    return bool(PENDING_SLOT_RE.search(text))
+
+
+def needs_model(segment: dict) -> bool:
+    """True si el segmento debe pasar por el modelo; si no, se copia tal cual."""
+    return is_adaptable(segment) or has_pending_slots(segment["text"])
+
+
+# Referencias a fragmentos que el modelo no necesita reescribir (modo "passthrough")
+CLAUSE_REF_RE = re.compile(r"^[ \t]*\[\[CL[ÁA]USULA ([a-z0-9_]+)\]\][ \t]*$", re.MULTILINE)
+
+
+def clause_ref(segment_id: str) -> str:
+    """Marcador que sustituye a un fragmento en el prompt y en la respuesta del modelo."""
+    return f"[[CLÁUSULA {segment_id}]]"
+
+
+def collapse_segments(segments: list[dict], keep) -> str:
+    """
+    Une los segmentos reemplazando por su marcador los que no cumplen `keep`.
+
+    Se conserva el espaciado final de cada segmento para que el documento
+    expandido quede con los mismos saltos de línea.
+    """
+    parts = []
+    for segment in segments:
+        text = segment["text"]
+        if keep(segment):
+            parts.append(text)
+        else:
+            parts.append(clause_ref(segment["id"]) + text[len(text.rstrip()):])
+    return "".join(parts)
+
+
+def label_segments(segments: list[dict]) -> str:
+    """Une los segmentos anteponiendo a cada uno su marcador, para que el modelo pueda citarlos."""
+    return "".join(f"{clause_ref(s['id'])}\n{s['text']}" for s in segments)
+
+
+def expand_clause_refs(text: str, segments: list[dict]) -> str:
+    """
+    Sustituye cada línea [[CLÁUSULA id]] por el texto del fragmento correspondiente.
+
+    Raises:
+        ValueError: si el texto cita un fragmento que no existe
+    """
+    by_id = {s["id"]: s for s in segments}
+
+    def _expand(match: re.Match) -> str:
+        segment = by_id.get(match.group(1))
+        if segment is None:
+            raise ValueError(f"El modelo citó un fragmento inexistente: {match.group(0).strip()}")
+        return segment["text"].rstrip()
+
+    return CLAUSE_REF_RE.sub(_expand, text)
+
+
+def expand_clause_refs_stream(deltas, segments: list[dict]):
+    """
+    Versión incremental de expand_clause_refs para texto que llega por fragmentos.
+
+    Solo retiene la línea en curso cuando podría ser un marcador (empieza con
+    "["); el resto del texto se entrega en cuanto llega.
+    """
+    pending = ""
+    mid_line = False  # el texto pendiente continúa una línea ya entregada
+    for delta in deltas:
+        pending += delta
+        if mid_line:
+            newline = pending.find("\n")
+            if newline == -1:
+                yield pending
+                pending = ""
+                continue
+            yield pending[:newline + 1]
+            pending = pending[newline + 1:]
+            mid_line = False
+        cut = pending.rfind("\n") + 1
+        tail = pending[cut:].lstrip(" \t")
+        if tail and not tail.startswith("[[") and tail != "[":
+            cut = len(pending)
+            mid_line = True
+        if cut:
+            yield expand_clause_refs(pending[:cut], segments)
+            pending = pending[cut:]
+    if pending:
+        yield pending if mid_line else expand_clause_refs(pending, segments)
+
+
+class EditError(ValueError):
+    """Una operación de edición no pudo aplicarse (cláusula o texto de anclaje no encontrado)."""
+
+
+def _find_span(text: str, find: str) -> tuple[int, int] | None:
+    """Ubica `find` en `text`; si no aparece literal, tolera diferencias de espacios."""
+    start = text.find(find)
+    if start != -1:
+        return start, start + len(find)
+    words = find.split()
+    if not words:
+        return None
+    match = re.search(r"\s+".join(re.escape(w) for w in words), text)
+    return match.span() if match else None
+
+
+def apply_edits(contract_text: str, edits: list[dict]) -> str:
+    """
+    Aplica operaciones de edición acotadas a cláusulas y devuelve el contrato nuevo.
+
+    Operaciones soportadas (los ids son los de split_clauses):
+        {"op": "replace", "clause": id, "find": texto, "text": nuevo}  reemplaza un pasaje
+        {"op": "replace", "clause": id, "text": nuevo}                 reemplaza la cláusula completa
+        {"op": "insert", "after": id, "text": nuevo}                   inserta una cláusula nueva
+        {"op": "delete", "clause": id}                                 elimina la cláusula
+
+    Las operaciones se aplican en orden y de forma atómica: si alguna falla no
+    se modifica nada.
+
+    Raises:
+        EditError: si una cláusula o un texto de anclaje no existe, o la operación es inválida
+    """
+    segments = split_clauses(contract_text)
+
+    def _index(clause_id: str | None) -> int:
+        for i, segment in enumerate(segments):
+            if segment["id"] == clause_id:
+                return i
+        raise EditError(f"No se encontró la cláusula '{clause_id}' en el contrato.")
+
+    for edit in edits:
+        op = edit.get("op")
+        if op == "replace":
+            i = _index(edit.get("clause"))
+            text = segments[i]["text"]
+            new_text = str(edit.get("text", ""))
+            if edit.get("find"):
+                span = _find_span(text, edit["find"])
+                if span is None:
+                    raise EditError(
+                        f"No se encontró el texto a reemplazar en la cláusula '{edit['clause']}': \"{edit['find'][:80]}\""
+                    )
+                segments[i] = {**segments[i], "text": text[:span[0]] + new_text + text[span[1]:]}
+            else:
+                trailing = text[len(text.rstrip()):] or "\n\n"
+                segments[i] = {**segments[i], "text": new_text.strip() + trailing}
+        elif op == "insert":
+            i = _index(edit.get("after"))
+            if not segments[i]["text"].endswith("\n"):
+                segments[i] = {**segments[i], "text": segments[i]["text"] + "\n\n"}
+            new_segment = {"id": f"nueva_{i + 1}", "parent": segments[i]["parent"], "heading": "", "title": "", "text": str(edit.get("text", "")).strip() + "\n\n"}
+            segments.insert(i + 1, new_segment)
+        elif op == "delete":
+            del segments[_index(edit.get("clause"))]
+        else:
+            raise EditError(f"Operación de edición no soportada: {op!r}")
+
+    return join_clauses(segments)
@@ -0,0 +1,254 @@
+"""
+Registro de clientes OpenAI compartidos por todo el proceso.
+
+Crear un cliente por llamada abre un pool de conexiones nuevo y obliga a un
+handshake TCP + TLS en cada petición. Aquí se conserva un cliente por cada
+combinación de API key y URL base, con conexiones keep-alive que se reutilizan
+entre reruns de Streamlit, turnos del chat y sesiones distintas (httpx y el
+cliente de OpenAI son seguros para usarse desde varios hilos).
+
+También se mide cuánto tarda establecer cada conexión nueva, para estimar el
+tiempo ahorrado en las peticiones que reutilizan una conexión abierta.
+
+Los clientes asíncronos (AsyncOpenAI) quedan ligados al event loop en el que
+se usan, así que se conserva uno por loop además de por key y URL base.
+
+Los clientes no reintentan por su cuenta: de eso se encarga scheduler.py, que
+además lee de cada respuesta los encabezados de cuota restante.
+"""
+
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import hashlib
+import os
+import threading
+import time
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from scheduler import SCHEDULER
+
+TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT", "120"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE", "16"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+
+_clients: dict[tuple[str, str], OpenAI] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[str, str], AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "new_connections": 0, "connect_seconds": 0.0}
+# Inicio de la fase de conexión en curso, por hilo (y por tarea en los clientes asíncronos)
+_connecting = threading.local()
+_connecting_async: contextvars.ContextVar[float | None] = contextvars.ContextVar("connecting_async", default=None)
+
+
+def _trace(event: str, info: dict) -> None:
+    """Callback de httpcore: acumula la duración de TCP connect + TLS de las conexiones nuevas."""
+    if event in ("connection.connect_tcp.started", "connection.start_tls.started"):
+        _connecting.started = time.perf_counter()
+    elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        started = getattr(_connecting, "started", None)
+        _connecting.started = None
+        _count_connection(event, started)
+
+
+def _count_connection(event: str, started: float | None) -> None:
+    if started is not None:
+        with _stats_lock:
+            _stats["connect_seconds"] += time.perf_counter() - started
+            if event == "connection.connect_tcp.complete":
+                _stats["new_connections"] += 1
+
+
+def _on_request(request: httpx.Request) -> None:
+    request.extensions["trace"] = _trace
+    with _stats_lock:
+        _stats["requests"] += 1
+
+
+def _on_response(response: httpx.Response) -> None:
+    SCHEDULER.observe(response.headers)
+
+
+async def _atrace(event: str, info: dict) -> None:
+    """Versión de _trace para httpcore asíncrono, que espera un callback awaitable."""
+    if event in ("connection.connect_tcp.started", "connection.start_tls.started"):
+        _connecting_async.set(time.perf_counter())
+    elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        started = _connecting_async.get()
+        _connecting_async.set(None)
+        _count_connection(event, started)
+
+
+async def _aon_request(request: httpx.Request) -> None:
+    request.extensions["trace"] = _atrace
+    with _stats_lock:
+        _stats["requests"] += 1
+
+
+async def _aon_response(response: httpx.Response) -> None:
+    SCHEDULER.observe(response.headers)
+
+
+def _build_client(api_key: str, base_url: str | None) -> OpenAI:
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        max_retries=0,
+    )
+
+
+def _build_async_client(api_key: str, base_url: str | None) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        event_hooks={"request": [_aon_request], "response": [_aon_response]},
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        max_retries=0,
+    )
+
+
+def _resolve(api_key: str | None, base_url: str | None) -> tuple[str, str | None, tuple[str, str]]:
+    """
+    Key y URL base efectivas, y la llave del registro (sin guardar la key en claro).
+
+    Raises:
+        ValueError: si no hay API key
+    """
+    key = api_key or os.getenv("OPENAI_API_KEY")
+    if not key:
+        raise ValueError("No se proporcionó una API key de OpenAI.")
+    base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+    return key, base_url, (hashlib.sha256(key.encode("utf-8")).hexdigest(), base_url or "")
+
+
+def account_key(api_key: str | None = None, base_url: str | None = None) -> str:
+    """Huella de la key y la URL base efectivas, para no compartir trabajos entre cuentas ("" si no hay key)."""
+    try:
+        return hashlib.sha256("\0".join(_resolve(api_key, base_url)[2]).encode("utf-8")).hexdigest()
+    except ValueError:
+        return ""
+
+
+def get_client(api_key: str | None = None, base_url: str | None = None) -> OpenAI:
+    """
+    Devuelve el cliente compartido para la key y la URL base (o las del entorno).
+
+    Raises:
+        ValueError: si no hay API key
+    """
+    key, base_url, registry_key = _resolve(api_key, base_url)
+
+    client = _clients.get(registry_key)
+    if client is None:
+        with _lock:
+            client = _clients.get(registry_key)
+            if client is None:
+                client = _build_client(key, base_url)
+                _clients[registry_key] = client
+    return client
+
+
+def get_async_client(api_key: str | None = None, base_url: str | None = None) -> AsyncOpenAI:
+    """
+    Igual que get_client, pero asíncrono y para el event loop en curso.
+
+    Debe llamarse desde una corrutina; cada loop tiene sus propios clientes.
+
+    Raises:
+        ValueError: si no hay API key
+    """
+    key, base_url, registry_key = _resolve(api_key, base_url)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(registry_key)
+        if client is None:
+            client = _build_async_client(key, base_url)
+            clients[registry_key] = client
+    return client
+
+
+def connection_stats() -> dict:
+    """
+    Peticiones HTTP, conexiones abiertas y tiempo de establecimiento medido.
+
+    `saved_seconds` estima el tiempo ahorrado: peticiones que reutilizaron una
+    conexión multiplicadas por el costo promedio de abrir una nueva.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    reused = max(stats["requests"] - stats["new_connections"], 0)
+    average = stats["connect_seconds"] / stats["new_connections"] if stats["new_connections"] else 0.0
+    return {
+        **stats,
+        "clients": len(_clients),
+        "reused_connections": reused,
+        "avg_connect_seconds": average,
+        "saved_seconds": reused * average,
+    }
+
+
+async def _aclose(clients: list[AsyncOpenAI]) -> None:
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+
+def close_clients() -> None:
+    """
+    Cierra todos los pools de conexiones (al terminar el proceso o en pruebas).
+
+    Los clientes asíncronos se cierran en su propio loop: si sigue corriendo en
+    otro hilo (p. ej. el de jobs.JOBS) se le encarga el cierre y se espera.
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        by_loop = [(loop, list(loop_clients.values())) for loop, loop_clients in _async_clients.items()]
+        _async_clients.clear()
+    for client in clients:
+        client.close()
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    for loop, loop_clients in by_loop:
+        if loop.is_closed() or not loop_clients:
+            continue
+        if loop is current:
+            loop.create_task(_aclose(loop_clients))
+        elif loop.is_running():
+            # Un loop ocupado no debe trabar la salida del proceso
+            with contextlib.suppress(TimeoutError):
+                asyncio.run_coroutine_threadsafe(_aclose(loop_clients), loop).result(timeout=CONNECT_TIMEOUT_SECONDS)
+        else:
+            loop.run_until_complete(_aclose(loop_clients))
+
+
+atexit.register(close_clients)
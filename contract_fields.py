@@ -1,90 +1,141 @@
 """
 Definición de campos para cada tipo de contrato.
 Cada campo tiene: key, label, tipo (text/date/number/select/textarea), placeholder, y si es requerido.
+
+"clauses" lista los fragmentos de la plantilla (ids de clauses.split_clauses)
+que el modelo adapta con el valor del campo: solo esos fragmentos lo reciben en
+su prompt y solo esos se vuelven a adaptar si el campo cambia. Los huecos que se
+rellenan localmente con marcadores {{clave}} (template_binding) no se declaran;
+se detectan en la plantilla. Los campos marcados "adaptive" describen el negocio
+del usuario; los fragmentos que solo dependen de ellos se pueden adaptar antes
+de terminar el formulario. Los marcados "verbatim" (folios, nombres) los
+redacta el modelo pero deben aparecer tal cual en el contrato; validation.py lo
+revisa después de generar.
 """
 
 SERVICIOS_FIELDS = [
     # --- Datos del Prestador ---
     {"section": "Datos del Prestador de Servicios"},
-    {"key": "prestador_nombre", "label": "Nombre completo del prestador", "type": "text", "placeholder": "Juan Pérez López", "required": True},
-    {"key": "prestador_nacionalidad", "label": "Nacionalidad", "type": "text", "placeholder": "Mexicana", "required": True},
-    {"key": "prestador_edad", "label": "Edad", "type": "number", "placeholder": "35", "required": True},
-    {"key": "prestador_estado_civil", "label": "Estado civil", "type": "select", "options": ["Soltero/a", "Casado/a", "Divorciado/a", "Viudo/a", "Unión libre"], "required": True},
-    {"key": "prestador_sexo", "label": "Sexo", "type": "select", "options": ["Masculino", "Femenino"], "required": True},
-    {"key": "prestador_domicilio", "label": "Domicilio del prestador", "type": "text", "placeholder": "Calle, número, colonia, ciudad, estado, C.P.", "required": True},
+    {"key": "prestador_nombre", "label": "Nombre completo del prestador", "type": "text", "placeholder": "Juan Pérez López", "required": True, "clauses": ["cierre"]},
+    {"key": "prestador_nacionalidad", "label": "Nacionalidad", "type": "text", "placeholder": "Mexicana", "required": True, "clauses": []},
+    {"key": "prestador_edad", "label": "Edad", "type": "number", "placeholder": "35", "required": True, "clauses": []},
+    {"key": "prestador_estado_civil", "label": "Estado civil", "type": "select", "options": ["Soltero/a", "Casado/a", "Divorciado/a", "Viudo/a", "Unión libre"], "required": True, "clauses": ["declaracion_i"]},
+    {"key": "prestador_sexo", "label": "Sexo", "type": "select", "options": ["Masculino", "Femenino"], "required": True, "clauses": ["declaracion_i"]},
+    {"key": "prestador_domicilio", "label": "Domicilio del prestador", "type": "text", "placeholder": "Calle, número, colonia, ciudad, estado, C.P.", "required": True, "clauses": []},
 
     # --- Datos del Cliente ---
     {"section": "Datos del Cliente (Empresa)"},
-    {"key": "cliente_tipo_sociedad", "label": "Tipo de sociedad", "type": "text", "placeholder": "Sociedad Anónima de Capital Variable", "required": True},
-    {"key": "cliente_escritura_numero", "label": "Número de escritura pública", "type": "text", "placeholder": "12345", "required": True},
-    {"key": "cliente_escritura_fecha", "label": "Fecha de escritura (día/mes/año)", "type": "text", "placeholder": "15 de marzo de 2020", "required": True},
-    {"key": "cliente_notario_nombre", "label": "Nombre del notario", "type": "text", "placeholder": "Lic. Roberto García", "required": True},
-    {"key": "cliente_notario_numero", "label": "Número de notaría", "type": "text", "placeholder": "55", "required": True},
-    {"key": "cliente_folio_mercantil", "label": "Folio mercantil", "type": "text", "placeholder": "2023010001", "required": False},
-    {"key": "cliente_folio_fecha", "label": "Fecha de inscripción del folio", "type": "text", "placeholder": "20 de abril de 2020", "required": False},
-    {"key": "cliente_representante", "label": "Nombre del representante legal", "type": "text", "placeholder": "María González Ruiz", "required": True},
-    {"key": "cliente_objeto_social", "label": "Objeto social de la empresa", "type": "textarea", "placeholder": "Desarrollo de software y consultoría tecnológica", "required": True},
-    {"key": "cliente_rfc", "label": "RFC de la empresa", "type": "text", "placeholder": "ABC123456XY0", "required": True},
-    {"key": "cliente_domicilio", "label": "Domicilio fiscal del cliente", "type": "text", "placeholder": "Av. Reforma 100, Col. Centro, CDMX, C.P. 06000", "required": True},
+    {"key": "cliente_tipo_sociedad", "label": "Tipo de sociedad", "type": "text", "placeholder": "Sociedad Anónima de Capital Variable", "required": True, "clauses": ["encabezado"]},
+    {"key": "cliente_escritura_numero", "label": "Número de escritura pública", "type": "text", "placeholder": "12345", "required": True, "clauses": []},
+    {"key": "cliente_escritura_fecha", "label": "Fecha de escritura (día/mes/año)", "type": "text", "placeholder": "15 de marzo de 2020", "required": True, "clauses": []},
+    {"key": "cliente_notario_nombre", "label": "Nombre del notario", "type": "text", "placeholder": "Lic. Roberto García", "required": True, "clauses": []},
+    {"key": "cliente_notario_numero", "label": "Número de notaría", "type": "text", "placeholder": "55", "required": True, "clauses": []},
+    {"key": "cliente_folio_mercantil", "label": "Folio mercantil", "type": "text", "placeholder": "2023010001", "required": False, "clauses": []},
+    {"key": "cliente_folio_fecha", "label": "Fecha de inscripción del folio", "type": "text", "placeholder": "20 de abril de 2020", "required": False, "clauses": []},
+    {"key": "cliente_representante", "label": "Nombre del representante legal", "type": "text", "placeholder": "María González Ruiz", "required": True, "clauses": ["cierre"]},
+    {"key": "cliente_objeto_social", "label": "Objeto social de la empresa", "type": "textarea", "placeholder": "Desarrollo de software y consultoría tecnológica", "required": True, "clauses": []},
+    {"key": "cliente_rfc", "label": "RFC de la empresa", "type": "text", "placeholder": "ABC123456XY0", "required": True, "clauses": []},
+    {"key": "cliente_domicilio", "label": "Domicilio fiscal del cliente", "type": "text", "placeholder": "Av. Reforma 100, Col. Centro, CDMX, C.P. 06000", "required": True, "clauses": []},
 
     # --- Giro y actividades del cliente (para adaptar cláusulas) ---
     {"section": "Giro y Actividades del Cliente"},
-    {"key": "cliente_giro", "label": "Giro o industria del cliente", "type": "text", "placeholder": "Ej: Tecnología, Restaurantes, Consultoría, Comercio electrónico...", "required": True},
-    {"key": "cliente_actividades", "label": "Actividades principales del cliente (para cláusula de no competencia)", "type": "textarea", "placeholder": "Ej:\n- Desarrollo y venta de software de contabilidad\n- Consultoría fiscal para PyMEs\n- Operación de plataforma digital de facturación", "required": True},
+    {"key": "cliente_giro", "label": "Giro o industria del cliente", "type": "text", "placeholder": "Ej: Tecnología, Restaurantes, Consultoría, Comercio electrónico...", "required": True, "adaptive": True, "clauses": ["primera", "septima"]},
+    {"key": "cliente_actividades", "label": "Actividades principales del cliente (para cláusula de no competencia)", "type": "textarea", "placeholder": "Ej:\n- Desarrollo y venta de software de contabilidad\n- Consultoría fiscal para PyMEs\n- Operación de plataforma digital de facturación", "required": True, "adaptive": True, "clauses": ["septima"]},
 
     # --- Datos del Contrato ---
     {"section": "Términos del Contrato"},
-    {"key": "servicios_descripcion", "label": "Descripción de los servicios a prestar", "type": "textarea", "placeholder": "Desarrollo de aplicaciones web, consultoría en arquitectura de software...", "required": True},
-    {"key": "honorarios_moneda", "label": "Moneda de pago", "type": "select", "options": ["MXN (Pesos mexicanos)", "USD (Dólares americanos)"], "required": True},
-    {"key": "honorarios_monto", "label": "Monto mensual de honorarios", "type": "text", "placeholder": "25,000.00", "required": True},
-    {"key": "honorarios_monto_letra", "label": "Monto en letra", "type": "text", "placeholder": "Veinticinco mil pesos", "required": True},
-    {"key": "cuenta_bancaria", "label": "Datos de cuenta bancaria para pago", "type": "textarea", "placeholder": "Banco: BBVA\nCLABE: 012345678901234567\nCuenta: 1234567890", "required": True},
-    {"key": "fecha_inicio", "label": "Fecha de inicio del contrato", "type": "text", "placeholder": "1 de marzo de 2026", "required": True},
-    {"key": "fecha_firma", "label": "Fecha de firma del contrato", "type": "text", "placeholder": "26 de febrero de 2026", "required": True},
+    {"key": "servicios_descripcion", "label": "Descripción de los servicios a prestar", "type": "textarea", "placeholder": "Desarrollo de aplicaciones web, consultoría en arquitectura de software...", "required": True, "adaptive": True, "clauses": ["primera"]},
+    {"key": "honorarios_moneda", "label": "Moneda de pago", "type": "select", "options": ["MXN (Pesos mexicanos)", "USD (Dólares americanos)"], "required": True, "clauses": ["tercera"]},
+    {"key": "honorarios_monto", "label": "Monto mensual de honorarios", "type": "text", "placeholder": "25,000.00", "required": True, "clauses": ["tercera"]},
+    {"key": "honorarios_monto_letra", "label": "Monto en letra", "type": "text", "placeholder": "Veinticinco mil pesos", "required": True, "clauses": ["tercera"]},
+    {"key": "cuenta_bancaria", "label": "Datos de cuenta bancaria para pago", "type": "textarea", "placeholder": "Banco: BBVA\nCLABE: 012345678901234567\nCuenta: 1234567890", "required": True, "clauses": []},
+    {"key": "fecha_inicio", "label": "Fecha de inicio del contrato", "type": "text", "placeholder": "1 de marzo de 2026", "required": True, "clauses": []},
+    {"key": "fecha_firma", "label": "Fecha de firma del contrato", "type": "text", "placeholder": "26 de febrero de 2026", "required": True, "clauses": []},
 ]
 
 ARRENDAMIENTO_FIELDS = [
     # --- Datos del Arrendador ---
     {"section": "Datos del Arrendador"},
-    {"key": "arrendador_nombre", "label": "Nombre completo del arrendador", "type": "text", "placeholder": "José Martínez Hernández", "required": True},
-    {"key": "arrendador_nacionalidad", "label": "Nacionalidad", "type": "text", "placeholder": "Mexicano", "required": True},
-    {"key": "arrendador_estado_civil", "label": "Estado civil", "type": "select", "options": ["Soltero/a", "Casado/a", "Divorciado/a", "Viudo/a", "Unión libre"], "required": True},
-    {"key": "arrendador_identificacion", "label": "Número de folio INE", "type": "text", "placeholder": "1234567890123", "required": True},
-    {"key": "arrendador_rfc", "label": "RFC del arrendador", "type": "text", "placeholder": "MAHJ800101AB1", "required": True},
-    {"key": "arrendador_representante", "label": "Representante legal (si aplica)", "type": "text", "placeholder": "Dejar vacío si firma directamente", "required": False},
+    {"key": "arrendador_nombre", "label": "Nombre completo del arrendador", "type": "text", "placeholder": "José Martínez Hernández", "required": True, "clauses": ["cierre"]},
+    {"key": "arrendador_nacionalidad", "label": "Nacionalidad", "type": "text", "placeholder": "Mexicano", "required": True, "clauses": ["declaracion_i"]},
+    {"key": "arrendador_estado_civil", "label": "Estado civil", "type": "select", "options": ["Soltero/a", "Casado/a", "Divorciado/a", "Viudo/a", "Unión libre"], "required": True, "clauses": ["declaracion_i"]},
+    {"key": "arrendador_identificacion", "label": "Número de folio INE", "type": "text", "placeholder": "1234567890123", "required": True, "clauses": []},
+    {"key": "arrendador_rfc", "label": "RFC del arrendador", "type": "text", "placeholder": "MAHJ800101AB1", "required": True, "clauses": []},
+    {"key": "arrendador_representante", "label": "Representante legal (si aplica)", "type": "text", "placeholder": "Dejar vacío si firma directamente", "required": False, "verbatim": True, "clauses": ["encabezado", "declaracion_i", "cierre"]},
 
     # --- Datos del Inmueble ---
     {"section": "Datos del Inmueble"},
-    {"key": "inmueble_descripcion", "label": "Descripción del inmueble/tierras", "type": "textarea", "placeholder": "Tierras denominadas 'El Rancho', ubicadas en...", "required": True},
-    {"key": "inmueble_ubicacion", "label": "Ubicación (municipio, estado)", "type": "text", "placeholder": "Municipio de Juchitán, Oaxaca", "required": True},
-    {"key": "inmueble_superficie", "label": "Superficie total (hectáreas)", "type": "text", "placeholder": "150", "required": True},
-    {"key": "inmueble_escritura", "label": "Número de escritura pública del inmueble", "type": "text", "placeholder": "56789", "required": True},
-    {"key": "inmueble_notario", "label": "Notario y número de notaría", "type": "text", "placeholder": "Lic. Carlos López, Notaría 12, Ciudad de Oaxaca", "required": True},
-    {"key": "inmueble_folio", "label": "Folio mercantil/registral", "type": "text", "placeholder": "2020030045", "required": False},
-    {"key": "inmueble_linderos", "label": "Linderos y colindancias", "type": "textarea", "placeholder": "Norte: 200m, colinda con...\nSur: 180m, colinda con...", "required": True},
+    {"key": "inmueble_descripcion", "label": "Descripción del inmueble/tierras", "type": "textarea", "placeholder": "Tierras denominadas 'El Rancho', ubicadas en...", "required": True, "clauses": ["declaracion_i"]},
+    {"key": "inmueble_ubicacion", "label": "Ubicación (municipio, estado)", "type": "text", "placeholder": "Municipio de Juchitán, Oaxaca", "required": True, "clauses": ["declaracion_i", "decima_novena", "vigesima", "vigesima_tercera"]},
+    {"key": "inmueble_superficie", "label": "Superficie total (hectáreas)", "type": "text", "placeholder": "150", "required": True, "clauses": []},
+    {"key": "inmueble_escritura", "label": "Número de escritura pública del inmueble", "type": "text", "placeholder": "56789", "required": True, "clauses": []},
+    {"key": "inmueble_notario", "label": "Notario y número de notaría", "type": "text", "placeholder": "Lic. Carlos López, Notaría 12, Ciudad de Oaxaca", "required": True, "clauses": ["declaracion_i"]},
+    {"key": "inmueble_folio", "label": "Folio mercantil/registral", "type": "text", "placeholder": "2020030045", "required": False, "verbatim": True, "clauses": ["declaracion_i"]},
+    {"key": "inmueble_linderos", "label": "Linderos y colindancias", "type": "textarea", "placeholder": "Norte: 200m, colinda con...\nSur: 180m, colinda con...", "required": True, "clauses": ["declaracion_i"]},
 
     # --- Datos de la Empresa (Arrendataria) ---
     {"section": "Datos de la Empresa Arrendataria"},
-    {"key": "empresa_nombre", "label": "Razón social de la empresa", "type": "text", "placeholder": "Ej: Distribuidora del Norte S.A. de C.V.", "required": True},
-    {"key": "empresa_escritura", "label": "Número de escritura constitutiva", "type": "text", "placeholder": "98765", "required": True},
-    {"key": "empresa_notario", "label": "Notario y número de notaría", "type": "text", "placeholder": "Lic. Ana Ruiz, Notaría 8, CDMX", "required": True},
-    {"key": "empresa_folio", "label": "Folio mercantil", "type": "text", "placeholder": "2021050078", "required": False},
-    {"key": "empresa_rfc", "label": "RFC de la empresa", "type": "text", "placeholder": "DNO210501XY3", "required": True},
-    {"key": "empresa_representante", "label": "Representante legal", "type": "text", "placeholder": "Lic. Laura Méndez", "required": True},
-    {"key": "empresa_objeto", "label": "Objeto social / giro de la empresa", "type": "textarea", "placeholder": "Ej: Almacenamiento y distribución de productos agrícolas, operación de bodega comercial, restaurante, taller mecánico...", "required": True},
+    {"key": "empresa_nombre", "label": "Razón social de la empresa", "type": "text", "placeholder": "Ej: Distribuidora del Norte S.A. de C.V.", "required": True, "clauses": ["cierre"]},
+    {"key": "empresa_escritura", "label": "Número de escritura constitutiva", "type": "text", "placeholder": "98765", "required": True, "clauses": []},
+    {"key": "empresa_notario", "label": "Notario y número de notaría", "type": "text", "placeholder": "Lic. Ana Ruiz, Notaría 8, CDMX", "required": True, "clauses": ["declaracion_ii"]},
+    {"key": "empresa_folio", "label": "Folio mercantil", "type": "text", "placeholder": "2021050078", "required": False, "verbatim": True, "clauses": ["declaracion_ii"]},
+    {"key": "empresa_rfc", "label": "RFC de la empresa", "type": "text", "placeholder": "DNO210501XY3", "required": True, "clauses": []},
+    {"key": "empresa_representante", "label": "Representante legal", "type": "text", "placeholder": "Lic. Laura Méndez", "required": True, "verbatim": True, "clauses": ["declaracion_ii", "decima_sexta", "cierre"]},
+    {"key": "empresa_objeto", "label": "Objeto social / giro de la empresa", "type": "textarea", "placeholder": "Ej: Almacenamiento y distribución de productos agrícolas, operación de bodega comercial, restaurante, taller mecánico...", "required": True, "adaptive": True, "clauses": ["primera", "sexta", "septima"]},
 
     # --- Uso y proyecto ---
     {"section": "Uso del Inmueble y Proyecto"},
-    {"key": "uso_inmueble", "label": "Uso que se le dará al inmueble", "type": "textarea", "placeholder": "Ej: Instalación de bodega para almacenamiento de mercancía, oficinas administrativas, local comercial, taller de producción...", "required": True},
-    {"key": "infraestructura", "label": "Infraestructura o instalaciones que se construirán/instalarán (si aplica)", "type": "textarea", "placeholder": "Ej: Bodega de 500m², estacionamiento, oficina administrativa. Dejar vacío si se usará tal cual.", "required": False},
-    {"key": "superficie_estimada", "label": "Superficie a ocupar", "type": "text", "placeholder": "Ej: 500 m², 2 hectáreas, todo el inmueble", "required": True},
+    {"key": "uso_inmueble", "label": "Uso que se le dará al inmueble", "type": "textarea", "placeholder": "Ej: Instalación de bodega para almacenamiento de mercancía, oficinas administrativas, local comercial, taller de producción...", "required": True, "adaptive": True, "clauses": ["declaracion_ii", "primera", "sexta", "septima"]},
+    {"key": "infraestructura", "label": "Infraestructura o instalaciones que se construirán/instalarán (si aplica)", "type": "textarea", "placeholder": "Ej: Bodega de 500m², estacionamiento, oficina administrativa. Dejar vacío si se usará tal cual.", "required": False, "adaptive": True, "clauses": ["primera", "tercera", "sexta"]},
+    {"key": "superficie_estimada", "label": "Superficie a ocupar", "type": "text", "placeholder": "Ej: 500 m², 2 hectáreas, todo el inmueble", "required": True, "clauses": ["primera"]},
 
     # --- Términos del Contrato ---
     {"section": "Términos del Arrendamiento"},
-    {"key": "vigencia_anos", "label": "Vigencia inicial (años)", "type": "number", "placeholder": "5", "required": True},
-    {"key": "vigencia_adicional", "label": "Periodos de renovación (si aplica)", "type": "text", "placeholder": "Ej: 2 periodos adicionales de 3 años cada uno", "required": False},
-    {"key": "renta_monto", "label": "Monto de renta mensual", "type": "text", "placeholder": "$15,000.00 MXN mensuales", "required": True},
-    {"key": "renta_moneda", "label": "Moneda", "type": "select", "options": ["MXN (Pesos mexicanos)", "USD (Dólares americanos)"], "required": True},
-    {"key": "deposito_garantia", "label": "Depósito en garantía (si aplica)", "type": "text", "placeholder": "Ej: Equivalente a 2 meses de renta", "required": False},
-    {"key": "fecha_firma", "label": "Fecha de firma", "type": "text", "placeholder": "26 de febrero de 2026", "required": True},
+    {"key": "vigencia_anos", "label": "Vigencia inicial (años)", "type": "number", "placeholder": "5", "required": True, "clauses": ["segunda"]},
+    {"key": "vigencia_adicional", "label": "Periodos de renovación (si aplica)", "type": "text", "placeholder": "Ej: 2 periodos adicionales de 3 años cada uno", "required": False, "clauses": ["segunda"]},
+    {"key": "renta_monto", "label": "Monto de renta mensual", "type": "text", "placeholder": "$15,000.00 MXN mensuales", "required": True, "clauses": ["cuarta"]},
+    {"key": "renta_moneda", "label": "Moneda", "type": "select", "options": ["MXN (Pesos mexicanos)", "USD (Dólares americanos)"], "required": True, "clauses": ["cuarta"]},
+    {"key": "deposito_garantia", "label": "Depósito en garantía (si aplica)", "type": "text", "placeholder": "Ej: Equivalente a 2 meses de renta", "required": False, "clauses": ["cuarta"]},
+    {"key": "fecha_firma", "label": "Fecha de firma", "type": "text", "placeholder": "26 de febrero de 2026", "required": True, "clauses": []},
 ]
+
+FIELDS_BY_TYPE = {
+    "servicios": SERVICIOS_FIELDS,
+    "arrendamiento": ARRENDAMIENTO_FIELDS,
+}
+
+
+def validate_form_data(contract_type: str, form_data: dict) -> list[str]:
+    """
+    Valida un diccionario de datos contra la definición de campos del contrato.
+
+    Returns:
+        Lista de errores legibles; vacía si los datos son válidos
+    """
+    fields = FIELDS_BY_TYPE.get(contract_type)
+    if fields is None:
+        return [f"Tipo de contrato no soportado: {contract_type}"]
+
+    errors = []
+    known = {field["key"]: field for field in fields if "key" in field}
+    for key in form_data:
+        if key not in known:
+            errors.append(f"Campo desconocido: {key}")
+    for key, field in known.items():
+        value = str(form_data.get(key) or "").strip()
+        if field.get("required") and not value:
+            errors.append(f"Falta el campo obligatorio: {key} ({field['label']})")
+        elif value and field["type"] == "select" and value not in field.get("options", []):
+            errors.append(f"Valor inválido para {key}: {value!r} (opciones: {', '.join(field['options'])})")
+        elif value and field["type"] == "number" and not value.isdigit():
+            errors.append(f"El campo {key} debe ser un número entero: {value!r}")
+    return errors
+
+
+def changed_fields(previous: dict, current: dict) -> set[str]:
+    """Claves cuyo valor cambió entre dos envíos del formulario (un campo vacío equivale a uno ausente)."""
+    return {
+        key
+        for key in previous.keys() | current.keys()
+        if str(previous.get(key) or "").strip() != str(current.get(key) or "").strip()
+    }
@@ -2,63 +2,88 @@
 Exportación de contratos a Word (.docx) y PDF.
 """
 
+import hashlib
 import io
 import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from docx import Document
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from fpdf import FPDF
 
+from telemetry import span
 
-def _parse_lines(contract_text: str) -> list[dict]:
+
+# Encabezados de sección: un solo patrón compilado, anclado al inicio de la línea
+_HEADING_RE = re.compile(
+    r"D\s*E\s*C\s*L\s*A\s*R\s*A\s*C\s*I\s*O\s*N\s*E\s*S"
+    r"|C\s*L\s*[ÁA]\s*U\s*S\s*U\s*L\s*A\s*S"
+    r"|(?:PRIMERA|SEGUNDA|TERCERA|CUARTA|QUINTA|SEXTA|SÉPTIMA|OCTAVA|NOVENA|"
+    r"DÉCIM[AO]|UNDÉCIM[AO]|DUODÉCIM[AO]|VIGÉSIM[AO])\b"
+    r"|[IVX]+\.\s+Declara",
+    re.IGNORECASE,
+)
+
+
+class Line:
+    """Línea clasificada del contrato: kind es "title", "heading", "body" o "blank"."""
+
+    __slots__ = ("kind", "text")
+
+    def __init__(self, kind: str, text: str):
+        self.kind = kind
+        self.text = text
+
+    def __repr__(self):
+        return f"Line({self.kind!r}, {self.text[:40]!r})"
+
+
+_BLANK = Line("blank", "")
+
+
+@lru_cache(maxsize=16)
+def _parse_lines(contract_text: str) -> tuple[Line, ...]:
     """
     Analiza el texto del contrato y clasifica cada línea por tipo:
     - title: encabezado principal (CONTRATO DE...)
     - heading: nombre de sección (DECLARACIONES, CLÁUSULAS, PRIMERA., etc.)
     - body: texto normal
     - blank: línea vacía
+
+    El resultado es inmutable y se memoriza por texto, así que el DOCX y el PDF
+    de una misma versión del contrato comparten un solo análisis.
     """
-    lines = contract_text.split("\n")
+    match_heading = _HEADING_RE.match
     parsed = []
+    append = parsed.append
 
-    heading_patterns = [
-        r"^D\s*E\s*C\s*L\s*A\s*R\s*A\s*C\s*I\s*O\s*N\s*E\s*S",
-        r"^C\s*L\s*[ÁA]\s*U\s*S\s*U\s*L\s*A\s*S",
-        r"^(PRIMERA|SEGUNDA|TERCERA|CUARTA|QUINTA|SEXTA|SÉPTIMA|OCTAVA|NOVENA|"
-        r"DÉCIM[AO]|UNDÉCIM[AO]|DUODÉCIM[AO]|VIGÉSIM[AO])\b",
-        r"^[IVX]+\.\s+Declara",
-        r"^III\.\s+Declaran",
-    ]
-
-    for line in lines:
+    for line in contract_text.split("\n"):
         stripped = line.strip()
 
         if not stripped:
-            parsed.append({"type": "blank", "text": ""})
-            continue
-
-        # Título principal
-        if stripped.upper().startswith("CONTRATO DE") and len(stripped) < 300:
-            parsed.append({"type": "title", "text": stripped})
-            continue
-
-        # Headings
-        is_heading = False
-        for pattern in heading_patterns:
-            if re.match(pattern, stripped, re.IGNORECASE):
-                is_heading = True
-                break
-
-        if is_heading:
-            parsed.append({"type": "heading", "text": stripped})
+            append(_BLANK)
+        elif len(stripped) < 300 and stripped[:11].upper() == "CONTRATO DE":
+            # Título principal
+            append(Line("title", stripped))
+        elif match_heading(stripped):
+            append(Line("heading", stripped))
         else:
-            parsed.append({"type": "body", "text": stripped})
+            append(Line("body", stripped))
 
-    return parsed
+    return tuple(parsed)
 
 
 def contract_to_docx(contract_text: str) -> bytes:
     """Convierte el texto del contrato a un documento Word (.docx)."""
+    with span("export", format="docx", chars=len(contract_text)) as record:
+        data = _render_docx(contract_text)
+        record["bytes"] = len(data)
+        return data
+
+
+def _render_docx(contract_text: str) -> bytes:
     doc = Document()
 
     # Configurar márgenes
@@ -77,23 +102,23 @@ def contract_to_docx(contract_text: str) -> bytes:
     parsed = _parse_lines(contract_text)
 
     for item in parsed:
-        if item["type"] == "blank":
+        if item.kind == "blank":
             doc.add_paragraph("")
             continue
 
-        if item["type"] == "title":
+        if item.kind == "title":
             p = doc.add_paragraph()
             p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            run = p.add_run(item["text"])
+            run = p.add_run(item.text)
             run.bold = True
             run.font.size = Pt(13)
             run.font.name = "Arial"
             continue
 
-        if item["type"] == "heading":
+        if item.kind == "heading":
             p = doc.add_paragraph()
             p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-            run = p.add_run(item["text"])
+            run = p.add_run(item.text)
             run.bold = True
             run.font.size = Pt(11)
             run.font.name = "Arial"
@@ -102,7 +127,7 @@ def contract_to_docx(contract_text: str) -> bytes:
         # body
         p = doc.add_paragraph()
         p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-        run = p.add_run(item["text"])
+        run = p.add_run(item.text)
         run.font.size = Pt(11)
         run.font.name = "Arial"
 
@@ -112,6 +137,18 @@ def contract_to_docx(contract_text: str) -> bytes:
     return buffer.getvalue()
 
 
+# Las fuentes estándar del PDF solo cubren Latin-1; equivalentes para la tipografía de Word
+_PDF_CHARS = str.maketrans({
+    "\u201c": '"', "\u201d": '"', "\u2018": "'", "\u2019": "'",
+    "\u2013": "-", "\u2014": "-", "\u2026": "...", "\u2022": "-", "\u00a0": " ",
+})
+
+
+def _pdf_text(text: str) -> str:
+    """Texto representable con Helvetica; lo que no tiene equivalente se sustituye por "?"."""
+    return text.translate(_PDF_CHARS).encode("latin-1", "replace").decode("latin-1")
+
+
 class _ContractPDF(FPDF):
     """PDF con header/footer para contratos legales."""
 
@@ -123,6 +160,13 @@ class _ContractPDF(FPDF):
 
 def contract_to_pdf(contract_text: str) -> bytes:
     """Convierte el texto del contrato a PDF."""
+    with span("export", format="pdf", chars=len(contract_text)) as record:
+        data = _render_pdf(contract_text)
+        record["bytes"] = len(data)
+        return data
+
+
+def _render_pdf(contract_text: str) -> bytes:
     pdf = _ContractPDF()
     pdf.alias_nb_pages()
     pdf.set_auto_page_break(auto=True, margin=25)
@@ -135,25 +179,78 @@ def contract_to_pdf(contract_text: str) -> bytes:
     parsed = _parse_lines(contract_text)
 
     for item in parsed:
-        if item["type"] == "blank":
+        if item.kind == "blank":
             pdf.ln(4)
             continue
 
-        if item["type"] == "title":
+        if item.kind == "title":
             pdf.set_font("Helvetica", "B", 13)
-            pdf.multi_cell(0, 7, item["text"], align="C")
+            pdf.multi_cell(0, 7, _pdf_text(item.text), align="C")
             pdf.ln(3)
             continue
 
-        if item["type"] == "heading":
+        if item.kind == "heading":
             pdf.set_font("Helvetica", "B", 11)
-            pdf.multi_cell(0, 6, item["text"], align="J")
+            pdf.multi_cell(0, 6, _pdf_text(item.text), align="J")
             pdf.ln(2)
             continue
 
         # body
         pdf.set_font("Helvetica", "", 10)
-        pdf.multi_cell(0, 5, item["text"], align="J")
+        pdf.multi_cell(0, 5, _pdf_text(item.text), align="J")
         pdf.ln(1)
 
     return bytes(pdf.output())
+
+
+# --- Caché de exportaciones ---
+# Compartido entre reruns y sesiones de Streamlit (vive a nivel de módulo).
+EXPORT_CACHE_SIZE = 32
+_EXPORTERS = {"docx": contract_to_docx, "pdf": contract_to_pdf}
+_export_cache: OrderedDict[tuple, bytes] = OrderedDict()
+_export_lock = threading.Lock()
+_export_stats = {"hits": 0, "misses": 0}
+
+
+def _export_key(fmt: str, contract_text: str) -> tuple[str, str]:
+    return fmt, hashlib.sha256(contract_text.encode("utf-8")).hexdigest()
+
+
+def is_export_cached(fmt: str, contract_text: str) -> bool:
+    """True si la exportación ya está en caché (no cuenta como acierto ni fallo)."""
+    with _export_lock:
+        return _export_key(fmt, contract_text) in _export_cache
+
+
+def cached_export(fmt: str, contract_text: str) -> bytes:
+    """
+    Exporta el contrato a "docx" o "pdf", reutilizando el resultado si ya se generó.
+
+    La llave es el formato más un hash del texto. Se conservan las
+    EXPORT_CACHE_SIZE más recientes.
+    """
+    if fmt not in _EXPORTERS:
+        raise ValueError(f"Formato de exportación no soportado: {fmt}")
+    key = _export_key(fmt, contract_text)
+    with _export_lock:
+        data = _export_cache.get(key)
+        if data is not None:
+            _export_cache.move_to_end(key)
+            _export_stats["hits"] += 1
+            return data
+        _export_stats["misses"] += 1
+
+    # Se genera fuera del candado para no bloquear a otras sesiones
+    data = _EXPORTERS[fmt](contract_text)
+    with _export_lock:
+        _export_cache[key] = data
+        _export_cache.move_to_end(key)
+        while len(_export_cache) > EXPORT_CACHE_SIZE:
+            _export_cache.popitem(last=False)
+    return data
+
+
+def export_cache_stats() -> dict:
+    """Aciertos, fallos y entradas del caché de exportaciones."""
+    with _export_lock:
+        return {**_export_stats, "entries": len(_export_cache)}
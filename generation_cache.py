@@ -0,0 +1,119 @@
+"""
+Caché persistente de contratos generados.
+
+Guarda en SQLite el texto de cada contrato generado, indexado por un hash de
+todo lo que determina el resultado: tipo de contrato, datos del formulario
+normalizados, instrucciones adicionales, modelo, versión del prompt y hash de
+la plantilla. Las entradas caducan por antigüedad (TTL) y, al superar el límite
+de entradas o de tamaño, se descartan las usadas hace más tiempo (LRU).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+CACHE_PATH = os.getenv(
+    "GENERATION_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "generations.sqlite3"),
+)
+MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "500"))
+MAX_BYTES = int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+TTL_SECONDS = int(os.getenv("GENERATION_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+def _connect() -> sqlite3.Connection:
+    """Abre una conexión nueva; SQLite serializa las escrituras entre hilos y procesos."""
+    os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS generations (
+            key TEXT PRIMARY KEY,
+            contract TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        )"""
+    )
+    return conn
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_form_data(form_data: dict) -> dict:
+    """Quita espacios sobrantes y campos vacíos, para que datos equivalentes compartan llave."""
+    normalized = {}
+    for key, value in form_data.items():
+        value = str(value).strip() if value is not None else ""
+        if value:
+            normalized[key] = value
+    return normalized
+
+
+def make_key(contract_type: str, form_data: dict, special_instructions: str, model: str, prompt_version: str, template_hash: str, mode: str) -> str:
+    """Llave de caché: hash de todos los insumos que determinan el contrato generado."""
+    payload = {
+        "contract_type": contract_type,
+        "form_data": normalize_form_data(form_data),
+        "special_instructions": (special_instructions or "").strip(),
+        "model": model,
+        "prompt_version": prompt_version,
+        "template_hash": template_hash,
+        "mode": mode,
+    }
+    return text_hash(json.dumps(payload, sort_keys=True, ensure_ascii=False))
+
+
+def get(key: str) -> str | None:
+    """Devuelve el contrato guardado bajo `key`, o None si no existe o caducó."""
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        row = conn.execute(
+            "SELECT contract FROM generations WHERE key = ? AND created >= ?",
+            (key, now - TTL_SECONDS),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE generations SET accessed = ? WHERE key = ?", (now, key))
+    return row[0]
+
+
+def put(key: str, contract: str) -> None:
+    """Guarda un contrato y aplica los límites de antigüedad, entradas y tamaño."""
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO generations (key, contract, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, contract, len(contract.encode("utf-8")), now, now),
+        )
+        _evict(conn, now)
+
+
+def _evict(conn: sqlite3.Connection, now: float) -> None:
+    conn.execute("DELETE FROM generations WHERE created < ?", (now - TTL_SECONDS,))
+    conn.execute(
+        """DELETE FROM generations WHERE key IN (
+            SELECT key FROM generations ORDER BY accessed DESC LIMIT -1 OFFSET ?
+        )""",
+        (MAX_ENTRIES,),
+    )
+    # Por tamaño: conservar las más recientes cuya suma acumulada cabe en MAX_BYTES
+    total = 0
+    stale = []
+    for key, size in conn.execute("SELECT key, size FROM generations ORDER BY accessed DESC"):
+        total += size
+        if total > MAX_BYTES:
+            stale.append((key,))
+    if stale:
+        conn.executemany("DELETE FROM generations WHERE key = ?", stale)
+
+
+def clear() -> None:
+    """Elimina todas las entradas."""
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM generations")
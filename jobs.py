@@ -0,0 +1,199 @@
+"""
+Cola de trabajos de generación en segundo plano.
+
+La generación de un contrato puede tardar un minuto; si corre dentro de la
+ejecución del script de Streamlit, ocupa ese hilo y un rerun (o salir de la
+página) la pierde o la duplica. Aquí cada generación es un trabajo con id que
+corre en un pool acotado de hilos. La sesión solo guarda el id y consulta el
+avance; un rerun se vuelve a enganchar al mismo trabajo, y dos peticiones
+idénticas en curso comparten uno solo.
+
+Los trabajos terminados se conservan JOB_TTL segundos para que la sesión
+recoja el resultado. Un trabajo que ya no le interesa a ninguna sesión
+(release) se cancela: los trabajos asíncronos corren en un event loop propio y
+cancelarlos cierra sus conexiones de inmediato; los síncronos se detienen en el
+siguiente fragmento.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import inspect
+import os
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from telemetry import span
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL = float(os.getenv("JOB_TTL", "900"))
+
+QUEUED, RUNNING, DONE, ERROR, CANCELLED = "queued", "running", "done", "error", "cancelled"
+
+
+class Job:
+    """Estado de un trabajo: se actualiza desde el hilo del pool y se lee desde las sesiones."""
+
+    def __init__(self, key: str, kind: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.kind = kind
+        self.status = QUEUED
+        self.error: str | None = None
+        self.created = time.time()
+        self.finished: float | None = None
+        self.subscribers = 1
+        self._chunks: list[str] = []
+        self._lock = threading.Lock()
+        self._future: Future | None = None
+        self._cancelled = threading.Event()
+
+    @property
+    def text(self) -> str:
+        """Texto producido hasta ahora (el resultado completo si el trabajo terminó)."""
+        with self._lock:
+            return "".join(self._chunks)
+
+    @property
+    def in_flight(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def _append(self, delta: str) -> None:
+        with self._lock:
+            self._chunks.append(delta)
+
+    def _cancel(self) -> None:
+        self._cancelled.set()
+        # Un trabajo en cola no llega a empezar; uno asíncrono en curso recibe CancelledError
+        if self._future is not None and self._future.cancel():
+            self.status = CANCELLED
+            self.finished = time.time()
+
+
+class JobQueue:
+    """
+    Trabajos por id sobre un pool de hilos compartido por todas las sesiones.
+
+    Args:
+        workers: trabajos que corren a la vez; el resto espera en la cola
+        ttl: segundos que se conserva un trabajo terminado
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: float = JOB_TTL):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._semaphore = asyncio.Semaphore(workers)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._jobs: dict[str, Job] = {}
+        self._by_key: dict[str, Job] = {}
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, produce: Callable[[], Iterator[str] | AsyncIterator[str]], kind: str = "generate", deadline: float | None = None) -> Job:
+        """
+        Encola `produce`: una función generadora de fragmentos de texto, síncrona
+        o asíncrona (p. ej. un partial de agent.agenerate_contract_stream).
+
+        Si ya hay un trabajo en curso con la misma `key`, la sesión se suma a
+        ese en lugar de crear otro. `deadline` (segundos) solo aplica a los
+        trabajos asíncronos: al vencer se cancelan y quedan con error.
+        """
+        with self._lock:
+            self._purge()
+            job = self._by_key.get(key)
+            if job is not None and job.in_flight:
+                job.subscribers += 1
+                return job
+            job = Job(key, kind)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        # El contexto copiado conserva el trace de telemetría de quien encola
+        if inspect.isasyncgenfunction(produce):
+            job._future = asyncio.run_coroutine_threadsafe(self._arun(job, produce, deadline), self._event_loop())
+        else:
+            job._future = self._pool.submit(contextvars.copy_context().run, self._run, job, produce)
+        return job
+
+    def release(self, job_id: str | None) -> None:
+        """La sesión ya no espera el trabajo; si nadie más lo espera, se cancela."""
+        with self._lock:
+            job = self._jobs.get(job_id) if job_id else None
+            if job is None or not job.in_flight:
+                return
+            job.subscribers -= 1
+            if job.subscribers > 0:
+                return
+        job._cancel()
+
+    def get(self, job_id: str | None) -> Job | None:
+        """Trabajo con ese id, o None si no existe o ya expiró."""
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def stats(self) -> dict:
+        """Trabajos en cola, en curso y terminados (todavía en memoria)."""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, ERROR, CANCELLED)}
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop de los trabajos asíncronos, en un hilo propio que se crea al primer uso."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="job-loop", daemon=True).start()
+            return self._loop
+
+    def _run(self, job: Job, produce: Callable[[], Iterator[str]]) -> None:
+        job.status = RUNNING
+        try:
+            with span("job", kind=job.kind, queued_ms=round((time.time() - job.created) * 1000, 2)):
+                with contextlib.closing(produce()) as deltas:
+                    for delta in deltas:
+                        if job._cancelled.is_set():
+                            # Se registra como "cancelled" y closing() cierra el generador
+                            raise GeneratorExit
+                        job._append(delta)
+            job.status = DONE
+        except GeneratorExit:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = ERROR
+        finally:
+            job.finished = time.time()
+
+    async def _arun(self, job: Job, produce: Callable[[], AsyncIterator[str]], deadline: float | None) -> None:
+        try:
+            async with self._semaphore:
+                job.status = RUNNING
+                with span("job", kind=job.kind, queued_ms=round((time.time() - job.created) * 1000, 2)):
+                    async with asyncio.timeout(deadline):
+                        async with contextlib.aclosing(produce()) as deltas:
+                            async for delta in deltas:
+                                job._append(delta)
+            job.status = DONE
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+        except TimeoutError:
+            job.error = f"Se agotó el plazo de {deadline:g} s"
+            job.status = ERROR
+        except Exception as e:
+            job.error = str(e)
+            job.status = ERROR
+        finally:
+            job.finished = time.time()
+
+    def _purge(self) -> None:
+        """Descarta los trabajos terminados hace más de ttl segundos (con el lock tomado)."""
+        limit = time.time() - self._ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < limit:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+
+JOBS = JobQueue()
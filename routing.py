@@ -0,0 +1,112 @@
+"""
+Enrutamiento de peticiones al modelo según el tipo de tarea.
+
+Cada petición se clasifica en una ruta (generación completa, adaptación de una
+cláusula, pregunta, edición...) y la ruta determina el modelo y el límite de
+tokens de salida. Las preguntas sobre el contrato van a un modelo más rápido;
+la redacción de cláusulas se queda en el modelo principal. La ruta también fija
+la prioridad de la petición ante el límite de cuota (ver scheduler.py): el chat
+se atiende antes que la generación.
+
+Cada ruta se puede ajustar sin tocar código con variables de entorno:
+MODEL_<RUTA> y MAX_TOKENS_<RUTA> (p. ej. MODEL_REVIEW_QA=gpt-4o).
+
+Si se conoce de antemano el largo esperado de la respuesta (p. ej. el de la
+plantilla), route() amplía el límite de salida para que quepa, hasta el máximo
+del modelo; lo que aun así no quepa se completa con continuaciones (ver agent.py).
+"""
+
+import math
+import os
+import re
+
+from scheduler import GENERATE, INTERACTIVE
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+
+# Máximo de tokens de salida que admite el modelo en una sola respuesta
+MAX_OUTPUT_TOKENS = int(os.getenv("OPENAI_MAX_OUTPUT_TOKENS", "16384"))
+# Holgura sobre el largo esperado (la estimación de tokens es aproximada)
+OUTPUT_MARGIN = 1.2
+
+ROUTES = {
+    # Contrato completo en una sola petición
+    "generate_full": {"model": DEFAULT_MODEL, "max_tokens": 16000, "priority": GENERATE},
+    # Contrato con las cláusulas genéricas como marcadores [[CLÁUSULA id]]
+    "generate_passthrough": {"model": DEFAULT_MODEL, "max_tokens": 16000, "priority": GENERATE},
+    # Un fragmento adaptable, en paralelo con los demás (modo "clauses")
+    "adapt_clause": {"model": DEFAULT_MODEL, "max_tokens": 4000, "priority": GENERATE},
+    # Corrección de una cláusula que no pasó la validación local (validation.py)
+    "repair_clause": {"model": DEFAULT_MODEL, "max_tokens": 4000, "priority": GENERATE},
+    # Pregunta sobre el contrato, con solo las cláusulas relevantes
+    "review_qa": {"model": FAST_MODEL, "max_tokens": 1500, "priority": INTERACTIVE},
+    # Modificación como operaciones de edición acotadas a cláusulas
+    "review_edits": {"model": DEFAULT_MODEL, "max_tokens": 4000, "priority": INTERACTIVE},
+    # Revisión que devuelve el contrato completo (review_contract)
+    "review": {"model": DEFAULT_MODEL, "max_tokens": 16000, "priority": INTERACTIVE},
+    "review_passthrough": {"model": DEFAULT_MODEL, "max_tokens": 16000, "priority": INTERACTIVE},
+}
+
+# Ruta de las peticiones de cada modo de generación
+GENERATION_ROUTES = {
+    "clauses": "adapt_clause",
+    "passthrough": "generate_passthrough",
+    "full": "generate_full",
+}
+
+_QUESTION_START = re.compile(
+    r"^\s*(¿|qu[eé]\b|c[oó]mo\b|cu[aá]l(es)?\b|cu[aá]ndo\b|cu[aá]nto|d[oó]nde\b|por\s*qu[eé]\b|"
+    r"para\s*qu[eé]\b|qui[eé]n|explica|expl[ií]came|es\s+v[aá]lid|puedo\b|hay\b|existe)",
+    re.IGNORECASE,
+)
+_EDIT_VERBS = re.compile(
+    r"\b(cambi[aeo]|modific|agreg|a[nñ]ad|elimin|quit[aeo]|reemplaz|sustitu|incluy|redact|corrig|"
+    r"actualiz|ajust|borr|pon(er|gas?)?\b|camb)",
+    re.IGNORECASE,
+)
+
+
+def is_question(text: str) -> bool:
+    """Heurística local: True si el mensaje es una pregunta y no pide modificar el contrato."""
+    if _EDIT_VERBS.search(text):
+        return False
+    return bool(_QUESTION_START.match(text)) or text.strip().endswith("?")
+
+
+def classify_chat(text: str) -> str:
+    """Ruta de un mensaje del chat: "review_qa" para preguntas, "review_edits" para modificaciones."""
+    return "review_qa" if is_question(text) else "review_edits"
+
+
+def route(name: str, expected_tokens: int | None = None) -> dict:
+    """
+    Modelo y límite de salida de una ruta, con los ajustes del entorno aplicados.
+
+    Args:
+        name: nombre de la ruta
+        expected_tokens: largo estimado de la respuesta; si no cabe en el límite
+            de la ruta, éste se amplía (hasta MAX_OUTPUT_TOKENS)
+
+    Returns:
+        {"route": nombre, "model": str, "max_tokens": int, "priority": str}, más
+        "expected_tokens" si se indicó
+
+    Raises:
+        ValueError: si la ruta no existe
+    """
+    if name not in ROUTES:
+        raise ValueError(f"Ruta de modelo desconocida: {name}")
+    config = ROUTES[name]
+    env_name = name.upper()
+    result = {
+        "route": name,
+        "model": os.getenv(f"MODEL_{env_name}", config["model"]),
+        "max_tokens": int(os.getenv(f"MAX_TOKENS_{env_name}", config["max_tokens"])),
+        "priority": config["priority"],
+    }
+    if expected_tokens:
+        needed = math.ceil(expected_tokens * OUTPUT_MARGIN)
+        result["max_tokens"] = max(result["max_tokens"], min(needed, MAX_OUTPUT_TOKENS))
+        result["expected_tokens"] = expected_tokens
+    return result
@@ -0,0 +1,319 @@
+"""
+Planificador de peticiones a OpenAI compartido por todo el proceso.
+
+Todas las sesiones usan la misma API key de la organización, así que los
+límites de peticiones por minuto (RPM) y tokens por minuto (TPM) son comunes.
+Cada petición estima su costo (tokens del prompt + max_tokens, que es lo que
+OpenAI reserva al admitirla) y espera turno en dos cubetas de tokens (token
+bucket) que se rellenan al ritmo de la cuota. Las que esperan se admiten por
+prioridad: el chat interactivo antes que la generación, y ésta antes que el
+trabajo de fondo (especulación y lotes).
+
+Los límites se configuran con OPENAI_RPM / OPENAI_TPM; si no se indican, se
+aprenden de los encabezados x-ratelimit-* de las respuestas. Un 429 pausa la
+admisión de todo el proceso durante el Retry-After (en lugar de que cada hilo
+reintente por su cuenta) y la petición se reintenta con backoff exponencial
+con jitter. Los errores de conexión y 5xx se reintentan igual.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+
+import openai
+
+# Límites por minuto; 0 = aprenderlos de los encabezados de la API
+RPM_LIMIT = int(os.getenv("OPENAI_RPM", "0"))
+TPM_LIMIT = int(os.getenv("OPENAI_TPM", "0"))
+# Fracción de la cuota que se usa (margen para otros procesos con la misma key)
+HEADROOM = float(os.getenv("OPENAI_RATE_HEADROOM", "0.95"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+
+# Prioridades, de mayor a menor
+INTERACTIVE, GENERATE, BACKGROUND = "interactive", "generate", "background"
+PRIORITIES = {INTERACTIVE: 0, GENERATE: 1, BACKGROUND: 2}
+
+# Cada cuánto revisa su turno una petición que no va primero en la fila
+_POLL_SECONDS = 0.05
+
+_RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# Prioridad mínima impuesta por el contexto (p. ej. batch.py: todo es de fondo)
+_priority_floor: ContextVar[str | None] = ContextVar("scheduler_priority", default=None)
+
+
+@contextlib.contextmanager
+def priority(name: str):
+    """
+    Las peticiones lanzadas dentro del bloque (y en las tareas o hilos que
+    hereden su contexto) no tienen más prioridad que `name`.
+
+    Raises:
+        ValueError: si la prioridad no existe
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Prioridad desconocida: {name}")
+    token = _priority_floor.set(name)
+    try:
+        yield
+    finally:
+        _priority_floor.reset(token)
+
+
+def _effective_priority(name: str) -> int:
+    floor = _priority_floor.get()
+    level = PRIORITIES.get(name, PRIORITIES[GENERATE])
+    return max(level, PRIORITIES[floor]) if floor else level
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """Segundos de una duración como las de x-ratelimit-reset-* ("1m30s", "250ms")."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    factors = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * factors[unit] for number, unit in parts)
+
+
+def retry_after(error: Exception) -> float | None:
+    """Segundos que pide esperar la respuesta de error (retry-after-ms, Retry-After o x-ratelimit-reset-*)."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # Retry-After con fecha HTTP: se usa el backoff
+        pass
+    resets = [_parse_duration(headers.get(name)) for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+def _is_retryable(error: Exception) -> bool:
+    # Sin saldo (insufficient_quota) también es 429, pero esperar no lo resuelve
+    return isinstance(error, _RETRYABLE) and getattr(error, "code", None) != "insufficient_quota"
+
+
+class _Bucket:
+    """Cubeta de capacidad `limit` que se rellena a limit/60 por segundo (límite por minuto)."""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.level = limit
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.limit:
+            self.level = min(self.limit, self.level + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    def set_limit(self, limit: float) -> None:
+        if not self.limit:
+            self.level = limit
+        self.limit = limit
+
+    def wait(self, amount: float) -> float:
+        """Segundos hasta tener `amount` disponible (0 si ya lo hay o si no hay límite)."""
+        if not self.limit or self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.limit
+
+
+class RateLimitScheduler:
+    """
+    Admisión de peticiones por cuota y prioridad, para hilos y corrutinas.
+
+    Args:
+        rpm: peticiones por minuto (0 = aprender de los encabezados)
+        tpm: tokens por minuto (0 = aprender de los encabezados)
+        headroom: fracción de la cuota que se usa
+        max_retries: reintentos de una petición ante 429, 5xx o errores de conexión
+    """
+
+    def __init__(self, rpm: int = RPM_LIMIT, tpm: int = TPM_LIMIT, headroom: float = HEADROOM, max_retries: int = MAX_RETRIES):
+        self._configured = {"requests": bool(rpm), "tokens": bool(tpm)}
+        self._headroom = headroom
+        self._requests = _Bucket(rpm * headroom)
+        self._tokens = _Bucket(tpm * headroom)
+        self._max_retries = max_retries
+        self._paused_until = 0.0
+        self._waiting: set[tuple[int, int]] = set()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "rate_limited": 0, "retries": 0, "wait_seconds": 0.0}
+
+    # --- Admisión ---
+
+    def _enqueue(self, priority_name: str) -> tuple[int, int]:
+        ticket = (_effective_priority(priority_name), next(self._sequence))
+        with self._lock:
+            self._waiting.add(ticket)
+        return ticket
+
+    def _leave(self, ticket: tuple[int, int]) -> None:
+        with self._lock:
+            self._waiting.discard(ticket)
+
+    def _try_admit(self, ticket: tuple[int, int], cost: int) -> float:
+        """Admite la petición si es su turno y hay cupo; si no, segundos a esperar antes de reintentar."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if ticket != min(self._waiting):
+                return _POLL_SECONDS
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            # Una petición mayor que la cubeta entera espera a tenerla llena
+            tokens = min(cost, self._tokens.limit) if self._tokens.limit else cost
+            wait = max(self._requests.wait(1), self._tokens.wait(tokens))
+            if wait:
+                return wait
+            if self._requests.limit:
+                self._requests.level -= 1
+            if self._tokens.limit:
+                self._tokens.level -= tokens
+            self._waiting.discard(ticket)
+            self._stats["admitted"] += 1
+            return 0.0
+
+    def acquire(self, cost: int, priority_name: str = GENERATE) -> float:
+        """Bloquea el hilo hasta que la petición sea admitida; devuelve los segundos de espera."""
+        started = time.monotonic()
+        ticket = self._enqueue(priority_name)
+        try:
+            while wait := self._try_admit(ticket, cost):
+                time.sleep(min(wait, 1.0))
+        finally:
+            self._leave(ticket)
+        return self._waited(started)
+
+    async def aacquire(self, cost: int, priority_name: str = GENERATE) -> float:
+        """Versión asíncrona de acquire; cancelar la tarea la saca de la fila."""
+        started = time.monotonic()
+        ticket = self._enqueue(priority_name)
+        try:
+            while wait := self._try_admit(ticket, cost):
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            self._leave(ticket)
+        return self._waited(started)
+
+    def _waited(self, started: float) -> float:
+        waited = time.monotonic() - started
+        with self._lock:
+            self._stats["wait_seconds"] += waited
+        return waited
+
+    # --- Reintentos ---
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        """Espera antes del reintento `attempt`; un 429 además pausa la admisión de todos."""
+        jitter = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        requested = retry_after(error)
+        delay = min(BACKOFF_MAX_SECONDS, requested + jitter * 0.25) if requested is not None else jitter
+        with self._lock:
+            self._stats["retries"] += 1
+            if isinstance(error, openai.RateLimitError):
+                self._stats["rate_limited"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + (requested or delay))
+        return delay
+
+    def call(self, request: Callable[[], object], cost: int, priority_name: str = GENERATE, record: dict | None = None):
+        """
+        Ejecuta `request` (p. ej. client.chat.completions.create) cuando la cuota
+        lo permite, reintentando los errores transitorios.
+
+        `record` (el dict de un tramo de telemetría) recibe la espera y los reintentos.
+        """
+        for attempt in itertools.count():
+            waited = self.acquire(cost, priority_name)
+            self._note(record, waited, attempt)
+            try:
+                return request()
+            except Exception as e:
+                if attempt >= self._max_retries or not _is_retryable(e):
+                    raise
+                time.sleep(self._backoff(e, attempt))
+
+    async def acall(self, request: Callable[[], Awaitable], cost: int, priority_name: str = GENERATE, record: dict | None = None):
+        """Versión asíncrona de call; `request` devuelve un awaitable."""
+        for attempt in itertools.count():
+            waited = await self.aacquire(cost, priority_name)
+            self._note(record, waited, attempt)
+            try:
+                return await request()
+            except Exception as e:
+                if attempt >= self._max_retries or not _is_retryable(e):
+                    raise
+                await asyncio.sleep(self._backoff(e, attempt))
+
+    @staticmethod
+    def _note(record: dict | None, waited: float, attempt: int) -> None:
+        if record is None:
+            return
+        record["rate_wait_ms"] = round(record.get("rate_wait_ms", 0) + waited * 1000, 2)
+        if attempt:
+            record["retries"] = attempt
+
+    # --- Cuota observada ---
+
+    def observe(self, headers) -> None:
+        """
+        Ajusta las cubetas con los encabezados x-ratelimit-* de una respuesta:
+        aprende los límites no configurados y nunca supone más cupo del que la
+        API dice que queda.
+        """
+        with self._lock:
+            now = time.monotonic()
+            for kind, bucket in (("requests", self._requests), ("tokens", self._tokens)):
+                try:
+                    limit = headers.get(f"x-ratelimit-limit-{kind}")
+                    remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                    if limit and not self._configured[kind]:
+                        bucket.refill(now)
+                        bucket.set_limit(int(limit) * self._headroom)
+                    if remaining and bucket.limit:
+                        bucket.refill(now)
+                        bucket.level = min(bucket.level, int(remaining) * self._headroom)
+                except ValueError:
+                    continue
+
+    def stats(self) -> dict:
+        """Límites en uso, cupo disponible, peticiones en espera por prioridad y contadores."""
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            waiting = [level for level, _ in self._waiting]
+            return {
+                **self._stats,
+                "rpm": self._requests.limit,
+                "tpm": self._tokens.limit,
+                "requests_available": self._requests.level,
+                "tokens_available": self._tokens.level,
+                "paused_seconds": max(0.0, self._paused_until - now),
+                "waiting": {name: waiting.count(level) for name, level in PRIORITIES.items()},
+            }
+
+
+SCHEDULER = RateLimitScheduler()
@@ -0,0 +1,146 @@
+"""
+Telemetría de rendimiento: tramos (spans) cronometrados de cada operación.
+
+Cada tramo registra su duración, si terminó bien o con error, y los atributos
+que agregue el código instrumentado (tokens, finish_reason, tiempo al primer
+token, bytes exportados...). Los registros se agregan a un archivo JSONL local
+y a un búfer en memoria que alimenta el panel de administración.
+
+Los tramos de una misma generación comparten un `trace` para poder agruparlos;
+para conservarlo en hilos de un pool, lanzar las tareas con contextvars.copy_context().run.
+"""
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent import futures
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+ENABLED = os.getenv("TELEMETRY_ENABLED", "1") not in ("0", "false", "False", "")
+SINK_PATH = os.getenv(
+    "TELEMETRY_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "telemetry.jsonl"),
+)
+# Al superar este tamaño el archivo se rota a <archivo>.1
+MAX_SINK_BYTES = int(os.getenv("TELEMETRY_MAX_BYTES", str(20 * 1024 * 1024)))
+RECENT_SIZE = 5000
+
+RECENT: deque[dict] = deque(maxlen=RECENT_SIZE)
+_sink_lock = threading.Lock()
+_trace_id: ContextVar[str | None] = ContextVar("telemetry_trace", default=None)
+
+
+def _write(record: dict) -> None:
+    RECENT.append(record)
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _sink_lock:
+        try:
+            os.makedirs(os.path.dirname(SINK_PATH) or ".", exist_ok=True)
+            if os.path.exists(SINK_PATH) and os.path.getsize(SINK_PATH) > MAX_SINK_BYTES:
+                os.replace(SINK_PATH, f"{SINK_PATH}.1")
+            with open(SINK_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            # La telemetría nunca debe interrumpir la operación que mide
+            pass
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Cronometra el bloque y registra el resultado.
+
+    Devuelve el dict del registro para que el bloque agregue atributos. Una
+    excepción se registra con status "error" y se vuelve a lanzar; un generador
+    cerrado antes de terminar, una tarea asyncio cancelada o un trabajo de un
+    pool descartado (concurrent.futures.CancelledError) quedan como "cancelled".
+    """
+    if not ENABLED:
+        yield {}
+        return
+
+    trace = _trace_id.get()
+    token = None
+    if trace is None:
+        trace = uuid.uuid4().hex[:12]
+        token = _trace_id.set(trace)
+    record = {"ts": time.time(), "span": name, "trace": trace, **attrs}
+    started = time.perf_counter()
+    try:
+        yield record
+        record["status"] = "ok"
+    except (GeneratorExit, asyncio.CancelledError, futures.CancelledError):
+        record["status"] = "cancelled"
+        raise
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        if token is not None:
+            try:
+                _trace_id.reset(token)
+            except ValueError:
+                # Un generador finalizado desde otro contexto (p. ej. por el recolector)
+                pass
+        _write(record)
+
+
+def load_records(limit: int = RECENT_SIZE) -> list[dict]:
+    """Últimos registros del archivo (incluye los de ejecuciones anteriores del proceso)."""
+    if not os.path.exists(SINK_PATH):
+        return list(RECENT)[-limit:]
+    records = []
+    with open(SINK_PATH, encoding="utf-8") as f:
+        for line in deque(f, maxlen=limit):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Percentil por rango más cercano (p entre 0 y 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(records: list[dict]) -> list[dict]:
+    """
+    Latencia p50/p95 y tokens por tramo, ruta de modelo y tipo de contrato.
+
+    Returns:
+        Una fila por (span, route, contract_type), ordenadas por nombre de tramo
+    """
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record.get("span"), record.get("route") or "-", record.get("contract_type") or "-")].append(record)
+
+    rows = []
+    for (name, route, contract_type), items in sorted(groups.items(), key=lambda item: tuple(map(str, item[0]))):
+        durations = [r["duration_ms"] for r in items if r.get("status") == "ok"]
+        rows.append({
+            "span": name,
+            "route": route,
+            "contract_type": contract_type,
+            "count": len(items),
+            "errors": sum(1 for r in items if r.get("status") == "error"),
+            "cancelled": sum(1 for r in items if r.get("status") == "cancelled"),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in items),
+            "cached_tokens": sum(r.get("cached_tokens", 0) for r in items),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in items),
+        })
+    return rows
@@ -0,0 +1,102 @@
+"""
+Vinculación local de campos del formulario con los huecos de las plantillas.
+
+Cada plantilla declara una lista de pares (texto a buscar, reemplazo). El texto a
+buscar contiene los huecos originales ([*], [_], ____) con suficiente contexto
+para ser único; el reemplazo usa marcadores {{clave}} con las claves de
+contract_fields. Así la plantilla enviada al modelo no contiene datos del cliente
+(y sigue siendo un prefijo estable para el caché), y los valores se insertan
+localmente después de generar, tal cual los escribió el usuario.
+
+Los huecos que requieren redacción (género gramatical, descripciones libres del
+inmueble, moneda en letra, etc.) se dejan sin vincular para que los complete el modelo.
+"""
+
+import re
+from collections.abc import Iterable, Iterator
+
+MISSING_VALUE = "[POR DEFINIR]"
+
+MARKER_RE = re.compile(r"\{\{(\w+)\}\}")
+
+SERVICIOS_BINDINGS = [
+    ("POR UNA PARTE [PRESTADOR DE SERVICIOS INDEPENDIENTE]A QUIEN", "POR UNA PARTE {{prestador_nombre}}, A QUIEN"),
+    ("REPRESENTADO POR _______________,", "REPRESENTADO POR {{cliente_representante}},"),
+    ("Llamarse [*], ser de nacionalidad [*], tener [*] años de edad,", "Llamarse {{prestador_nombre}}, ser de nacionalidad {{prestador_nacionalidad}}, tener {{prestador_edad}} años de edad,"),
+    ("Tener su domicilio en [*].", "Tener su domicilio en {{prestador_domicilio}}."),
+    ("Es una[*]  constituida", "Es una {{cliente_tipo_sociedad}} constituida"),
+    (
+        "escritura pública número escritura pública número [*]  de fecha [*] de [*] de [*], otorgada ante la fe del Lic. [*], Notario Público No. [*] de",
+        "escritura pública número {{cliente_escritura_numero}} de fecha {{cliente_escritura_fecha}}, otorgada ante la fe del {{cliente_notario_nombre}}, Notario Público No. {{cliente_notario_numero}} de",
+    ),
+    ("folio mercantil número N-[*]  el [*] de [*] de [*].", "folio mercantil número N-{{cliente_folio_mercantil}} el {{cliente_folio_fecha}}."),
+    ("Su objetivo principal es [*].", "Su objetivo principal es {{cliente_objeto_social}}."),
+    (
+        "Su registro federal de contribuyentes es [*]  y señala como domicilio para efectos de este Contrato el ubicado en [*].",
+        "Su registro federal de contribuyentes es {{cliente_rfc}} y señala como domicilio para efectos de este Contrato el ubicado en {{cliente_domicilio}}.",
+    ),
+    ("consistentes en ____________________________,", "consistentes en {{servicios_descripcion}},"),
+    ("la cantidad mensual de $[*] (", "la cantidad mensual de ${{honorarios_monto}} ("),
+    ("como se indica a continuación: [*].", "como se indica a continuación: {{cuenta_bancaria}}."),
+    ("a partir del día [*]y podrá", "a partir del día {{fecha_inicio}} y podrá"),
+    ("Cliente el ______ de ______ de 2022.", "Cliente el {{fecha_firma}}."),
+]
+
+ARRENDAMIENTO_BINDINGS = [
+    ("por una parte, [_], en su carácter de arrendador", "por una parte, {{arrendador_nombre}}, en su carácter de arrendador"),
+    ("y por la otra, [_], en su carácter de arrendatario", "y por la otra, {{empresa_nombre}}, en su carácter de arrendatario"),
+    ("Instituto Nacional Electoral con número de folio [_].", "Instituto Nacional Electoral con número de folio {{arrendador_identificacion}}."),
+    ("superficie total de [_] hectáreas, según lo acredita con la escritura pública número [_],", "superficie total de {{inmueble_superficie}} hectáreas, según lo acredita con la escritura pública número {{inmueble_escritura}},"),
+    # Se aplica a la primera aparición (declaración del Arrendador)
+    ("Su Registro Federal de Contribuyentes es [_].", "Su Registro Federal de Contribuyentes es {{arrendador_rfc}}."),
+    ("Estados Unidos Mexicanos, lo que acredita con la escritura pública número [_],", "Estados Unidos Mexicanos, lo que acredita con la escritura pública número {{empresa_escritura}},"),
+    # Segunda aparición (declaración de la Empresa)
+    ("Su Registro Federal de Contribuyentes es [_].", "Su Registro Federal de Contribuyentes es {{empresa_rfc}}."),
+    ("Dentro de su objeto social se encuentra [_],", "Dentro de su objeto social se encuentra {{empresa_objeto}},"),
+    ("mediante sus respectivos apoderados, el [_] de [_] de 20[_].", "mediante sus respectivos apoderados, el {{fecha_firma}}."),
+]
+
+TEMPLATE_BINDINGS = {
+    "servicios": SERVICIOS_BINDINGS,
+    "arrendamiento": ARRENDAMIENTO_BINDINGS,
+}
+
+
+def bind_template(template: str, bindings: list[tuple[str, str]]) -> str:
+    """
+    Sustituye los huecos declarados por marcadores {{clave}}.
+
+    Cada par se aplica una sola vez, en orden, sobre la primera aparición del
+    texto buscado; los pares que no aparecen en la plantilla se ignoran.
+    """
+    for find, replace in bindings:
+        template = template.replace(find, replace, 1)
+    return template
+
+
+def fill_markers(text: str, data: dict) -> str:
+    """Reemplaza cada {{clave}} por el valor del formulario, o [POR DEFINIR] si falta."""
+    return MARKER_RE.sub(lambda m: str(data.get(m.group(1)) or MISSING_VALUE), text)
+
+
+def fill_markers_stream(deltas: Iterable[str], data: dict) -> Iterator[str]:
+    """
+    Versión incremental de fill_markers para texto que llega por fragmentos.
+
+    Retiene el texto a partir de un "{{" todavía sin cerrar, para no partir un
+    marcador entre dos fragmentos.
+    """
+    pending = ""
+    for delta in deltas:
+        pending += delta
+        cut = pending.rfind("{{")
+        if cut == -1 or "}}" in pending[cut:]:
+            cut = len(pending)
+            # Un "{" suelto al final puede ser el inicio de un marcador
+            if pending.endswith("{"):
+                cut -= 1
+        if cut:
+            yield fill_markers(pending[:cut], data)
+            pending = pending[cut:]
+    if pending:
+        yield fill_markers(pending, data)
@@ -0,0 +1,170 @@
+"""
+Registro de plantillas de contrato.
+
+Carga todas las plantillas una sola vez al importar el módulo. Al cargar:
+normaliza la codificación y los saltos de línea (la plantilla de arrendamiento
+viene de Word con terminadores CR sueltos y caracteres de control), aplica la
+vinculación de campos y precalcula los segmentos y sus tokens estimados. Una
+plantilla solo se vuelve a leer si cambia la fecha de modificación de su
+archivo.
+
+Agregar un tipo de contrato consiste en declarar sus campos y vinculaciones y
+llamar a TEMPLATES.register(); el resto de la aplicación recorre el registro.
+"""
+
+import hashlib
+import os
+import threading
+import unicodedata
+
+from clauses import collapse_segments, needs_model, split_clauses
+from contract_fields import FIELDS_BY_TYPE
+from telemetry import span
+from template_binding import MARKER_RE, TEMPLATE_BINDINGS, bind_template
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+# Caracteres de Word que no aportan al texto: fin de celda y salto de página
+_WORD_CONTROL = str.maketrans({"\x07": "", "\x0c": "\n"})
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token en español)."""
+    return (len(text) + 3) // 4
+
+
+def normalize_template(data: bytes) -> str:
+    """Decodifica (UTF-8, con o sin BOM; si falla, Windows-1252) y normaliza saltos de línea a "\\n"."""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("cp1252")
+    text = text.replace("\r\n", "\n").replace("\r", "\n").translate(_WORD_CONTROL)
+    return unicodedata.normalize("NFC", text)
+
+
+class ContractTemplate:
+    """Una plantilla cargada, con todo lo que se deriva de su texto ya calculado."""
+
+    def __init__(self, contract_type: str, name: str, short_name: str, description: str, filename: str, fields: list[dict], bindings: list[tuple[str, str]]):
+        self.contract_type = contract_type
+        self.name = name
+        self.short_name = short_name
+        self.description = description
+        self.path = os.path.join(TEMPLATES_DIR, filename)
+        self.fields = fields
+        self.bindings = bindings
+        # Campos que describen el negocio y, por fragmento, los campos que el modelo recibe
+        self.adaptive_keys = [f["key"] for f in fields if f.get("adaptive")]
+        self.clause_fields: dict[str, list[str]] = {}
+        for field in fields:
+            for clause_id in field.get("clauses", []):
+                self.clause_fields.setdefault(clause_id, []).append(field["key"])
+        self.mtime = None
+        self.load()
+
+    def load(self) -> None:
+        """Lee el archivo y recalcula el texto vinculado, los segmentos y los conteos."""
+        with span("template_load", contract_type=self.contract_type) as record:
+            self._load()
+            record["chars"] = len(self.text)
+            record["segments"] = len(self.segments)
+
+    def _load(self) -> None:
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, "rb") as f:
+            self.text = normalize_template(f.read())
+        # Plantilla con los huecos vinculados ya convertidos en marcadores {{clave}}
+        self.keyed = bind_template(self.text, self.bindings)
+        self.hash = hashlib.sha256(self.keyed.encode("utf-8")).hexdigest()
+        self.segments = split_clauses(self.keyed)
+        # Versión para el modo "passthrough": fragmentos genéricos como [[CLÁUSULA id]]
+        self.collapsed = collapse_segments(self.segments, needs_model)
+
+        self.clause_tokens = {s["id"]: estimate_tokens(s["text"]) for s in self.segments}
+        # Campos que se insertan localmente en cada fragmento
+        self.markers = {s["id"]: set(MARKER_RE.findall(s["text"])) for s in self.segments}
+        self.tokens = estimate_tokens(self.keyed)
+        self.collapsed_tokens = estimate_tokens(self.collapsed)
+        self.mtime = mtime
+
+    def is_stale(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime
+        except FileNotFoundError:
+            # Si el archivo desaparece se conserva la última versión cargada
+            return False
+
+
+class TemplateRegistry:
+    """Plantillas por tipo de contrato, seguras para usarse desde varias sesiones."""
+
+    def __init__(self):
+        self._templates: dict[str, ContractTemplate] = {}
+        self._lock = threading.Lock()
+
+    def register(self, contract_type: str, filename: str, name: str, short_name: str = "", description: str = "", fields: list[dict] | None = None, bindings: list[tuple[str, str]] | None = None) -> ContractTemplate:
+        """Registra y carga una plantilla; los campos y vinculaciones se toman de sus módulos si no se pasan."""
+        template = ContractTemplate(
+            contract_type,
+            name,
+            short_name or name,
+            description,
+            filename,
+            fields if fields is not None else FIELDS_BY_TYPE.get(contract_type, []),
+            bindings if bindings is not None else TEMPLATE_BINDINGS.get(contract_type, []),
+        )
+        with self._lock:
+            self._templates[contract_type] = template
+        return template
+
+    def get(self, contract_type: str) -> ContractTemplate:
+        """
+        Devuelve la plantilla, recargándola si su archivo cambió desde la última lectura.
+
+        Raises:
+            ValueError: si el tipo de contrato no está registrado
+        """
+        template = self._templates.get(contract_type)
+        if template is None:
+            raise ValueError(f"Tipo de contrato no soportado: {contract_type}")
+        if template.is_stale():
+            with self._lock:
+                if template.is_stale():
+                    template.load()
+        return template
+
+    def types(self) -> list[str]:
+        """Tipos registrados, en orden de registro."""
+        return list(self._templates)
+
+    def __iter__(self):
+        return iter([self.get(contract_type) for contract_type in self.types()])
+
+    def __contains__(self, contract_type: str) -> bool:
+        return contract_type in self._templates
+
+
+TEMPLATES = TemplateRegistry()
+
+TEMPLATES.register(
+    "servicios",
+    "servicios_raw.txt",
+    name="Prestación de Servicios Independientes",
+    short_name="Servicios Independientes",
+    description=(
+        "Para contratar freelancers, consultores o prestadores de servicios "
+        "independientes. Incluye cláusulas de confidencialidad, no competencia, "
+        "propiedad intelectual y cumplimiento legal."
+    ),
+)
+TEMPLATES.register(
+    "arrendamiento",
+    "arrendamiento_raw.txt",
+    name="Arrendamiento",
+    description=(
+        "Para arrendar inmuebles, locales o terrenos. Incluye cláusulas de "
+        "vigencia, uso permitido, obligaciones de las partes, depósito en "
+        "garantía y condiciones de terminación."
+    ),
+)
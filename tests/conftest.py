@@ -0,0 +1,35 @@
+"""
+Configuración común de las pruebas.
+
+Los cachés y la telemetría van a un directorio temporal (antes de importar los
+módulos, que leen las rutas al cargarse) y ninguna prueba usa la red: las
+llamadas al modelo se sustituyen con monkeypatch.
+
+Uso:
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="legal_agent_tests_")
+os.environ["GENERATION_CACHE_PATH"] = os.path.join(_TMP, "generations.sqlite3")
+os.environ["CLAUSE_CACHE_PATH"] = os.path.join(_TMP, "clauses.sqlite3")
+os.environ["TELEMETRY_PATH"] = os.path.join(_TMP, "telemetry.jsonl")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import pytest  # noqa: E402
+
+from common import sample_form_data  # noqa: E402
+
+
+@pytest.fixture
+def form_data():
+    """Datos de ejemplo de un tipo de contrato (los mismos que usan los benchmarks)."""
+    return sample_form_data
@@ -0,0 +1,51 @@
+import asyncio
+import json
+import threading
+
+import agent
+from clients import close_clients, get_async_client
+from clauses import split_clauses
+from template_binding import fill_markers
+from template_registry import TEMPLATES
+
+
+async def _client():
+    return get_async_client("sk-test")
+
+
+def test_close_clients_closes_async_clients_on_a_running_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        client = asyncio.run_coroutine_threadsafe(_client(), loop).result(5)
+        close_clients()
+        assert client.is_closed()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+def test_close_clients_closes_async_clients_on_an_idle_loop():
+    loop = asyncio.new_event_loop()
+    try:
+        client = loop.run_until_complete(_client())
+        close_clients()
+        assert client.is_closed()
+    finally:
+        loop.close()
+
+
+def test_areview_contract_applies_edits(form_data, monkeypatch):
+    contract = fill_markers(TEMPLATES.get("servicios").keyed, form_data("servicios"))
+    edits = [{"op": "delete", "clause": "tercera"}]
+
+    async def reply(client, messages, route_name, *args, **kwargs):
+        yield "Listo, eliminé la cláusula.\n"
+        yield f"{agent.EDITS_SEPARATOR}\n{json.dumps(edits)}"
+
+    monkeypatch.setattr(agent, "_astream_completion", reply)
+    result = asyncio.run(agent.areview_contract(contract, "Quita la tercera cláusula"))
+    assert result["answer"] == "Listo, eliminé la cláusula."
+    assert "tercera" not in [s["id"] for s in split_clauses(result["contract"])]
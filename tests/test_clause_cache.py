@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+import agent
+import clause_cache
+from clauses import needs_model
+from template_registry import TEMPLATES
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    """Sustituye al modelo: devuelve el fragmento recibido y registra la ruta de cada llamada."""
+    calls = []
+
+    def reply(messages: list[dict], route_name: str) -> str:
+        calls.append(route_name)
+        content = messages[-1]["content"]
+        return content.split("):\n", 1)[1].split("\n\n", 1)[0] if "FRAGMENTO (" in content else "Respuesta."
+
+    async def areply(client, messages, route_name, *args, **kwargs):
+        return reply(messages, route_name)
+
+    monkeypatch.setattr(agent, "_complete", lambda client, messages, route_name, *args, **kwargs: reply(messages, route_name))
+    monkeypatch.setattr(agent, "_acomplete", areply)
+    return calls
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Cuenta las búsquedas en el caché de cláusulas compartidas."""
+    calls = []
+    original = clause_cache.lookup
+
+    def spy(scope, data):
+        calls.append(scope)
+        return original(scope, data)
+
+    monkeypatch.setattr(clause_cache, "lookup", spy)
+    clause_cache.clear()
+    return calls
+
+
+def _shared_segments(contract_type: str) -> list[dict]:
+    return [s for s in TEMPLATES.get(contract_type).segments if agent._depends_on_business_only(contract_type, s)]
+
+
+def test_reuse_false_never_looks_up_sync(form_data, model_calls, lookups):
+    agent.generate_contract("servicios", form_data("servicios"), use_cache=False)
+    assert lookups == []
+    # El resultado nuevo sí se guarda
+    assert clause_cache.stats()["entries"] == len(_shared_segments("servicios"))
+
+
+def test_reuse_false_never_looks_up_async(form_data, model_calls, lookups):
+    asyncio.run(agent.agenerate_contract("servicios", form_data("servicios"), use_cache=False))
+    assert lookups == []
+    assert clause_cache.stats()["entries"] == len(_shared_segments("servicios"))
+
+
+def test_hit_skips_model_for_shared_clauses(form_data, model_calls, lookups):
+    data = form_data("servicios")
+    # Sin el caché de contratos, que otra prueba pudo llenar con los mismos datos
+    agent.generate_contract("servicios", data, use_cache=False)
+    model_calls.clear()
+
+    # Otro cliente, mismo giro con otras palabras de relleno: solo las cláusulas con datos personales van al modelo
+    other = {**data, "prestador_nombre": "Ana Ruiz", "cliente_giro": data["cliente_giro"].upper() + "."}
+    agent.generate_contract("servicios", other)
+    adapted = sum(1 for s in TEMPLATES.get("servicios").segments if needs_model(s))
+    assert model_calls.count("adapt_clause") == adapted - len(_shared_segments("servicios"))
+    assert clause_cache.stats()["hits"] == len(_shared_segments("servicios"))
+
+
+def test_similarity_normalizes_but_keeps_negations():
+    base = clause_cache.profile({"actividades": "Restaurantes de comida mexicana"})
+    assert clause_cache.similarity(base, clause_cache.profile({"actividades": "comida mexicana, restaurante"})) == pytest.approx(1.0)
+    negated = clause_cache.profile({"actividades": "Restaurantes sin comida mexicana"})
+    assert clause_cache.similarity(base, negated) < clause_cache.SIMILARITY_THRESHOLD
+    # Perfiles con campos distintos no se comparan
+    assert clause_cache.similarity(base, clause_cache.profile({"giro": "Restaurantes de comida mexicana"})) == 0.0
+
+
+ACTIVIDADES = "restaurantes, bares, cafeterías, panaderías, pastelerías, banquetes, catering, cocinas económicas, comida rápida, heladerías"
+
+
+def _objeto(actividades: str) -> str:
+    return f"OBJETO. El cliente se dedica a {actividades}, en los términos de este contrato."
+
+
+@pytest.mark.parametrize("stored, current", [
+    (ACTIVIDADES, ACTIVIDADES.replace("bares, ", "")),
+    (ACTIVIDADES.replace("bares, ", ""), ACTIVIDADES),
+])
+def test_fuzzy_match_with_one_activity_more_or_less_is_not_reused(stored, current):
+    clause_cache.clear()
+    scope = clause_cache.make_scope("servicios", "objeto", "OBJETO.", "modelo", "v1")
+    clause_cache.store(scope, {"cliente_actividades": stored}, _objeto(stored))
+    # Lo bastante parecidos para el umbral, pero la cláusula nombraría otro alcance
+    assert clause_cache.similarity(
+        clause_cache.profile({"cliente_actividades": stored}), clause_cache.profile({"cliente_actividades": current})
+    ) >= clause_cache.SIMILARITY_THRESHOLD
+    assert clause_cache.lookup(scope, {"cliente_actividades": current}) is None
+
+
+def test_fuzzy_match_with_the_same_activities_is_reused():
+    clause_cache.clear()
+    scope = clause_cache.make_scope("servicios", "objeto", "OBJETO.", "modelo", "v1")
+    clause_cache.store(scope, {"cliente_actividades": ACTIVIDADES}, _objeto(ACTIVIDADES))
+    # Otra firma (una actividad repetida), mismas actividades
+    repeated = ACTIVIDADES + ", y bares"
+    assert clause_cache.lookup(scope, {"cliente_actividades": repeated}) == _objeto(ACTIVIDADES)
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+from template_registry import TEMPLATES
+
+
+class TruncatingClient:
+    """Cliente simulado que corta cada respuesta en `limit` caracteres y retoma donde quedó el asistente."""
+
+    def __init__(self, full: str, limit: int):
+        self.full = full
+        self.limit = limit
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, *, messages: list[dict], **kwargs):
+        self.calls += 1
+        written = messages[-2]["content"] if messages[-1]["content"] == agent.CONTINUE_PROMPT else ""
+        assert self.full.startswith(written)
+        rest = self.full[len(written):]
+        reply, finish_reason = (rest[:self.limit], "length") if len(rest) > self.limit else (rest, "stop")
+        usage = SimpleNamespace(prompt_tokens=1, completion_tokens=1, prompt_tokens_details=None)
+        choice = SimpleNamespace(message=SimpleNamespace(content=reply), finish_reason=finish_reason)
+        return SimpleNamespace(choices=[choice], usage=usage)
+
+
+def _clause(contract_type: str, clause_id: str) -> str:
+    return next(s["text"] for s in TEMPLATES.get(contract_type).segments if s["id"] == clause_id)
+
+
+def test_rewind_advances_within_a_clause_longer_than_one_response():
+    # La segunda cláusula no cabe en una respuesta: volver a su inicio no avanzaría
+    long_clause = "SEGUNDA. VIGENCIA. " + "".join(f"Línea {i} de la cláusula con texto de relleno.\n" for i in range(150))
+    full = "PRIMERA. OBJETO. Texto corto.\n\n" + long_clause + "\nTERCERA. FIN. Texto.\n"
+    client = TruncatingClient(full, len(long_clause) // 2)
+    messages = [{"role": "user", "content": "Redacta el contrato."}]
+    assert agent._complete(client, messages, "generate_full") == full
+    assert client.calls <= 1 + agent.MAX_CONTINUATIONS
+
+
+def test_rewind_keeps_only_complete_clauses():
+    full = _clause("servicios", "primera") + _clause("servicios", "segunda")
+    client = TruncatingClient(full, len(full) - 40)
+    continuation = agent._Continuation([], rewind=True)
+    continuation.feed(full[:client.limit])
+    continuation.finish("length")
+    assert continuation.text == _clause("servicios", "primera")
+
+
+def test_gives_up_after_max_continuations(monkeypatch):
+    monkeypatch.setattr(agent, "MAX_CONTINUATIONS", 1)
+    full = _clause("arrendamiento", "declaracion_i")
+    client = TruncatingClient(full, len(full) // 4)
+    with pytest.raises(ValueError):
+        agent._complete(client, [{"role": "user", "content": "Adapta la declaración."}], "adapt_clause")
+
+
+def test_strip_overlap_drops_a_restarted_short_line():
+    # La respuesta se cortó a media línea y el modelo la vuelve a empezar
+    assert agent._strip_overlap("PRIMERA. Texto.\nSEG", "SEGUNDA. Otro.") == "UNDA. Otro."
+    assert agent._strip_overlap("Firma:\n   ", "    NOMBRE") == " NOMBRE"
+    # Una continuación que sigue desde el último carácter no se toca
+    assert agent._strip_overlap("PRIMERA. Texto.\nSEG", "UNDA. Otro.") == "UNDA. Otro."
@@ -0,0 +1,12 @@
+import export
+
+
+def test_cached_export_reuses_the_document():
+    text = "CONTRATO DE PRUEBA\n\nPRIMERA. OBJETO. Texto.\n"
+    before = export.export_cache_stats()
+    assert not export.is_export_cached("docx", text)
+    first = export.cached_export("docx", text)
+    assert export.is_export_cached("docx", text)
+    assert export.cached_export("docx", text) is first
+    after = export.export_cache_stats()
+    assert (after["misses"] - before["misses"], after["hits"] - before["hits"]) == (1, 1)
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+import agent
+import generation_cache
+from validation import UNFILLED_SLOT_RE, validate_contract
+
+
+def _fragment(messages: list[dict]) -> str:
+    """El fragmento que se pidió adaptar, tal cual (un modelo que no cambia nada)."""
+    return messages[-1]["content"].split("):\n", 1)[1].split("\n\n" + agent.MARKERS_NOTE, 1)[0]
+
+
+@pytest.fixture
+def broken_model(monkeypatch):
+    """Modelo que deja un hueco sin rellenar en la primera cláusula adaptada, salvo al corregir."""
+    calls = []
+
+    def reply(messages: list[dict], route_name: str) -> str:
+        calls.append(route_name)
+        fragment = _fragment(messages) if route_name == "adapt_clause" else "PRIMERA. Corregida."
+        if route_name == "adapt_clause" and calls.count("adapt_clause") == 1:
+            return fragment.rstrip() + " [POR DEFINIR]"
+        return fragment
+
+    async def areply(client, messages, route_name, *args, **kwargs):
+        return reply(messages, route_name)
+
+    monkeypatch.setattr(agent, "_complete", lambda client, messages, route_name, *args, **kwargs: reply(messages, route_name))
+    monkeypatch.setattr(agent, "_acomplete", areply)
+    return calls
+
+
+def _stream(data: dict) -> str:
+    return "".join(agent.generate_contract_stream("servicios", data, use_cache=False))
+
+
+def _astream(data: dict) -> str:
+    async def collect():
+        return "".join([delta async for delta in agent.agenerate_contract_stream("servicios", data, use_cache=False)])
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("stream", [_stream, _astream])
+def test_stream_with_defects_is_not_served_by_generate_contract(stream, form_data, broken_model):
+    data = {**form_data("servicios"), "cliente_giro": stream.__name__}
+    key = agent.generation_key("servicios", data)
+    contract = stream(data)
+    assert validate_contract(contract, "servicios", data)
+
+    assert generation_cache.get(key) is None
+    # El stream sí lo reutiliza: quien lo consume lo valida
+    assert "".join(agent.generate_contract_stream("servicios", data)) == contract
+    # generate_contract no devuelve el borrador sin corregir
+    assert agent.generate_contract("servicios", data) != contract
+
+
+def test_clean_stream_is_cached_for_generate_contract(form_data, monkeypatch):
+    monkeypatch.setattr(agent, "_complete", lambda client, messages, *args, **kwargs: UNFILLED_SLOT_RE.sub("lo acordado", _fragment(messages)))
+    data = {**form_data("servicios"), "cliente_giro": "limpio"}
+    contract = _stream(data)
+    assert not validate_contract(contract, "servicios", data)
+    assert generation_cache.get(agent.generation_key("servicios", data)) == contract
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from clients import account_key
+from jobs import CANCELLED, DONE, JobQueue
+
+
+def _wait(job, timeout: float = 5.0):
+    limit = time.time() + timeout
+    while job.in_flight and time.time() < limit:
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def gate():
+    """Detiene los trabajos hasta que la prueba los suelta."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def test_same_key_shares_one_job(gate):
+    queue = JobQueue(workers=2)
+    produced = []
+
+    def produce():
+        produced.append(1)
+        gate.wait(5)
+        yield "texto"
+
+    first = queue.submit("k", produce)
+    second = queue.submit("k", produce)
+    other = queue.submit("otra", produce)
+    assert second is first and first.subscribers == 2
+    assert other is not first
+
+    gate.set()
+    assert _wait(first).status == DONE and first.text == "texto"
+    assert len(produced) == 2
+    # Terminado, la misma key vuelve a producir
+    assert queue.submit("k", produce) is not first
+
+
+def test_release_cancels_only_when_nobody_waits():
+    queue = JobQueue(workers=1)
+
+    async def produce():
+        yield "a"
+        await asyncio.sleep(5)
+        yield "b"
+
+    job = queue.submit("k", produce)
+    queue.submit("k", produce)
+    queue.release(job.id)
+    time.sleep(0.05)
+    assert job.in_flight and job.subscribers == 1
+
+    queue.release(job.id)
+    assert _wait(job).status == CANCELLED
+    assert job.text == "a"
+
+
+def test_release_cancels_a_queued_sync_job(gate):
+    queue = JobQueue(workers=1)
+
+    def blocker():
+        gate.wait(5)
+        yield "listo"
+
+    running = queue.submit("ocupa", blocker)
+    queued = queue.submit("espera", blocker)
+    queue.release(queued.id)
+    assert queued.status == CANCELLED
+    gate.set()
+    assert _wait(running).status == DONE
+
+
+def test_account_key_separates_api_keys():
+    assert account_key("sk-a") != account_key("sk-b")
+    assert account_key("sk-a") == account_key("sk-a")
+    assert "sk-a" not in account_key("sk-a")
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from scheduler import BACKGROUND, GENERATE, INTERACTIVE, RateLimitScheduler, priority
+
+
+def _exhausted(rpm: int) -> RateLimitScheduler:
+    scheduler = RateLimitScheduler(rpm=rpm, tpm=0, headroom=1.0)
+    scheduler._requests.level = 0
+    return scheduler
+
+
+def test_interactive_goes_before_earlier_background():
+    scheduler = _exhausted(rpm=60)
+    background = scheduler._enqueue(BACKGROUND)
+    interactive = scheduler._enqueue(INTERACTIVE)
+    assert scheduler._try_admit(background, 10) > 0
+    assert scheduler._try_admit(interactive, 10) > 0
+
+    # Con cupo para una sola petición, entra la interactiva aunque llegó después
+    scheduler._requests.level = 1
+    assert scheduler._try_admit(background, 10) > 0
+    assert scheduler._try_admit(interactive, 10) == 0
+    assert scheduler.stats()["waiting"] == {INTERACTIVE: 0, GENERATE: 0, BACKGROUND: 1}
+
+
+def test_same_priority_keeps_arrival_order():
+    scheduler = _exhausted(rpm=60)
+    first = scheduler._enqueue(GENERATE)
+    second = scheduler._enqueue(GENERATE)
+    scheduler._requests.level = 1
+    assert scheduler._try_admit(second, 10) > 0
+    assert scheduler._try_admit(first, 10) == 0
+
+
+def test_priority_floor_demotes_interactive_requests():
+    scheduler = _exhausted(rpm=60)
+    generate = scheduler._enqueue(GENERATE)
+    with priority(BACKGROUND):
+        demoted = scheduler._enqueue(INTERACTIVE)
+    scheduler._requests.level = 1
+    assert scheduler._try_admit(demoted, 10) > 0
+    assert scheduler._try_admit(generate, 10) == 0
+    with pytest.raises(ValueError):
+        with priority("urgente"):
+            pass
+
+
+def test_async_admission_order_follows_priority():
+    # 600 RPM: una petición cada 0.1 s una vez agotado el cupo
+    scheduler = _exhausted(rpm=600)
+    admitted = []
+
+    async def request(name: str, label: str):
+        await scheduler.aacquire(10, name)
+        admitted.append(label)
+
+    async def main():
+        await asyncio.gather(
+            request(BACKGROUND, "fondo-1"),
+            request(BACKGROUND, "fondo-2"),
+            request(GENERATE, "generar"),
+            request(INTERACTIVE, "chat"),
+        )
+
+    asyncio.run(main())
+    assert admitted == ["chat", "generar", "fondo-1", "fondo-2"]
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+from telemetry import RECENT
+
+
+class SlowStream:
+    """Respuesta en streaming que entrega un fragmento cada 10 ms hasta que la cierran."""
+
+    def __init__(self, started: threading.Event, chunks: int = 500):
+        self.started = started
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        for _ in range(self.chunks):
+            if self.closed.is_set():
+                return
+            self.sent += 1
+            self.started.set()
+            delta = SimpleNamespace(content="texto ")
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(finish_reason=None, delta=delta)])
+            time.sleep(0.01)
+
+    def close(self):
+        self.closed.set()
+
+
+class SlowClient:
+    def __init__(self):
+        self.started = threading.Event()
+        self.streams: list[SlowStream] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, *, stream: bool = False, **kwargs):
+        assert stream, "las peticiones cancelables van en streaming"
+        self.streams.append(SlowStream(self.started))
+        return self.streams[-1]
+
+
+def test_cancel_closes_speculative_requests_in_flight(form_data, monkeypatch):
+    client = SlowClient()
+    monkeypatch.setattr(agent, "_get_client", lambda api_key=None: client)
+    speculation = agent.ClauseSpeculation("servicios", {**form_data("servicios"), "cliente_giro": "especulado"}, api_key="sk-test")
+    assert speculation.futures
+    assert client.started.wait(5)
+
+    speculation.cancel()
+    for future in speculation.futures.values():
+        if not future.cancelled():
+            with pytest.raises(CancelledError):
+                future.result(5)
+    assert client.streams and all(stream.closed.is_set() for stream in client.streams)
+    assert all(stream.sent < stream.chunks for stream in client.streams)
+    cancelled = [r for r in RECENT if r["span"] == "llm_call" and r.get("status") == "cancelled"]
+    assert len(cancelled) >= len(client.streams)
+
+
+def test_requests_outside_a_speculation_are_not_cancellable(monkeypatch):
+    # Sin señal de cancelación en el contexto, _complete sigue sin streaming
+    calls = []
+    monkeypatch.setattr(agent, "_complete_request", lambda *args: calls.append(args) or ("Hola.", "stop"))
+    assert agent._complete(object(), [{"role": "user", "content": "Hola"}], "review_qa") == "Hola."
+    assert len(calls) == 1
@@ -0,0 +1,52 @@
+import pytest
+
+import agent
+from clauses import clause_number, join_clauses, split_clauses
+from template_binding import fill_markers
+from template_registry import TEMPLATES
+from validation import _inherited_breaks, fix_numbering, validate_contract
+
+
+def _contract(contract_type: str, data: dict) -> str:
+    return fill_markers(TEMPLATES.get(contract_type).keyed, data)
+
+
+def _numbers(text: str) -> list[int]:
+    return [n for s in split_clauses(text) if s["parent"] == "clausulas" and (n := clause_number(s["heading"])) is not None]
+
+
+@pytest.mark.parametrize("contract_type", TEMPLATES.types())
+def test_template_quirks_are_not_issues_and_not_fixed(contract_type, form_data):
+    text = _contract(contract_type, form_data(contract_type))
+    assert [i for i in validate_contract(text, contract_type, form_data(contract_type)) if i["kind"] == "numbering"] == []
+    assert fix_numbering(text, contract_type) == text
+
+
+def test_fix_numbering_keeps_inherited_duplicate_after_a_deletion(form_data):
+    assert _inherited_breaks("servicios"), "la plantilla de servicios repite un número de cláusula"
+    data = form_data("servicios")
+    original = _numbers(_contract("servicios", data))
+    text = join_clauses([s for s in split_clauses(_contract("servicios", data)) if s["id"] != "tercera"])
+
+    assert [i["kind"] for i in validate_contract(text, "servicios", data)].count("numbering") == 1
+    fixed = fix_numbering(text, "servicios")
+    assert [i for i in validate_contract(fixed, "servicios", data) if i["kind"] == "numbering"] == []
+    # Todo se recorre uno, incluida la cláusula que la plantilla ya repetía
+    assert _numbers(fixed) == [n if n < 3 else n - 1 for n in original if n != 3]
+
+
+def test_repair_without_numbering_issue_keeps_headings(form_data, monkeypatch):
+    data = form_data("servicios")
+    text = _contract("servicios", data)
+    monkeypatch.setattr(agent, "_complete", lambda client, messages, route_name, *args, **kwargs: "PRIMERA. Corregida.")
+    issue = {"kind": "placeholder", "clause": "primera", "detail": "Quedan huecos"}
+    repaired = agent.repair_contract(text, "servicios", data, issues=[issue])
+    assert _numbers(repaired) == _numbers(text)
+    assert [s["id"] for s in split_clauses(repaired)] == [s["id"] for s in split_clauses(text)]
+
+
+def test_missing_verbatim_value_points_to_its_clause(form_data):
+    data = form_data("servicios")
+    text = _contract("servicios", data).replace(data["cliente_rfc"], "")
+    issues = validate_contract(text, "servicios", data)
+    assert {(i["kind"], i.get("field")) for i in issues} >= {("missing_value", "cliente_rfc")}
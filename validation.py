@@ -0,0 +1,185 @@
+"""
+Validación local de un contrato generado, sin llamadas al modelo.
+
+Revisa en milisegundos lo que el modelo o una edición del chat pueden romper:
+
+- "missing_value": un dato del formulario que debe aparecer tal cual no está
+  en su cláusula. Son los campos que la plantilla inserta con marcadores
+  {{clave}} y los marcados "verbatim" en contract_fields, como RFC, CLABE o
+  folios.
+- "placeholder": quedan huecos de la plantilla sin rellenar ([*], [_], ____).
+  Las líneas de firma no cuentan.
+- "numbering": la numeración de las cláusulas no es consecutiva. Las
+  irregularidades que ya trae la plantilla no cuentan.
+
+Cada problema indica la cláusula (id de clauses.split_clauses) donde
+corregirlo, para que la reparación se limite a esas cláusulas. Los
+"[POR DEFINIR]" no son errores: el modelo los escribe cuando el dato no está en
+el formulario. Se reportan aparte con undefined_values().
+"""
+
+import re
+
+from clauses import CLAUSE_HEADING_RE, clause_number, join_clauses, ordinal, split_clauses
+from telemetry import span
+from template_binding import MISSING_VALUE
+from template_registry import TEMPLATES
+
+# Huecos sin rellenar; "[POR DEFINIR]" es un valor legítimo y no cuenta
+UNFILLED_SLOT_RE = re.compile(r"\[\*\]|\[_+\]|_{3,}")
+# Línea de firma: solo guiones bajos (y espacios)
+SIGNATURE_LINE_RE = re.compile(r"^[\s_]+$", re.MULTILINE)
+
+# Problemas que se corrigen pidiéndole al modelo que reescriba la cláusula
+MODEL_REPAIRS = ("missing_value", "placeholder")
+
+
+def _collapse(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _verbatim_fields(contract_type: str) -> dict[str, tuple[list[str], bool]]:
+    """
+    Campo -> (cláusulas donde su valor debe aparecer tal cual, si debe estar en cada una).
+
+    Los valores que inserta la plantilla deben estar en cada cláusula con su
+    marcador; los "verbatim" los redacta el modelo y basta con que aparezcan
+    en el contrato (se reparan en la primera cláusula de su "clauses").
+    """
+    template = TEMPLATES.get(contract_type)
+    targets = {}
+    for segment in template.segments:
+        for key in sorted(template.markers[segment["id"]]):
+            targets.setdefault(key, ([], True))[0].append(segment["id"])
+    for field in template.fields:
+        if field.get("verbatim") and field["key"] not in targets:
+            targets[field["key"]] = (list(field.get("clauses", [])), False)
+    return targets
+
+
+def _numbered(segments: list[dict]) -> list[tuple[int, dict, int]]:
+    """(posición, segmento, número) de las cláusulas numeradas, en orden."""
+    numbered = []
+    for i, segment in enumerate(segments):
+        number = clause_number(segment["heading"]) if segment["parent"] == "clausulas" else None
+        if number is not None:
+            numbered.append((i, segment, number))
+    return numbered
+
+
+def _inherited_breaks(contract_type: str) -> set[tuple[int, str]]:
+    """
+    Saltos que ya trae la plantilla, p. ej. una cláusula repetida: (salto, título
+    de la cláusula). Se identifican por el título y no por el número para seguir
+    valiendo si el chat agrega o elimina cláusulas antes.
+    """
+    breaks = set()
+    prev = 0
+    for _, segment, number in _numbered(TEMPLATES.get(contract_type).segments):
+        if number != prev + 1:
+            breaks.add((number - prev, segment["title"]))
+        prev = number
+    return breaks
+
+
+def _numbering_issues(segments: list[dict], contract_type: str) -> list[dict]:
+    inherited = _inherited_breaks(contract_type)
+    issues = []
+    prev = 0
+    for _, segment, number in _numbered(segments):
+        if number != prev + 1 and (number - prev, segment["title"]) not in inherited:
+            issues.append({
+                "kind": "numbering",
+                "clause": segment["id"],
+                "detail": f"La cláusula {ordinal(number)} sigue a la {ordinal(prev)}" if prev else f"La numeración empieza en {ordinal(number)}",
+            })
+        prev = number
+    return issues
+
+
+def validate_contract(contract_text: str, contract_type: str, user_data: dict, clause_ids: set[str] | None = None) -> list[dict]:
+    """
+    Revisa el contrato contra los datos del formulario y la plantilla.
+
+    Args:
+        clause_ids: si se indica, solo se revisan esas cláusulas (p. ej. las que
+            tocó una edición del chat)
+
+    Returns:
+        Lista de problemas {"kind", "clause", "detail"} (más "field" en los de
+        datos faltantes); vacía si el contrato está bien
+    """
+    template = TEMPLATES.get(contract_type)
+    with span("validate", contract_type=contract_type) as record:
+        segments = split_clauses(contract_text)
+        by_id = {segment["id"]: segment for segment in segments}
+        labels = {field["key"]: field["label"] for field in template.fields if "key" in field}
+        checked = clause_ids if clause_ids is not None else set(by_id)
+        issues = []
+
+        for key, (targets, each_clause) in _verbatim_fields(contract_type).items():
+            value = _collapse(str(user_data.get(key) or ""))
+            present = [clause_id for clause_id in targets if clause_id in by_id]
+            if not value or not present:
+                continue
+            if each_clause:
+                missing = [clause_id for clause_id in present if value not in _collapse(by_id[clause_id]["text"])]
+            else:
+                missing = present[:1] if value not in _collapse(contract_text) else []
+            issues += [
+                {
+                    "kind": "missing_value",
+                    "clause": clause_id,
+                    "field": key,
+                    "detail": f"No aparece tal cual el dato \"{labels.get(key, key)}\"",
+                }
+                for clause_id in missing
+                if clause_id in checked
+            ]
+
+        for segment in segments:
+            if segment["id"] not in checked:
+                continue
+            body = SIGNATURE_LINE_RE.sub("", segment["text"])
+            slots = UNFILLED_SLOT_RE.findall(body)
+            if slots:
+                issues.append({
+                    "kind": "placeholder",
+                    "clause": segment["id"],
+                    "detail": f"Quedan {len(slots)} huecos sin rellenar ({', '.join(sorted(set(slots)))})",
+                })
+
+        issues += [i for i in _numbering_issues(segments, contract_type) if i["clause"] in checked]
+        record["issues"] = len(issues)
+        return issues
+
+
+def undefined_values(contract_text: str) -> int:
+    """Cuántos datos quedaron como [POR DEFINIR] (faltan en el formulario)."""
+    return contract_text.count(MISSING_VALUE)
+
+
+def fix_numbering(contract_text: str, contract_type: str) -> str:
+    """
+    Vuelve consecutiva la numeración de las cláusulas, sin llamar al modelo.
+
+    Conserva los saltos que ya trae la plantilla (los mismos que
+    validate_contract no reporta). Solo cambia el ordinal de los encabezados
+    que lo requieren; el resto del texto, incluidas las referencias cruzadas
+    entre cláusulas, queda igual.
+    """
+    inherited = _inherited_breaks(contract_type)
+    segments = split_clauses(contract_text)
+    changed = False
+    prev = expected = 0
+    for i, segment, number in _numbered(segments):
+        step = number - prev if (number - prev, segment["title"]) in inherited else 1
+        expected += step
+        prev = number
+        if number != expected and 0 < expected < 40:
+            match = CLAUSE_HEADING_RE.match(segment["heading"])
+            text = segment["text"]
+            start = text.find(match.group(1))
+            segments[i] = {**segment, "text": text[:start] + ordinal(expected) + text[start + len(match.group(1)):]}
+            changed = True
+    return join_clauses(segments) if changed else contract_text
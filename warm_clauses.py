@@ -0,0 +1,76 @@
+"""
+Precalentamiento del caché de cláusulas compartido entre clientes (clause_cache).
+
+Lee un archivo JSONL con un perfil de negocio por línea (los campos "adaptive"
+de contract_fields: giro, actividades, objeto, uso del inmueble...) y adapta con
+el modelo los fragmentos que solo dependen de ellos. Después, los clientes con
+un perfil igual o muy parecido reciben esas cláusulas sin esperar al modelo.
+Los perfiles que ya están en el caché no se vuelven a pedir, y las peticiones
+tienen la prioridad más baja ante la cuota de OpenAI.
+
+Formato de cada línea:
+    {"contract_type": "servicios",
+     "form_data": {"cliente_giro": "Restaurantes", "cliente_actividades": "...", ...}}
+
+Uso:
+    python warm_clauses.py [industrias_comunes.jsonl] [--clear]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import clause_cache
+from agent import warm_clause_cache
+from template_registry import TEMPLATES
+
+DEFAULT_PROFILES = os.path.join(os.path.dirname(__file__), "industrias_comunes.jsonl")
+
+
+def load_profiles(path: str) -> dict[str, list[dict]]:
+    """
+    Perfiles por tipo de contrato, con solo los campos del negocio.
+
+    Raises:
+        ValueError: si una línea no es JSON válido o su tipo de contrato no existe
+    """
+    profiles = {}
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Línea {line_number}: JSON inválido: {e}") from e
+            contract_type = record.get("contract_type")
+            if contract_type not in TEMPLATES.types():
+                raise ValueError(f"Línea {line_number}: tipo de contrato no soportado: {contract_type}")
+            form_data = record.get("form_data") or {}
+            keys = TEMPLATES.get(contract_type).adaptive_keys
+            profiles.setdefault(contract_type, []).append({key: form_data[key] for key in keys if form_data.get(key)})
+    return profiles
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Precalienta el caché de cláusulas con perfiles de negocio comunes.")
+    parser.add_argument("input", nargs="?", default=DEFAULT_PROFILES, help="Archivo JSONL de perfiles (default: industrias_comunes.jsonl)")
+    parser.add_argument("--clear", action="store_true", help="Vaciar el caché antes de precalentar")
+    args = parser.parse_args(argv)
+
+    try:
+        profiles = load_profiles(args.input)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.clear:
+        clause_cache.clear()
+    for contract_type, items in profiles.items():
+        summary = warm_clause_cache(contract_type, items)
+        print(f"{contract_type}: {len(items)} perfiles, {summary['adapted']} cláusulas adaptadas, {summary['cached']} ya en caché", flush=True)
+    print(json.dumps(clause_cache.stats(), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())